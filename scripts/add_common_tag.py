@@ -6,20 +6,25 @@
 機能:
 - 指定したタグを全てのタグファイルの先頭（または末尾）に追加
 - すでに存在するタグはスキップ
-- バックアップ作成オプション
+- アトミックな書き込み（一時ファイル→リネーム）
+- バックアップ作成オプション（ジャーナルに記録し、tag_io.py --undo で取り消し可能）
+- 進捗を一定間隔で表示、--metrics で処理量を記録、--quiet で1ファイルごとの表示を省略
 """
 
 import argparse
 import sys
 from pathlib import Path
-from typing import List
+from typing import Optional
+
+from run_metrics import RunMetrics
+from tag_io import TagJournal, atomic_write_text
 
 
 def add_tag_to_file(
     txt_path: Path,
     tag: str,
     position: str = "start",
-    backup: bool = False
+    journal: Optional[TagJournal] = None
 ) -> bool:
     """
     タグファイルに共通タグを追加
@@ -28,7 +33,7 @@ def add_tag_to_file(
         txt_path: タグファイルのパス
         tag: 追加するタグ
         position: 追加位置（"start" または "end"）
-        backup: バックアップを作成するか
+        journal: 書き換え前の内容を記録するジャーナル（None の場合は記録しない）
 
     Returns:
         追加されたかどうか
@@ -41,10 +46,9 @@ def add_tag_to_file(
     if tag in tags:
         return False
 
-    # バックアップ作成
-    if backup:
-        backup_path = txt_path.with_suffix('.txt.bak')
-        backup_path.write_text(content, encoding='utf-8')
+    # バックアップ（ジャーナルに書き換え前の内容を記録）
+    if journal is not None:
+        journal.record_content(txt_path, content)
 
     # タグを追加
     if position == "start":
@@ -54,7 +58,7 @@ def add_tag_to_file(
 
     # 保存
     new_content = ', '.join(tags)
-    txt_path.write_text(new_content, encoding='utf-8')
+    atomic_write_text(txt_path, new_content)
 
     return True
 
@@ -105,7 +109,7 @@ def main():
     parser.add_argument(
         '--backup',
         action='store_true',
-        help='バックアップファイル（.txt.bak）を作成する'
+        help='書き換え前の内容をジャーナルに記録する（tag_io.py --undo で取り消し可能）'
     )
 
     parser.add_argument(
@@ -114,6 +118,19 @@ def main():
         help='日本語タグファイル（_jp.txt）を除外する'
     )
 
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help='1ファイルごとの表示を止める（一定間隔の進捗のみ表示）'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        type=str,
+        default=None,
+        help='処理量の記録先（.prom は Prometheus の textfile 形式、それ以外は JSON Lines）'
+    )
+
     args = parser.parse_args()
 
     # パスをPathオブジェクトに変換
@@ -146,26 +163,37 @@ def main():
         print("バックアップ: 有効")
     print("-" * 50)
 
-    added_count = 0
-    skipped_count = 0
-
-    for txt_file in txt_files:
-        added = add_tag_to_file(
-            txt_file,
-            args.tag,
-            args.position,
-            args.backup
-        )
-
-        if added:
-            print(f"✓ {txt_file.name}: タグを追加しました")
-            added_count += 1
-        else:
-            print(f"- {txt_file.name}: すでに存在するためスキップ")
-            skipped_count += 1
+    journal = TagJournal(input_dir, 'add_common_tag') if args.backup else None
+    metrics = RunMetrics('add_common_tag', len(txt_files), args.quiet, Path(args.metrics) if args.metrics else None)
+
+    try:
+        for txt_file in txt_files:
+            with metrics.stage('update'):
+                added = add_tag_to_file(
+                    txt_file,
+                    args.tag,
+                    args.position,
+                    journal
+                )
+
+            if added:
+                metrics.add(bytes_written=txt_file.stat().st_size)
+                metrics.item(f"✓ {txt_file.name}: タグを追加しました")
+            else:
+                metrics.item(f"- {txt_file.name}: すでに存在するためスキップ", 'skipped')
+    finally:
+        if journal is not None:
+            journal.close()
+
+    added_count = metrics.counters["processed"]
+    skipped_count = metrics.counters["skipped"]
 
     print("-" * 50)
+    metrics.finish()
     print(f"完了: {added_count}個に追加, {skipped_count}個スキップ")
+    if journal is not None:
+        print(f"ジャーナル: {journal.path}")
+        print(f"取り消し: python scripts/tag_io.py --input {input_dir} --undo")
 
     if added_count > 0:
         print(f"\n次のステップ: git diff で変更を確認し、コミットしてください")
@@ -7,46 +7,213 @@
 - WD14 Tagger v2を使用してDanbooruタグを自動生成
 - 信頼度しきい値によるフィルタリング
 - 画像とタグファイル(.txt)を出力ディレクトリに配置
+- 入力はディレクトリのほか、zip/tarアーカイブも展開せずに直接読み込み可能
+- タグファイルはアトミックに書き込み（--backup でジャーナルに記録）
+- 進捗（処理速度・残り時間）を一定間隔で表示、--metrics で処理量を記録、--quiet で1枚ごとの表示を省略
+- 縦長・横長の画像を重なりのある正方形に切り出し、全体と合わせて推論（--tiles、タグごとに最大値で統合）
 """
 
 import argparse
-import shutil
+import json
+import math
 import sys
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import numpy as np
-import onnxruntime as ort
-import pandas as pd
-from huggingface_hub import hf_hub_download
 from PIL import Image
 
+from image_search import EMBEDDINGS_FILENAME, save_embeddings as write_embeddings
+from image_sources import (
+    ImageSource, copy_image, get_image_files, is_valid_input, open_image, read_archive_bytes, source_size
+)
+from tag_io import BackgroundWriter, TagJournal, atomic_write_text
+from run_metrics import RunMetrics
+from tag_stats import image_key
+
+if TYPE_CHECKING:
+    # tensor_cache は --cache-tensors 指定時のみ読み込む
+    from tensor_cache import TensorCache
 
 # WD14 Tagger v2のモデルID
 MODEL_ID = "SmilingWolf/wd-v1-4-moat-tagger-v2"
 MODEL_FILENAME = "model.onnx"
 TAGS_FILENAME = "selected_tags.csv"
 
+# タグの信頼度を保存するファイル名（--save-scores 指定時、出力ディレクトリに作成）
+SCORES_FILENAME = "tag_scores.jsonl"
+
+# 切り出し（--tiles）の対象にする縦横比（長辺 / 短辺）
+TILE_MIN_ASPECT = 1.5
+# 隣り合う切り出し範囲の最小の重なり（短辺に対する割合）
+TILE_OVERLAP = 0.25
+
+
+def add_embedding_output(model) -> str:
+    """
+    分類層（最後の MatMul / Gemm）への入力をモデルの出力に追加する
+
+    出力（Sigmoid）から入力側にたどり、最初に見つかった全結合層の入力を
+    プーリング済みの埋め込みベクトルとみなす。
+
+    Args:
+        model: onnx.ModelProto（直接書き換える。重みは読み込まれていなくてもよい）
+
+    Returns:
+        埋め込みベクトルの出力名
+
+    Raises:
+        ValueError: 全結合層が見つからない場合
+    """
+    import onnx
+
+    graph = model.graph
+    producers = {output: node for node in graph.node for output in node.output}
+    constants = {init.name for init in graph.initializer}
+    constants.update(output for node in graph.node if node.op_type == 'Constant' for output in node.output)
+
+    name = graph.output[0].name
+    while name in producers:
+        node = producers[name]
+        data_inputs = [i for i in node.input if i and i not in constants]
+        if node.op_type in ('MatMul', 'Gemm') and data_inputs:
+            embedding_name = data_inputs[0]
+            graph.output.append(onnx.helper.make_tensor_value_info(embedding_name, onnx.TensorProto.FLOAT, None))
+            return embedding_name
+        if len(data_inputs) != 1:
+            break
+        name = data_inputs[0]
+
+    raise ValueError("モデルの分類層（MatMul / Gemm）が見つかりません")
+
+
+def tile_boxes(width: int, height: int, max_tiles: int) -> List[Tuple[int, int, int, int]]:
+    """
+    縦長・横長の画像を、重なりのある範囲に分けて切り出す範囲を求める
+
+    正方形にパディングすると細部が小さくなりすぎる画像（全身の縦長イラストなど）が対象。
+    範囲は短辺を1辺とする正方形で、長辺に沿って均等に並べ、両端は画像の端に合わせる。
+    max_tiles 個では重なりが TILE_OVERLAP に足りない場合は、範囲を長辺の方向に伸ばす。
+
+    Args:
+        width: 画像の幅
+        height: 画像の高さ
+        max_tiles: 切り出す最大数（0 の場合は切り出さない）
+
+    Returns:
+        (左, 上, 右, 下) のリスト（縦横比が TILE_MIN_ASPECT 未満の画像は空）
+    """
+    short, long = min(width, height), max(width, height)
+    if max_tiles < 1 or short == 0 or long / short < TILE_MIN_ASPECT:
+        return []
+
+    # 正方形で重なりが TILE_OVERLAP 以上になる数
+    count = min(max_tiles, math.ceil((long - short) / (short * (1 - TILE_OVERLAP))) + 1)
+    if count == 1:
+        side = short
+        positions = [(long - short) // 2]
+    else:
+        # count 個で長辺全体を覆い、重なりが TILE_OVERLAP になる長さ（正方形より短くはしない）
+        side = max(short, math.ceil(long / (1 + (count - 1) * (1 - TILE_OVERLAP))))
+        positions = [round(i * (long - side) / (count - 1)) for i in range(count)]
+
+    if height > width:
+        return [(0, top, short, top + side) for top in positions]
+    return [(left, 0, left + side, short) for left in positions]
+
+
+def to_float_batch(rows: List[np.ndarray]) -> np.ndarray:
+    """
+    uint8 の画像をまとめて推論用の float32 バッチに変換
+
+    Args:
+        rows: (H, W, C) の uint8 配列のリスト（_pad_image() の出力、またはキャッシュの行）
+
+    Returns:
+        (画像数, H, W, C) の float32 配列（0-255の範囲のまま）
+    """
+    return np.stack(rows).astype(np.float32)
+
+
+def merge_tiles(
+    probabilities: np.ndarray,
+    embeddings: Optional[np.ndarray],
+    counts: List[int]
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    画像ごとに並んだ推論結果（全体 + 切り出し）を1画像1行にまとめる
+
+    Args:
+        probabilities: (行数, タグ数) の確率値配列
+        embeddings: (行数, 次元数) の埋め込みベクトル（None の場合はまとめない）
+        counts: 画像ごとの行数（入力の順序と同じ）
+
+    Returns:
+        (タグごとに最大値をとった (画像数, タグ数) の確率値, 全体の画像の埋め込みベクトル) のタプル
+    """
+    # 各画像の先頭の行（全体の画像）の位置
+    offsets = np.cumsum([0] + counts[:-1])
+    merged = np.maximum.reduceat(probabilities, offsets, axis=0)
+    return merged, (embeddings[offsets] if embeddings is not None else None)
+
+
+def expose_embedding_output(model_path: str) -> Tuple[bytes, str]:
+    """
+    埋め込みベクトルの出力を追加したモデルを作成（add_embedding_output を参照）
+
+    Args:
+        model_path: ONNXモデルのパス
+
+    Returns:
+        (変更後のモデル, 埋め込みベクトルの出力名) のタプル
+
+    Raises:
+        ValueError: 全結合層が見つからない場合
+    """
+    # モデルの書き換えにのみ使用するため、必要になるまで読み込まない
+    import onnx
+
+    model = onnx.load(model_path)
+    embedding_name = add_embedding_output(model)
+    return model.SerializeToString(), embedding_name
+
 
 class WD14Tagger:
     """WD14 Tagger v2を使った自動タグ付けクラス"""
 
-    def __init__(self, threshold: float = 0.35, use_coreml: bool = False):
+    def __init__(
+        self,
+        threshold: float = 0.35,
+        use_coreml: bool = False,
+        with_embeddings: bool = False,
+        low_memory: bool = False
+    ):
         """
         初期化
 
         Args:
             threshold: タグの信頼度しきい値（デフォルト: 0.35）
             use_coreml: CoreML高速化を使用するか（デフォルト: False）
+            with_embeddings: 画像の埋め込みベクトルも出力するか（デフォルト: False）
+            low_memory: 省メモリモードで読み込むか（重みをメモリマップで共有、デフォルト: False）
         """
         self.threshold = threshold
         self.image_size = 448
         self.use_coreml = use_coreml
+        self.low_memory = low_memory
+        self.embedding_output: Optional[str] = None
+        # 1回の推論でまとめる画像数（tune() で調整）
+        self.batch_size = 1
+        self.tuned = False
 
         print(f"信頼度しきい値: {self.threshold}")
-        print(f"実行モード: {'CoreML有効' if use_coreml else 'CPU専用'}")
+        print(f"実行モード: {'CoreML有効' if use_coreml else 'CPU専用'}{'（省メモリ）' if low_memory else ''}")
         print("モデルをロード中...")
 
+        # 重いライブラリはモデルを読み込むときに初めて読み込む（--help などを速くするため）
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+
         # ONNXモデルのダウンロード
         model_path = hf_hub_download(
             repo_id=MODEL_ID,
@@ -70,7 +237,21 @@ class WD14Tagger:
             # CPU専用（デフォルト）
             providers = ['CPUExecutionProvider']
 
-        self.session = ort.InferenceSession(model_path, providers=providers)
+        self._providers = providers
+        if low_memory:
+            # 重みを別ファイルに分けたモデル（重みはコピーせずメモリマップで使う）
+            from low_memory import prepare_low_memory_model
+
+            self._model = str(prepare_low_memory_model(model_path, with_embeddings))
+        elif with_embeddings:
+            # 分類層の直前（プーリング後）の出力をモデルの出力に追加
+            self._model, self.embedding_output = expose_embedding_output(model_path)
+        else:
+            self._model = model_path
+        self.session = self._create_session()
+        if low_memory and with_embeddings:
+            # 変換済みのモデルでは2番目の出力が埋め込みベクトル
+            self.embedding_output = self.session.get_outputs()[1].name
 
         # 使用中のプロバイダーを確認
         available_providers = self.session.get_providers()
@@ -86,6 +267,64 @@ class WD14Tagger:
 
         print(f"モデルロード完了（タグ数: {len(self.tags)}）\n")
 
+    def _create_session(self, options=None):
+        """
+        ONNXランタイムセッションを作成
+
+        Args:
+            options: onnxruntime.SessionOptions（None の場合はデフォルト）
+
+        Returns:
+            onnxruntime.InferenceSession
+        """
+        import onnxruntime as ort
+
+        if self.low_memory:
+            from low_memory import apply_low_memory_options
+
+            options = apply_low_memory_options(options or ort.SessionOptions())
+        return ort.InferenceSession(self._model, sess_options=options, providers=self._providers)
+
+    def tune(self, sample_images: List[ImageSource], retune: bool = False) -> Optional[Dict]:
+        """
+        実行設定（バッチサイズ・スレッド数・最適化レベル）を調整してセッションを作り直す
+
+        調整結果はマシンごとに保存され、2回目以降は保存済みの設定を使う。
+
+        Args:
+            sample_images: 調整に使う画像（先頭の数枚のみ使用）
+            retune: Trueの場合は保存済みの設定を使わず調整し直す
+
+        Returns:
+            設定の辞書（調整できなかった場合は None で、既定の設定のまま）
+        """
+        from ort_tuning import host_key, make_session_options, tuned_config
+
+        def load_samples() -> List[np.ndarray]:
+            # 読み込めない画像は飛ばし、8枚そろうまで次の画像を使う
+            arrays = []
+            for source in sample_images:
+                if len(arrays) >= 8:
+                    break
+                try:
+                    with open_image(source) as img:
+                        arrays.append(self._preprocess_image(img.convert("RGB")))
+                except Exception:
+                    continue
+            return arrays
+
+        key = host_key(self.session.get_providers(), MODEL_ID + (":low_memory" if self.low_memory else ""))
+        config = tuned_config(key, self._create_session, load_samples, retune)
+        if config is None:
+            return None
+        self.session = self._create_session(make_session_options(config))
+        self.batch_size = config["batch_size"]
+        self.tuned = True
+        print(f"実行設定: バッチ{config['batch_size']}, intra={config['intra_threads']}, "
+              f"inter={config['inter_threads']}, {'parallel' if config['parallel'] else 'sequential'}, "
+              f"opt={config['optimization']}（{config['images_per_second']}枚/秒）")
+        return config
+
     def _load_tags(self) -> List[str]:
         """
         WD14 Taggerのタグリストを取得
@@ -93,6 +332,9 @@ class WD14Tagger:
         Returns:
             タグのリスト
         """
+        import pandas as pd
+        from huggingface_hub import hf_hub_download
+
         # selected_tags.csvをダウンロード
         tags_path = hf_hub_download(
             repo_id=MODEL_ID,
@@ -115,6 +357,24 @@ class WD14Tagger:
         Returns:
             前処理済みNumPy配列
         """
+        # NumPy配列に変換（0-255の範囲をそのまま使用）
+        img_array = self._pad_image(image).astype(np.float32)
+
+        # (H, W, C) -> (1, H, W, C) 形式に変換（バッチ次元を追加）
+        img_array = np.expand_dims(img_array, axis=0)
+
+        return img_array
+
+    def _pad_image(self, image: Image.Image) -> np.ndarray:
+        """
+        画像を縮小して正方形にパディング（前処理の float32 変換前まで）
+
+        Args:
+            image: PIL画像
+
+        Returns:
+            (H, W, C) の uint8 配列（tensor_cache.py でそのまま保存できる形式）
+        """
         # リサイズとパディング
         # アスペクト比を保持して最大サイズに収める
         image.thumbnail((self.image_size, self.image_size), Image.Resampling.LANCZOS)
@@ -124,39 +384,123 @@ class WD14Tagger:
         offset = ((self.image_size - image.width) // 2, (self.image_size - image.height) // 2)
         canvas.paste(image, offset)
 
-        # NumPy配列に変換（0-255の範囲をそのまま使用）
-        img_array = np.array(canvas, dtype=np.float32)
+        return np.asarray(canvas, dtype=np.uint8)
 
-        # (H, W, C) -> (1, H, W, C) 形式に変換（バッチ次元を追加）
-        img_array = np.expand_dims(img_array, axis=0)
+    def load_rows(
+        self,
+        image_path: ImageSource,
+        cache: Optional['TensorCache'] = None,
+        max_tiles: int = 0,
+        data: Optional[bytes] = None
+    ) -> List[np.ndarray]:
+        """
+        画像を読み込んで前処理（全体と、縦長・横長の画像は切り出した範囲も）
 
-        return img_array
+        Args:
+            image_path: 画像ファイルのパス（またはアーカイブ内の画像）
+            cache: 前処理済みの画像のキャッシュ（全体の画像のみ、None の場合は使わない）
+            max_tiles: 切り出す最大数（0 の場合は全体のみ、tile_boxes() を参照）
+            data: 読み込み済みの内容（read_archive_bytes() の結果、None の場合は image_path から読む）
+
+        Returns:
+            (H, W, C) の uint8 配列のリスト（先頭が全体の画像）
+        """
+        if cache is not None and max_tiles < 1:
+            return [cache.get(image_path, data)]
+
+        with open_image(image_path, data) as img:
+            boxes = tile_boxes(img.width, img.height, max_tiles)
+            image = img.convert("RGB") if boxes or cache is None else None
+
+        # 切り出しは縮小前の画像から行う（_pad_image() は渡した画像を縮小する）
+        tiles = [self._pad_image(image.crop(box)) for box in boxes]
+        full = cache.get(image_path, data) if cache is not None else self._pad_image(image)
+        return [full, *tiles]
 
-    def predict(self, image_path: Path) -> Dict[str, float]:
+    def predict(self, image_path: ImageSource) -> Dict[str, float]:
         """
         画像からタグを予測
 
         Args:
-            image_path: 画像ファイルのパス
+            image_path: 画像ファイルのパス（またはアーカイブ内の画像）
 
         Returns:
             {タグ名: 信頼度}の辞書
         """
         # 画像を読み込み
-        image = Image.open(image_path).convert("RGB")
+        image = open_image(image_path).convert("RGB")
 
         # 前処理
         input_array = self._preprocess_image(image)
 
         # 推論
+        return self.predict_arrays([input_array])[0]
+
+    def predict_arrays(self, input_arrays: List[np.ndarray]) -> List[Dict[str, float]]:
+        """
+        前処理済みの配列をまとめて1回の推論で予測（バッチ推論）
+
+        Args:
+            input_arrays: _preprocess_image() の出力 (1, H, W, C) のリスト
+
+        Returns:
+            画像ごとの {タグ名: 信頼度} 辞書のリスト（入力と同じ順序）
+        """
+        outputs = self.predict_probabilities(input_arrays)
+        return [self._filter_tags(probabilities) for probabilities in outputs]
+
+    def predict_probabilities(self, input_arrays: List[np.ndarray]) -> np.ndarray:
+        """
+        前処理済みの配列をまとめて推論し、全タグの確率値をそのまま返す（しきい値は適用しない）
+
+        Args:
+            input_arrays: _preprocess_image() の出力 (1, H, W, C) のリスト
+
+        Returns:
+            (画像数, タグ数) の確率値配列（列の順序は self.tags と同じ）
+        """
+        # (N, H, W, C) のバッチにまとめる（まとめ済みの場合はコピーしない）
+        batch = input_arrays[0] if len(input_arrays) == 1 else np.concatenate(input_arrays, axis=0)
+
         input_name = self.session.get_inputs()[0].name
         output_name = self.session.get_outputs()[0].name
 
-        outputs = self.session.run([output_name], {input_name: input_array})[0]
-
         # モデル出力はすでに確率値（0-1）なので、そのまま使用
-        probabilities = outputs[0]
+        return self.session.run([output_name], {input_name: batch})[0]
+
+    def predict_with_embeddings(self, input_arrays: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        前処理済みの配列をまとめて推論し、確率値と埋め込みベクトルを1回の推論で返す
+
+        Args:
+            input_arrays: _preprocess_image() の出力 (1, H, W, C) のリスト
+
+        Returns:
+            ((画像数, タグ数) の確率値配列, (画像数, 次元数) の埋め込みベクトル) のタプル
+        """
+        if self.embedding_output is None:
+            raise RuntimeError("with_embeddings=True で初期化してください")
+
+        batch = input_arrays[0] if len(input_arrays) == 1 else np.concatenate(input_arrays, axis=0)
+
+        input_name = self.session.get_inputs()[0].name
+        output_name = self.session.get_outputs()[0].name
+
+        probabilities, embeddings = self.session.run(
+            [output_name, self.embedding_output], {input_name: batch}
+        )
+        return probabilities, embeddings.reshape(len(batch), -1)
 
+    def _filter_tags(self, probabilities: np.ndarray) -> Dict[str, float]:
+        """
+        しきい値以上のタグを信頼度の降順で取り出す
+
+        Args:
+            probabilities: 1画像分の確率値配列
+
+        Returns:
+            {タグ名: 信頼度}の辞書
+        """
         # タグと信頼度を辞書化
         tag_scores = {
             tag: float(prob)
@@ -169,12 +513,12 @@ class WD14Tagger:
 
         return tag_scores
 
-    def predict_tags_only(self, image_path: Path) -> List[str]:
+    def predict_tags_only(self, image_path: ImageSource) -> List[str]:
         """
         画像からタグのみを予測（信頼度は含まない）
 
         Args:
-            image_path: 画像ファイルのパス
+            image_path: 画像ファイルのパス（またはアーカイブ内の画像）
 
         Returns:
             タグのリスト
@@ -183,33 +527,59 @@ class WD14Tagger:
         return list(tag_scores.keys())
 
 
-def get_image_files(input_dir: Path) -> List[Path]:
+# 読み込み済みの Tagger（同じプロセス内で使い回す）
+_TAGGERS: Dict[Tuple[bool, bool, bool], WD14Tagger] = {}
+
+
+def get_tagger(
+    threshold: float = 0.35,
+    use_coreml: bool = False,
+    with_embeddings: bool = False,
+    low_memory: bool = False
+) -> WD14Tagger:
     """
-    指定ディレクトリから画像ファイルを取得
+    読み込み済みの Tagger を取得（初回のみモデルを読み込む）
+
+    1つのプロセスで複数の処理を続けて実行する場合に、モデルの読み込みを1回で済ませる。
 
     Args:
-        input_dir: 入力ディレクトリのパス
+        threshold: タグの信頼度しきい値（読み込み済みの Tagger にも反映）
+        use_coreml: CoreML高速化を使用するか
+        with_embeddings: 画像の埋め込みベクトルも出力するか
+        low_memory: 省メモリモードで読み込むか
 
     Returns:
-        画像ファイルのパスリスト（ソート済み）
+        WD14Tagger
     """
-    # サポートする画像形式
-    image_extensions = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
-
-    image_files = [
-        f for f in input_dir.iterdir()
-        if f.is_file() and f.suffix in image_extensions
-    ]
-
-    # ファイル名でソート
-    return sorted(image_files)
+    key = (use_coreml, with_embeddings, low_memory)
+    tagger = _TAGGERS.get(key)
+    if tagger is None:
+        tagger = WD14Tagger(
+            threshold=threshold, use_coreml=use_coreml, with_embeddings=with_embeddings, low_memory=low_memory
+        )
+        _TAGGERS[key] = tagger
+    tagger.threshold = threshold
+    return tagger
 
 
 def process_images(
     input_dir: Path,
     output_dir: Path,
     threshold: float = 0.35,
-    use_coreml: bool = False
+    use_coreml: bool = False,
+    save_scores: bool = False,
+    backup: bool = False,
+    save_embeddings: bool = False,
+    writers: int = 4,
+    fsync: bool = False,
+    autotune: bool = True,
+    retune: bool = False,
+    batch_size: Optional[int] = None,
+    low_memory: bool = False,
+    cache_tensors: bool = False,
+    quiet: bool = False,
+    metrics_path: Optional[Path] = None,
+    tiles: int = 0
 ) -> Tuple[int, int]:
     """
     画像を一括処理してタグ付け
@@ -219,6 +589,19 @@ def process_images(
         output_dir: 出力ディレクトリ
         threshold: タグの信頼度しきい値（デフォルト: 0.35）
         use_coreml: CoreML高速化を使用するか（デフォルト: False）
+        save_scores: タグの信頼度を tag_scores.jsonl に保存するか（デフォルト: False）
+        backup: 上書き前のタグファイルをジャーナルに記録するか（デフォルト: False）
+        save_embeddings: 画像の埋め込みベクトルを embeddings.npy に保存するか（デフォルト: False）
+        writers: 画像のコピー・タグファイルの書き込みを行うスレッド数（デフォルト: 4）
+        fsync: 最後にまとめてディスクへの書き込みを確定するか（デフォルト: False）
+        autotune: 実行設定をこのマシン向けに自動調整するか（デフォルト: True）
+        retune: 保存済みの実行設定を使わず調整し直すか（デフォルト: False）
+        batch_size: 1回の推論でまとめる画像数（None の場合は調整結果、調整しない場合は1）
+        low_memory: 省メモリモードでモデルを読み込むか（デフォルト: False）
+        cache_tensors: 前処理済みの画像をキャッシュ（tensor_cache.py）から読み書きするか（デフォルト: False）
+        quiet: 1枚ごとの表示を止めるか（デフォルト: False）
+        metrics_path: 処理量の記録先（run_metrics.py を参照、デフォルト: 記録しない）
+        tiles: 縦長・横長の画像から切り出す最大数（0 の場合は全体のみ、デフォルト: 0）
 
     Returns:
         (成功数, スキップ数) のタプル
@@ -238,15 +621,70 @@ def process_images(
     print("-" * 50)
 
     # WD14 Taggerを初期化
-    tagger = WD14Tagger(threshold=threshold, use_coreml=use_coreml)
+    tagger = get_tagger(
+        threshold=threshold, use_coreml=use_coreml, with_embeddings=save_embeddings, low_memory=low_memory
+    )
 
-    success_count = 0
-    skip_count = 0
+    # 実行設定（スレッド数など）をこのマシン向けに調整（保存済みなら即座に読み込み）
+    if autotune and (retune or not tagger.tuned):
+        tagger.tune(image_files, retune=retune)
+    if batch_size is None:
+        batch_size = tagger.batch_size
+    batch_size = max(1, batch_size)
+
+    # 推論に成功した画像（書き込みの完了後に保存する信頼度・埋め込みベクトル）
+    results: List[Tuple[ImageSource, Dict[str, float], Optional[np.ndarray]]] = []
+    journal: Optional[TagJournal] = TagJournal(output_dir, 'auto_caption') if backup else None
+
+    # コピーと書き込みは別スレッドで行い、推論を止めない
+    writer = BackgroundWriter(workers=writers, fsync=fsync)
+
+    # 前処理済みの画像のキャッシュ（内容が同じ画像はデコードしない）
+    cache: Optional['TensorCache'] = None
+    if cache_tensors:
+        from tensor_cache import TensorCache
+        cache = TensorCache(tagger._pad_image, tagger.image_size)
+
+    total = len(image_files)
+    tiled_count = 0
+    metrics = RunMetrics('auto_caption', total, quiet, metrics_path)
+    for start in range(0, total, batch_size):
+        # バッチ分の画像を読み込んで前処理（切り出す場合は1枚から複数の行）
+        # アーカイブ内の画像は読み込んだ内容を出力にも使い、メンバーを読み直さない
+        batch: List[Tuple[int, ImageSource, Optional[bytes], List[np.ndarray]]] = []
+        for idx, image_path in enumerate(image_files[start:start + batch_size], start=start + 1):
+            try:
+                with metrics.stage('load'):
+                    data = read_archive_bytes(image_path)
+                    rows = tagger.load_rows(image_path, cache, tiles, data)
+                batch.append((idx, image_path, data, rows))
+                tiled_count += len(rows) > 1
+            except Exception as e:
+                metrics.item(f"✗ [{idx:02d}/{total}] {image_path.name}: エラー - {e}", 'errors')
+        if not batch:
+            continue
 
-    for idx, image_path in enumerate(image_files, start=1):
+        # タグを予測（埋め込みベクトルも同じ推論で取り出す）
         try:
-            # タグを予測
-            tags = tagger.predict_tags_only(image_path)
+            # バッチ内の全画像の全体・切り出しを1回の推論にまとめ、float32 への変換もまとめて行う
+            arrays = [to_float_batch([row for _, _, _, rows in batch for row in rows])]
+            with metrics.stage('inference'):
+                if save_embeddings:
+                    probabilities, embeddings = tagger.predict_with_embeddings(arrays)
+                else:
+                    probabilities = tagger.predict_probabilities(arrays)
+                    embeddings = None
+            probabilities, embeddings = merge_tiles(probabilities, embeddings, [len(rows) for _, _, _, rows in batch])
+            if embeddings is None:
+                embeddings = [None] * len(batch)
+        except Exception as e:
+            for idx, image_path, _, _ in batch:
+                metrics.item(f"✗ [{idx:02d}/{total}] {image_path.name}: エラー - {e}", 'errors')
+            continue
+
+        for (idx, image_path, data, _), image_probabilities, embedding in zip(batch, probabilities, embeddings):
+            tag_scores = tagger._filter_tags(image_probabilities)
+            tags = list(tag_scores.keys())
 
             # タグをカンマ区切りで結合
             tag_string = ", ".join(tags)
@@ -255,29 +693,70 @@ def process_images(
             output_image = output_dir / image_path.name
             output_txt = output_dir / f"{image_path.stem}.txt"
 
-            # 画像をコピー
-            shutil.copy2(image_path, output_image)
+            # 画像のコピーとタグファイルの書き込みを予約（書き込み待ちが多い場合はここで待つ）
+            with metrics.stage('write_queue'):
+                if data is not None:
+                    writer.write_bytes(str(image_path), output_image, data)
+                else:
+                    writer.copy(str(image_path), copy_image, image_path, output_image, dest=output_image)
+                writer.write_text(str(image_path), output_txt, tag_string, journal)
 
-            # タグを.txtファイルに保存
-            output_txt.write_text(tag_string, encoding="utf-8")
+            results.append((image_path, tag_scores, embedding))
 
-            print(f"✓ [{idx:02d}/{len(image_files)}] {image_path.name}")
-            print(f"  タグ数: {len(tags)}")
+            image_bytes = source_size(image_path)
+            metrics.add(bytes_read=image_bytes, bytes_written=image_bytes + len(tag_string.encode('utf-8')))
+
+            message = f"✓ [{idx:02d}/{total}] {image_path.name}\n  タグ数: {len(tags)}"
             if tags:
                 # 最初の5タグを表示
                 preview_tags = ", ".join(tags[:5])
                 if len(tags) > 5:
                     preview_tags += ", ..."
-                print(f"  プレビュー: {preview_tags}")
-
-            success_count += 1
-
-        except Exception as e:
-            print(f"✗ [{idx:02d}/{len(image_files)}] {image_path.name}: エラー - {e}")
-            skip_count += 1
-            continue
+                message += f"\n  プレビュー: {preview_tags}"
+            metrics.item(message)
+
+    if cache is not None:
+        cache.close()
+        print(f"前処理キャッシュ: {cache.hits}枚再利用, {cache.misses}枚追加")
+    if tiles > 0:
+        print(f"切り出し: {tiled_count}枚の画像を最大{tiles}個に分けて推論")
+
+    # 書き込みの完了を待ち、失敗した画像はスキップに数え直す
+    with metrics.stage('write_wait'):
+        write_errors = writer.close()
+    for image_path, _, _ in results:
+        if str(image_path) in write_errors:
+            metrics.add(processed=-1)
+            metrics.item(f"✗ {image_path.name}: 書き込みエラー - {write_errors[str(image_path)]}", 'errors')
+    success_count = metrics.counters["processed"]
+    skip_count = metrics.counters["errors"]
+    results = [result for result in results if str(result[0]) not in write_errors]
+
+    if journal is not None:
+        journal.close()
+        print(f"ジャーナル: {journal.path}")
+
+    if save_scores:
+        scores_path = output_dir / SCORES_FILENAME
+        score_lines = [
+            json.dumps({"image": image_path.name, "scores": tag_scores}, ensure_ascii=False)
+            for image_path, tag_scores, _ in results
+        ]
+        atomic_write_text(scores_path, "\n".join(score_lines) + "\n")
+        print(f"信頼度を保存しました: {scores_path}")
+
+    if save_embeddings and results:
+        output_images = [output_dir / image_path.name for image_path, _, _ in results]
+        embeddings_path = write_embeddings(
+            output_dir,
+            [path.name for path in output_images],
+            [image_key(path)[1] for path in output_images],
+            np.stack([embedding for _, _, embedding in results])
+        )
+        print(f"埋め込みベクトルを保存しました: {embeddings_path}")
 
     print("-" * 50)
+    metrics.finish()
     print(f"完了: {success_count}枚成功, {skip_count}枚スキップ")
 
     return success_count, skip_count
@@ -301,7 +780,7 @@ def main():
         '--input',
         type=str,
         required=True,
-        help='入力ディレクトリのパス'
+        help='入力ディレクトリ（またはzip/tarアーカイブ）のパス'
     )
 
     parser.add_argument(
@@ -324,6 +803,89 @@ def main():
         help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
     )
 
+    parser.add_argument(
+        '--save-scores',
+        action='store_true',
+        help=f'タグの信頼度を出力ディレクトリの {SCORES_FILENAME} に保存する'
+    )
+
+    parser.add_argument(
+        '--backup',
+        action='store_true',
+        help='上書き前のタグファイルをジャーナルに記録する（tag_io.py --undo で取り消し可能）'
+    )
+
+    parser.add_argument(
+        '--writers',
+        type=int,
+        default=4,
+        help='画像のコピー・タグファイルの書き込みを行うスレッド数（デフォルト: 4）'
+    )
+
+    parser.add_argument(
+        '--fsync',
+        action='store_true',
+        help='最後にまとめてディスクへの書き込みを確定する（停電・強制終了への備え）'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='1回の推論でまとめる画像数（デフォルト: 自動調整の結果）'
+    )
+
+    parser.add_argument(
+        '--retune',
+        action='store_true',
+        help='実行設定（バッチサイズ・スレッド数など）を調整し直す'
+    )
+
+    parser.add_argument(
+        '--no-autotune',
+        action='store_true',
+        help='実行設定を自動調整せず onnxruntime のデフォルトで実行する'
+    )
+
+    parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='省メモリモードでモデルを読み込む（重みをメモリマップで共有し、メモリアリーナを無効化）'
+    )
+
+    parser.add_argument(
+        '--cache-tensors',
+        action='store_true',
+        help='前処理済みの画像をキャッシュし、次回から同じ画像のデコード・前処理を省く（tensor_cache.py）'
+    )
+
+    parser.add_argument(
+        '--tiles',
+        type=int,
+        default=0,
+        help=f'縦長・横長（縦横比 {TILE_MIN_ASPECT} 以上）の画像を最大N個の重なりのある正方形に切り出し、'
+             '全体と合わせて推論する（タグごとに最大値で統合、デフォルト: 0 = 切り出さない）'
+    )
+
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help='1枚ごとの表示を止める（エラーと一定間隔の進捗のみ表示）'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        type=str,
+        default=None,
+        help='処理量の記録先（.prom は Prometheus の textfile 形式、それ以外は JSON Lines）'
+    )
+
+    parser.add_argument(
+        '--save-embeddings',
+        action='store_true',
+        help=f'画像の埋め込みベクトルを出力ディレクトリの {EMBEDDINGS_FILENAME} に保存する（image_search.py で検索）'
+    )
+
     args = parser.parse_args()
 
     # パスをPathオブジェクトに変換
@@ -335,12 +897,30 @@ def main():
         print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
         sys.exit(1)
 
-    if not input_dir.is_dir():
-        print(f"エラー: 入力パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+    if not is_valid_input(input_dir):
+        print(f"エラー: 入力パスがディレクトリまたはアーカイブではありません: {input_dir}", file=sys.stderr)
         sys.exit(1)
 
     # 処理実行
-    success, skip = process_images(input_dir, output_dir, args.threshold, args.use_coreml)
+    success, skip = process_images(
+        input_dir,
+        output_dir,
+        args.threshold,
+        args.use_coreml,
+        args.save_scores,
+        args.backup,
+        args.save_embeddings,
+        args.writers,
+        args.fsync,
+        autotune=not args.no_autotune,
+        retune=args.retune,
+        batch_size=args.batch_size,
+        low_memory=args.low_memory,
+        cache_tensors=args.cache_tensors,
+        quiet=args.quiet,
+        metrics_path=Path(args.metrics) if args.metrics else None,
+        tiles=args.tiles
+    )
 
     # 結果に応じて終了コードを設定
     if success == 0:
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+複数プロジェクトの一括タグ付けスクリプト
+
+機能:
+- projects/ 以下の全プロジェクト（2_processed/ があるもの）、または指定したプロジェクトをまとめてタグ付け
+- モデルの読み込みは1回だけ（全プロジェクトで同じ Tagger・同じバッチ推論を使う）
+- 各プロジェクトの画像を1枚ずつ交互に取り出してバッチを作る
+  （大きなプロジェクトが終わるまで小さなプロジェクトが待たされない）
+- 出力は各プロジェクトの 3_tagged/ に配置（auto_caption.py と同じ形式）
+- 最後にプロジェクトごとの処理時間（読み込み・推論・完了までの時間）を表示
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from auto_caption import TILE_MIN_ASPECT, get_tagger, merge_tiles, to_float_batch
+from image_sources import ImageSource, copy_image, get_image_files, read_archive_bytes
+from tag_io import BackgroundWriter, TagJournal
+
+# プロジェクトのディレクトリ構成（projects/README.md を参照）
+INPUT_DIRNAME = "2_processed"
+OUTPUT_DIRNAME = "3_tagged"
+
+
+class ProjectRun:
+    """1つのプロジェクトの処理対象と集計"""
+
+    def __init__(self, name: str, input_dir: Path, output_dir: Path):
+        """
+        Args:
+            name: プロジェクト名
+            input_dir: 入力ディレクトリ（2_processed）
+            output_dir: 出力ディレクトリ（3_tagged）
+        """
+        self.name = name
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.image_files: List[ImageSource] = []
+        self.success_count = 0
+        self.skip_count = 0
+        # 画像の読み込み・前処理にかかった時間（秒）
+        self.load_seconds = 0.0
+        # バッチ推論の時間のうち、このプロジェクトの画像が占める分（秒）
+        self.inference_seconds = 0.0
+        # 開始から最後の画像の推論が終わるまでの時間（秒）
+        self.finished_at = 0.0
+        self.journal: Optional[TagJournal] = None
+
+
+def find_projects(projects_dir: Path, names: Optional[List[str]] = None) -> List[ProjectRun]:
+    """
+    処理するプロジェクトを取得
+
+    Args:
+        projects_dir: プロジェクトの親ディレクトリ（projects/）
+        names: プロジェクト名またはプロジェクトのパスのリスト（None の場合は 2_processed/ がある全プロジェクト）
+
+    Returns:
+        ProjectRun のリスト
+    """
+    if names:
+        project_dirs = []
+        for name in names:
+            path = Path(name)
+            project_dirs.append(path if path.is_dir() else projects_dir / name)
+    else:
+        project_dirs = sorted(
+            path for path in projects_dir.iterdir()
+            if path.is_dir() and (path / INPUT_DIRNAME).is_dir()
+        )
+
+    return [
+        ProjectRun(path.name, path / INPUT_DIRNAME, path / OUTPUT_DIRNAME)
+        for path in project_dirs
+    ]
+
+
+def interleave(projects: List[ProjectRun]) -> Iterator[Tuple[ProjectRun, int, ImageSource]]:
+    """
+    各プロジェクトの画像を1枚ずつ交互に取り出す（ラウンドロビン）
+
+    Args:
+        projects: ProjectRun のリスト
+
+    Yields:
+        (プロジェクト, プロジェクト内の連番, 画像) のタプル
+    """
+    longest = max((len(project.image_files) for project in projects), default=0)
+    for position in range(longest):
+        for project in projects:
+            if position < len(project.image_files):
+                yield project, position + 1, project.image_files[position]
+
+
+def process_projects(
+    projects: List[ProjectRun],
+    threshold: float = 0.35,
+    use_coreml: bool = False,
+    backup: bool = False,
+    writers: int = 4,
+    fsync: bool = False,
+    autotune: bool = True,
+    retune: bool = False,
+    batch_size: Optional[int] = None,
+    low_memory: bool = False,
+    cache_tensors: bool = False,
+    tiles: int = 0
+) -> Tuple[int, int]:
+    """
+    複数プロジェクトの画像を1つのモデルでまとめてタグ付け
+
+    Args:
+        projects: ProjectRun のリスト
+        threshold: タグの信頼度しきい値（デフォルト: 0.35）
+        use_coreml: CoreML高速化を使用するか（デフォルト: False）
+        backup: 上書き前のタグファイルをジャーナルに記録するか（デフォルト: False）
+        writers: 画像のコピー・タグファイルの書き込みを行うスレッド数（デフォルト: 4）
+        fsync: 最後にまとめてディスクへの書き込みを確定するか（デフォルト: False）
+        autotune: 実行設定をこのマシン向けに自動調整するか（デフォルト: True）
+        retune: 保存済みの実行設定を使わず調整し直すか（デフォルト: False）
+        batch_size: 1回の推論でまとめる画像数（None の場合は調整結果、調整しない場合は1）
+        low_memory: 省メモリモードでモデルを読み込むか（デフォルト: False）
+        cache_tensors: 前処理済みの画像をキャッシュ（tensor_cache.py）から読み書きするか（デフォルト: False）
+        tiles: 縦長・横長の画像から切り出す最大数（0 の場合は全体のみ、デフォルト: 0）
+
+    Returns:
+        全プロジェクト合計の (成功数, スキップ数) のタプル
+    """
+    for project in projects:
+        project.image_files = get_image_files(project.input_dir)
+        print(f"{project.name}: {len(project.image_files)}枚")
+    projects = [project for project in projects if project.image_files]
+
+    if not projects:
+        print("エラー: 画像ファイルのあるプロジェクトが見つかりません")
+        return 0, 0
+
+    print(f"信頼度しきい値: {threshold}")
+    print("-" * 50)
+
+    # WD14 Taggerを初期化（全プロジェクトで共有）
+    tagger = get_tagger(threshold=threshold, use_coreml=use_coreml, low_memory=low_memory)
+
+    if autotune and (retune or not tagger.tuned):
+        tagger.tune([source for _, _, source in interleave(projects)], retune=retune)
+    if batch_size is None:
+        batch_size = tagger.batch_size
+    batch_size = max(1, batch_size)
+
+    for project in projects:
+        project.output_dir.mkdir(parents=True, exist_ok=True)
+        if backup:
+            project.journal = TagJournal(project.output_dir, 'batch_caption')
+
+    writer = BackgroundWriter(workers=writers, fsync=fsync)
+    cache = None
+    if cache_tensors:
+        # --cache-tensors 指定時のみ読み込む
+        from tensor_cache import TensorCache
+        cache = TensorCache(tagger._pad_image, tagger.image_size)
+    # 書き込みに成功したかを確認するため、キーと画像の対応を残す
+    written: Dict[str, ProjectRun] = {}
+
+    start_time = time.perf_counter()
+    queue = interleave(projects)
+    while True:
+        # バッチ分の画像を読み込んで前処理
+        # アーカイブ内の画像は読み込んだ内容を出力にも使い、メンバーを読み直さない
+        batch: List[Tuple[ProjectRun, int, ImageSource, Optional[bytes], List[np.ndarray]]] = []
+        for project, idx, image_path in queue:
+            load_start = time.perf_counter()
+            try:
+                data = read_archive_bytes(image_path)
+                batch.append((project, idx, image_path, data, tagger.load_rows(image_path, cache, tiles, data)))
+            except Exception as e:
+                print(f"✗ [{project.name} {idx:02d}/{len(project.image_files)}] {image_path.name}: エラー - {e}")
+                project.skip_count += 1
+            project.load_seconds += time.perf_counter() - load_start
+            if len(batch) >= batch_size:
+                break
+        if not batch:
+            break
+
+        # タグを予測（推論時間はバッチ内の枚数で各プロジェクトに割り振る）
+        inference_start = time.perf_counter()
+        try:
+            probabilities = tagger.predict_probabilities(
+                [to_float_batch([row for _, _, _, _, rows in batch for row in rows])]
+            )
+            probabilities, _ = merge_tiles(probabilities, None, [len(rows) for _, _, _, _, rows in batch])
+        except Exception as e:
+            probabilities = None
+            error = e
+        share = (time.perf_counter() - inference_start) / len(batch)
+
+        for i, (project, idx, image_path, data, _) in enumerate(batch):
+            project.inference_seconds += share
+            project.finished_at = time.perf_counter() - start_time
+            label = f"[{project.name} {idx:02d}/{len(project.image_files)}] {image_path.name}"
+            if probabilities is None:
+                print(f"✗ {label}: エラー - {error}")
+                project.skip_count += 1
+                continue
+
+            tags = list(tagger._filter_tags(probabilities[i]).keys())
+            # プロジェクト名（ディレクトリ名）は重なることがあるため、元画像のパスをキーにする
+            key = str(image_path)
+            output_image = project.output_dir / image_path.name
+            if data is not None:
+                writer.write_bytes(key, output_image, data)
+            else:
+                writer.copy(key, copy_image, image_path, output_image, dest=output_image)
+            writer.write_text(key, project.output_dir / f"{image_path.stem}.txt", ", ".join(tags), project.journal)
+            written[key] = project
+
+            print(f"✓ {label}（タグ数: {len(tags)}）")
+            project.success_count += 1
+
+    if cache is not None:
+        cache.close()
+        print(f"前処理キャッシュ: {cache.hits}枚再利用, {cache.misses}枚追加")
+
+    # 書き込みの完了を待ち、失敗した画像はスキップに数え直す
+    write_errors = writer.close()
+    for key, error in write_errors.items():
+        print(f"✗ {key}: 書き込みエラー - {error}")
+        project = written[key]
+        project.success_count -= 1
+        project.skip_count += 1
+
+    for project in projects:
+        if project.journal is not None:
+            project.journal.close()
+            print(f"ジャーナル: {project.journal.path}")
+
+    print_summary(projects, time.perf_counter() - start_time)
+
+    return sum(p.success_count for p in projects), sum(p.skip_count for p in projects)
+
+
+def print_summary(projects: List[ProjectRun], total_seconds: float) -> None:
+    """
+    プロジェクトごとの処理時間を表示
+
+    Args:
+        projects: 処理済みの ProjectRun のリスト
+        total_seconds: 全体の処理時間（秒）
+    """
+    print("-" * 50)
+    # 全角の見出しは表示幅が2倍になるため、空白で桁を揃える
+    print("プロジェクト          成功  スキップ  読み込み      推論  完了まで")
+    for project in projects:
+        print(
+            f"{project.name:<20}{project.success_count:>6}{project.skip_count:>10}"
+            f"{project.load_seconds:>9.1f}s{project.inference_seconds:>9.1f}s{project.finished_at:>9.1f}s"
+        )
+
+    success = sum(p.success_count for p in projects)
+    skip = sum(p.skip_count for p in projects)
+    rate = (success + skip) / total_seconds if total_seconds > 0 else 0.0
+    print(f"完了: {len(projects)}プロジェクト, {success}枚成功, {skip}枚スキップ"
+          f"（{total_seconds:.1f}秒, {rate:.1f}枚/秒）")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='複数プロジェクトの画像を1つのモデルでまとめてタグ付け',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # projects/ 以下の全プロジェクト（2_processed/ があるもの）
+  python scripts/batch_caption.py
+
+  # プロジェクトを指定
+  python scripts/batch_caption.py --projects nasumiso_v1 other_v1 --threshold 0.35
+        """
+    )
+
+    parser.add_argument(
+        '--projects',
+        nargs='+',
+        default=None,
+        help='処理するプロジェクト名またはパス（デフォルト: 2_processed/ がある全プロジェクト）'
+    )
+
+    parser.add_argument(
+        '--projects-dir',
+        type=str,
+        default='projects',
+        help='プロジェクトの親ディレクトリ（デフォルト: projects）'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.35,
+        help='タグの信頼度しきい値（デフォルト: 0.35）'
+    )
+
+    parser.add_argument(
+        '--use-coreml',
+        action='store_true',
+        help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
+    )
+
+    parser.add_argument(
+        '--backup',
+        action='store_true',
+        help='上書き前のタグファイルをジャーナルに記録する（tag_io.py --undo で取り消し可能）'
+    )
+
+    parser.add_argument(
+        '--writers',
+        type=int,
+        default=4,
+        help='画像のコピー・タグファイルの書き込みを行うスレッド数（デフォルト: 4）'
+    )
+
+    parser.add_argument(
+        '--fsync',
+        action='store_true',
+        help='最後にまとめてディスクへの書き込みを確定する（停電・強制終了への備え）'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=None,
+        help='1回の推論でまとめる画像数（デフォルト: 自動調整の結果）'
+    )
+
+    parser.add_argument(
+        '--retune',
+        action='store_true',
+        help='実行設定（バッチサイズ・スレッド数など）を調整し直す'
+    )
+
+    parser.add_argument(
+        '--no-autotune',
+        action='store_true',
+        help='実行設定を自動調整せず onnxruntime のデフォルトで実行する'
+    )
+
+    parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='省メモリモードでモデルを読み込む（重みをメモリマップで共有し、メモリアリーナを無効化）'
+    )
+
+    parser.add_argument(
+        '--cache-tensors',
+        action='store_true',
+        help='前処理済みの画像をキャッシュし、次回から同じ画像のデコード・前処理を省く（tensor_cache.py）'
+    )
+
+    parser.add_argument(
+        '--tiles',
+        type=int,
+        default=0,
+        help=f'縦長・横長（縦横比 {TILE_MIN_ASPECT} 以上）の画像を最大N個の重なりのある正方形に切り出し、'
+             '全体と合わせて推論する（タグごとに最大値で統合、デフォルト: 0 = 切り出さない）'
+    )
+
+    args = parser.parse_args()
+
+    projects_dir = Path(args.projects_dir)
+    if not args.projects and not projects_dir.is_dir():
+        print(f"エラー: プロジェクトのディレクトリが存在しません: {projects_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    projects = find_projects(projects_dir, args.projects)
+    for project in projects:
+        if not project.input_dir.is_dir():
+            print(f"エラー: 入力ディレクトリが存在しません: {project.input_dir}", file=sys.stderr)
+            sys.exit(1)
+
+    # 処理実行
+    success, skip = process_projects(
+        projects,
+        args.threshold,
+        args.use_coreml,
+        args.backup,
+        args.writers,
+        args.fsync,
+        autotune=not args.no_autotune,
+        retune=args.retune,
+        batch_size=args.batch_size,
+        low_memory=args.low_memory,
+        cache_tensors=args.cache_tensors,
+        tiles=args.tiles
+    )
+
+    # 結果に応じて終了コードを設定
+    if success == 0:
+        sys.exit(1)
+    elif skip > 0:
+        sys.exit(2)
+    else:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
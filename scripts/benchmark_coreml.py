@@ -6,109 +6,33 @@ CoreML高速化のベンチマークスクリプト
 機能:
 - CoreML無効版とCoreML有効版の処理時間を測定
 - 同じ画像セットで比較
+- 前処理済みの画像はキャッシュから読み込み、推論の時間のみを測定
 """
 
 import argparse
 import sys
 import time
 from pathlib import Path
-from typing import List
 
-import numpy as np
-import onnxruntime as ort
-from huggingface_hub import hf_hub_download
-from PIL import Image
+from auto_caption import get_tagger, to_float_batch
+from image_sources import get_image_files, open_image
+from tensor_cache import TensorCache
 
-# WD14 Tagger v2のモデルID
-MODEL_ID = "SmilingWolf/wd-v1-4-moat-tagger-v2"
-MODEL_FILENAME = "model.onnx"
 
-
-class SimpleTagger:
-    """ベンチマーク用の簡易Taggerクラス"""
-
-    def __init__(self, use_coreml: bool = True):
-        """
-        初期化
-
-        Args:
-            use_coreml: CoreMLを使用するか（デフォルト: True）
-        """
-        self.image_size = 448
-        self.use_coreml = use_coreml
-
-        print(f"モード: {'CoreML有効' if use_coreml else 'CPU専用'}")
-        print("モデルをロード中...")
-
-        # ONNXモデルのダウンロード
-        model_path = hf_hub_download(
-            repo_id=MODEL_ID,
-            filename=MODEL_FILENAME
-        )
-
-        # ONNXランタイムセッションの作成
-        if use_coreml:
-            providers = ['CoreMLExecutionProvider', 'CPUExecutionProvider']
-        else:
-            providers = ['CPUExecutionProvider']
-
-        self.session = ort.InferenceSession(model_path, providers=providers)
-
-        # 使用中のプロバイダーを確認
-        available_providers = self.session.get_providers()
-        print(f"使用プロバイダー: {available_providers}")
-
-    def _preprocess_image(self, image: Image.Image) -> np.ndarray:
-        """画像を前処理"""
-        # リサイズとパディング
-        image.thumbnail((self.image_size, self.image_size), Image.Resampling.LANCZOS)
-
-        # 正方形にパディング
-        canvas = Image.new('RGB', (self.image_size, self.image_size), (255, 255, 255))
-        offset = ((self.image_size - image.width) // 2, (self.image_size - image.height) // 2)
-        canvas.paste(image, offset)
-
-        # NumPy配列に変換
-        img_array = np.array(canvas, dtype=np.float32)
-        img_array = np.expand_dims(img_array, axis=0)
-
-        return img_array
-
-    def predict(self, image_path: Path):
-        """画像からタグを予測（結果は使わない）"""
-        # 画像を読み込み
-        image = Image.open(image_path).convert("RGB")
-
-        # 前処理
-        input_array = self._preprocess_image(image)
-
-        # 推論
-        input_name = self.session.get_inputs()[0].name
-        output_name = self.session.get_outputs()[0].name
-
-        _ = self.session.run([output_name], {input_name: input_array})[0]
-
-
-def get_image_files(input_dir: Path) -> List[Path]:
-    """指定ディレクトリから画像ファイルを取得"""
-    image_extensions = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
-    image_files = [
-        f for f in input_dir.iterdir()
-        if f.is_file() and f.suffix in image_extensions
-    ]
-    return sorted(image_files)
-
-
-def benchmark(input_dir: Path, use_coreml: bool) -> float:
+def benchmark(input_dir: Path, use_coreml: bool, batch_size: int = 1, use_cache: bool = True) -> float:
     """
     ベンチマークを実行
 
+    前処理済みの画像はキャッシュ（tensor_cache.py）から読み込み、推論の時間だけを測定する。
+
     Args:
         input_dir: 入力ディレクトリ
         use_coreml: CoreMLを使用するか
+        batch_size: 1回の推論でまとめる画像数（デフォルト: 1）
+        use_cache: 前処理済みの画像のキャッシュを使うか（デフォルト: True）
 
     Returns:
-        総処理時間（秒）
+        推論の総処理時間（秒）
     """
     # 画像ファイルを取得
     image_files = get_image_files(input_dir)
@@ -121,19 +45,34 @@ def benchmark(input_dir: Path, use_coreml: bool) -> float:
     print("-" * 50)
 
     # Taggerを初期化
-    tagger = SimpleTagger(use_coreml=use_coreml)
+    tagger = get_tagger(use_coreml=use_coreml)
 
-    # ベンチマーク実行
-    print("\nベンチマーク開始...")
+    # 前処理（キャッシュにない画像のみデコード）
+    print("\n前処理中...")
     start_time = time.time()
+    if use_cache:
+        with TensorCache(tagger._pad_image, tagger.image_size) as cache:
+            rows = [cache.get(image_path) for image_path in image_files]
+        print(f"キャッシュ: {cache.hits}枚再利用, {cache.misses}枚追加")
+    else:
+        rows = []
+        for image_path in image_files:
+            with open_image(image_path) as img:
+                rows.append(tagger._pad_image(img.convert("RGB")))
+    print(f"前処理時間: {time.time() - start_time:.2f}秒")
 
-    for idx, image_path in enumerate(image_files, start=1):
-        tagger.predict(image_path)
-        if idx % 5 == 0 or idx == len(image_files):
-            print(f"処理中... {idx}/{len(image_files)}")
+    # ベンチマーク実行（float32 への変換はバッチごと、時間は推論のみ）
+    print("\nベンチマーク開始...")
+    elapsed = 0.0
+    for start in range(0, len(rows), batch_size):
+        batch = to_float_batch(rows[start:start + batch_size])
+        batch_start = time.time()
+        tagger.predict_probabilities([batch])
+        elapsed += time.time() - batch_start
 
-    end_time = time.time()
-    elapsed = end_time - start_time
+        done = min(start + batch_size, len(rows))
+        if done // 5 > (done - len(batch)) // 5 or done == len(rows):
+            print(f"処理中... {done}/{len(rows)}")
 
     print(f"\n総処理時間: {elapsed:.2f}秒")
     print(f"平均処理時間: {elapsed/len(image_files):.3f}秒/枚")
@@ -172,6 +111,19 @@ def main():
         help='CoreMLを無効化（CPU専用）'
     )
 
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=1,
+        help='1回の推論でまとめる画像数（デフォルト: 1）'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='前処理済みの画像のキャッシュを使わない'
+    )
+
     args = parser.parse_args()
 
     # パスをPathオブジェクトに変換
@@ -188,7 +140,7 @@ def main():
 
     # ベンチマーク実行
     use_coreml = not args.no_coreml
-    elapsed = benchmark(input_dir, use_coreml)
+    elapsed = benchmark(input_dir, use_coreml, max(1, args.batch_size), not args.no_cache)
 
     if elapsed > 0:
         sys.exit(0)
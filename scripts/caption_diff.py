@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグ付け結果の差分スクリプト
+
+機能:
+- 2つのタグディレクトリ、または2つのスコア行列（tag_stats.py の tag_score_matrix.npz）のタグを比較
+  （タグディレクトリとスコア行列の比較、同じスコア行列の異なるしきい値どうしの比較も可能）
+- 画像ごとに追加・削除されたタグと、データセット全体のタグごとの出現画像数の変化を表示
+- (画像, タグ) の組を整数にして NumPy の集合演算でまとめて比較（5万枚どうしでも数秒）
+- 画像は拡張子を除いた名前で対応付け、片方にしかない画像は件数のみ表示
+- タグの順序の違いは差分に含めない
+- 全画像の差分をJSON（--report）で出力
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from tag_io import atomic_write_text
+from tag_stats import load_score_matrix
+
+# スコア行列を一度に二値化する行数（メモリ使用量を抑える）
+THRESHOLD_CHUNK_ROWS = 1024
+
+# (画像名のリスト, タグのリスト, タグが付いている (行番号の配列, 列番号の配列))
+TagSets = Tuple[List[str], List[str], np.ndarray, np.ndarray]
+
+
+def unique_sorted(keys: np.ndarray) -> np.ndarray:
+    """
+    整数の配列を昇順に並べて重複を除く
+
+    np.unique は NumPy 2 でハッシュによる実装になり、大きな整数の配列では並べ替えより遅いため使わない。
+    """
+    keys = np.sort(keys)
+    if len(keys):
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    return keys
+
+
+def read_tag_dir(input_dir: Path) -> TagSets:
+    """
+    タグディレクトリの全タグファイルを読み込む
+
+    Args:
+        input_dir: タグファイル(.txt)があるディレクトリ
+
+    Returns:
+        (画像名（拡張子なし）のリスト, タグのリスト, (行番号, 列番号) の配列) のタプル
+    """
+    names = sorted(
+        entry.name for entry in os.scandir(input_dir)
+        if entry.name.endswith('.txt') and not entry.name.endswith('_jp.txt') and entry.is_file()
+    )
+
+    vocab: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    for row, name in enumerate(names):
+        content = (input_dir / name).read_text(encoding='utf-8')
+        for tag in content.split(','):
+            tag = tag.strip()
+            if tag:
+                rows.append(row)
+                cols.append(vocab.setdefault(tag, len(vocab)))
+
+    images = [name[:-len('.txt')] for name in names]
+    return images, list(vocab), np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+
+def read_score_matrix(matrix_path: Path, threshold: float) -> TagSets:
+    """
+    スコア行列をしきい値で二値化して読み込む
+
+    Args:
+        matrix_path: スコア行列ファイル（.npz）のパス
+        threshold: タグの信頼度しきい値
+
+    Returns:
+        (画像名（拡張子なし）のリスト, タグのリスト, (行番号, 列番号) の配列) のタプル
+    """
+    matrix = load_score_matrix(matrix_path)
+    if matrix is None:
+        raise FileNotFoundError(f"スコア行列がありません: {matrix_path}")
+
+    scores = matrix["scores"]
+    n_tags = scores.shape[1]
+    # auto_caption.py と同じく float32 で比較する（しきい値ちょうどのスコアの扱いを揃える）
+    limit = np.float32(threshold)
+
+    # 行列全体での位置（行番号 × タグ数 + 列番号）をまとめて取り出す
+    positions = [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(scores), THRESHOLD_CHUNK_ROWS):
+        chunk = scores[start:start + THRESHOLD_CHUNK_ROWS]
+        positions.append(np.flatnonzero(chunk >= limit) + start * n_tags)
+    rows, cols = np.divmod(np.concatenate(positions), max(1, n_tags))
+
+    images = [os.path.splitext(name)[0] for name in matrix["images"].tolist()]
+    return images, matrix["tags"].tolist(), rows, cols
+
+
+def load_tag_sets(path: Path, threshold: float) -> TagSets:
+    """タグディレクトリ（ディレクトリ）またはスコア行列（.npz ファイル）を読み込む"""
+    if path.is_dir():
+        return read_tag_dir(path)
+    return read_score_matrix(path, threshold)
+
+
+def diff_tag_sets(old: TagSets, new: TagSets) -> Dict:
+    """
+    2つのタグ付け結果を比較
+
+    (画像, タグ) の組を「共通の画像の番号 × タグ数 + タグの番号」の整数にして、
+    np.setdiff1d で追加・削除された組をまとめて求める。
+
+    Args:
+        old: 比較元の read_tag_dir() / read_score_matrix() の結果
+        new: 比較先の read_tag_dir() / read_score_matrix() の結果
+
+    Returns:
+        {"tags", "images", "only_old", "only_new", "old_counts", "new_counts", "added", "removed"} の辞書
+        （added / removed は昇順の整数の配列、画像の番号は images の位置）
+    """
+    old_images, old_vocab, old_rows, old_cols = old
+    new_images, new_vocab, new_rows, new_cols = new
+
+    # 両方のタグを合わせた語彙に列番号を付け直す
+    tags = np.array(sorted(set(old_vocab) | set(new_vocab)), dtype=str)
+    n_tags = len(tags)
+    old_cols = np.searchsorted(tags, np.array(old_vocab, dtype=str))[old_cols] if len(old_cols) else old_cols
+    new_cols = np.searchsorted(tags, np.array(new_vocab, dtype=str))[new_cols] if len(new_cols) else new_cols
+
+    # 両方にある画像に番号を付け直す（片方にしかない画像は -1）
+    images = sorted(set(old_images) & set(new_images))
+    position = {name: i for i, name in enumerate(images)}
+    old_map = np.array([position.get(name, -1) for name in old_images], dtype=np.int64)
+    new_map = np.array([position.get(name, -1) for name in new_images], dtype=np.int64)
+
+    def pair_keys(rows: np.ndarray, cols: np.ndarray, row_map: np.ndarray) -> np.ndarray:
+        mapped = row_map[rows]
+        keep = mapped >= 0
+        # 同じタグが2回書かれている場合も1組にする
+        return unique_sorted(mapped[keep] * n_tags + cols[keep])
+
+    old_keys = pair_keys(old_rows, old_cols, old_map)
+    new_keys = pair_keys(new_rows, new_cols, new_map)
+
+    return {
+        "tags": tags,
+        "images": images,
+        "only_old": sorted(set(old_images) - set(new_images)),
+        "only_new": sorted(set(new_images) - set(old_images)),
+        # データセット全体（片方にしかない画像も含む）のタグごとの出現画像数
+        "old_counts": np.bincount(unique_sorted(old_rows * n_tags + old_cols) % n_tags, minlength=n_tags)
+        if n_tags else np.zeros(0, dtype=np.int64),
+        "new_counts": np.bincount(unique_sorted(new_rows * n_tags + new_cols) % n_tags, minlength=n_tags)
+        if n_tags else np.zeros(0, dtype=np.int64),
+        "added": np.setdiff1d(new_keys, old_keys, assume_unique=True),
+        "removed": np.setdiff1d(old_keys, new_keys, assume_unique=True),
+    }
+
+
+def image_changes(diff: Dict) -> List[Dict]:
+    """
+    画像ごとの追加・削除されたタグ
+
+    Args:
+        diff: diff_tag_sets() の結果
+
+    Returns:
+        {"image", "added", "removed"} のリスト（変化があった画像のみ、画像名順）
+    """
+    n_tags = len(diff["tags"])
+    changes: Dict[int, Dict] = {}
+    for field in ("added", "removed"):
+        keys = diff[field]
+        if not len(keys):
+            continue
+        rows, cols = np.divmod(keys, n_tags)
+        # keys は昇順なので、同じ画像の組は連続している
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        for row, group in zip(rows[starts].tolist(), np.split(cols, starts[1:])):
+            entry = changes.setdefault(row, {"image": diff["images"][row], "added": [], "removed": []})
+            entry[field] = diff["tags"][group].tolist()
+    return [changes[row] for row in sorted(changes)]
+
+
+def tag_count_changes(diff: Dict) -> List[Tuple[str, int, int]]:
+    """
+    出現画像数が変わったタグ
+
+    Args:
+        diff: diff_tag_sets() の結果
+
+    Returns:
+        (タグ, 比較元の出現画像数, 比較先の出現画像数) のリスト（変化の大きい順）
+    """
+    delta = diff["new_counts"] - diff["old_counts"]
+    changed = np.flatnonzero(delta)
+    changed = changed[np.argsort(-np.abs(delta[changed]), kind='stable')]
+    return [
+        (str(diff["tags"][j]), int(diff["old_counts"][j]), int(diff["new_counts"][j]))
+        for j in changed
+    ]
+
+
+def print_report(diff: Dict, changes: List[Dict], counts: List[Tuple[str, int, int]], limit: int) -> None:
+    """
+    差分を表示
+
+    Args:
+        diff: diff_tag_sets() の結果
+        changes: image_changes() の結果
+        counts: tag_count_changes() の結果
+        limit: 表示する画像数・タグ数の上限
+    """
+    print(f"画像: 共通 {len(diff['images'])}枚, 比較元のみ {len(diff['only_old'])}枚, "
+          f"比較先のみ {len(diff['only_new'])}枚")
+    for label, names in (("比較元のみ", diff["only_old"]), ("比較先のみ", diff["only_new"])):
+        if names:
+            more = f" ...他{len(names) - limit}枚" if len(names) > limit else ""
+            print(f"  {label}: {', '.join(names[:limit])}{more}")
+
+    print("-" * 50)
+    print(f"タグが変わった画像: {len(changes)}枚（追加 {len(diff['added'])}件, 削除 {len(diff['removed'])}件）")
+    for change in changes[:limit]:
+        shown = [f"+{tag}" for tag in change["added"]] + [f"-{tag}" for tag in change["removed"]]
+        more = f" ...他{len(shown) - limit}個" if len(shown) > limit else ""
+        print(f"  {change['image']}: {', '.join(shown[:limit])}{more}")
+    if len(changes) > limit:
+        print(f"  ...他 {len(changes) - limit}枚")
+
+    print("-" * 50)
+    print(f"出現画像数が変わったタグ: {len(counts)}個")
+    for tag, old_count, new_count in counts[:limit]:
+        print(f"  {tag}: {old_count} → {new_count}（{new_count - old_count:+d}）")
+    if len(counts) > limit:
+        print(f"  ...他 {len(counts) - limit}個")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='2つのタグ付け結果（タグディレクトリ / スコア行列）を比較',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # タグディレクトリどうしを比較
+  python scripts/caption_diff.py --old projects/nasumiso_v1/3_tagged_old --new projects/nasumiso_v1/3_tagged
+
+  # 同じスコア行列で、しきい値 0.35 と 0.40 の結果を比較
+  python scripts/caption_diff.py \\
+    --old projects/nasumiso_v1/3_tagged/tag_score_matrix.npz --old-threshold 0.35 \\
+    --new projects/nasumiso_v1/3_tagged/tag_score_matrix.npz --new-threshold 0.40
+
+  # 全画像の差分をJSONに保存
+  python scripts/caption_diff.py --old old_tagged --new projects/nasumiso_v1/3_tagged --report diff.json
+        """
+    )
+
+    parser.add_argument(
+        '--old',
+        type=str,
+        required=True,
+        help='比較元のタグディレクトリ、またはスコア行列（.npz）のパス'
+    )
+
+    parser.add_argument(
+        '--new',
+        type=str,
+        required=True,
+        help='比較先のタグディレクトリ、またはスコア行列（.npz）のパス'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.35,
+        help='スコア行列を比較する場合のしきい値（デフォルト: 0.35）'
+    )
+
+    parser.add_argument(
+        '--old-threshold',
+        type=float,
+        default=None,
+        help='比較元のスコア行列のしきい値（デフォルト: --threshold）'
+    )
+
+    parser.add_argument(
+        '--new-threshold',
+        type=float,
+        default=None,
+        help='比較先のスコア行列のしきい値（デフォルト: --threshold）'
+    )
+
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='表示する画像数・タグ数の上限（デフォルト: 20）'
+    )
+
+    parser.add_argument(
+        '--report',
+        type=str,
+        default=None,
+        help='全画像の差分（JSON）の保存先'
+    )
+
+    args = parser.parse_args()
+
+    paths = {'比較元': Path(args.old), '比較先': Path(args.new)}
+    for label, path in paths.items():
+        if not path.exists():
+            print(f"エラー: {label}が存在しません: {path}", file=sys.stderr)
+            sys.exit(1)
+
+    old_threshold = args.old_threshold if args.old_threshold is not None else args.threshold
+    new_threshold = args.new_threshold if args.new_threshold is not None else args.threshold
+    if not all(0 < threshold < 1 for threshold in (old_threshold, new_threshold)):
+        print("エラー: しきい値は0より大きく1未満で指定してください", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        old = load_tag_sets(paths['比較元'], old_threshold)
+        new = load_tag_sets(paths['比較先'], new_threshold)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"エラー: 読み込みに失敗しました: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    diff = diff_tag_sets(old, new)
+    changes = image_changes(diff)
+    counts = tag_count_changes(diff)
+
+    print_report(diff, changes, counts, args.limit)
+
+    if args.report:
+        report = {
+            "old": str(paths['比較元']),
+            "new": str(paths['比較先']),
+            "only_old": diff["only_old"],
+            "only_new": diff["only_new"],
+            "images": changes,
+            "tag_counts": [
+                {"tag": tag, "old": old_count, "new": new_count}
+                for tag, old_count, new_count in counts
+            ],
+        }
+        atomic_write_text(Path(args.report), json.dumps(report, ensure_ascii=False, indent=1))
+        print(f"レポート: {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグ確認用のサムネイル一覧（コンタクトシート）生成スクリプト
+
+機能:
+- タグディレクトリ（3_tagged）の画像から小さな WebP サムネイルを作成し、タグを重ねて表示するHTMLを出力
+- サムネイルは画像ファイルの内容のハッシュで保存し、内容が変わった画像だけ作り直す
+  （更新時刻・サイズが同じ画像はハッシュも計算しない）
+- サムネイルの作成は複数プロセスで並列に行う
+- HTMLはページ分割（デフォルト: 1ページ200枚）、ブラウザでは元の画像をデコードせずに確認可能
+- 日本語タグファイル（_jp.txt）があれば英語タグと並べて表示
+- 出力先は入力ディレクトリの .contact_sheet/（--output で変更可能）
+"""
+
+import argparse
+import html
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from PIL import Image
+
+from generate_jp_tags import jp_path_for
+from image_sources import content_hash, get_image_files
+from tag_io import atomic_write_text
+
+# 出力先（入力ディレクトリ内に作成）
+DEFAULT_OUTPUT_DIRNAME = ".contact_sheet"
+THUMBNAILS_DIRNAME = "thumbs"
+
+# 作成済みサムネイルの記録（出力先に作成）
+MANIFEST_FILENAME = "manifest.json"
+
+# WebP の画質（0-100）と圧縮の手間（0-6、サムネイルは速さを優先）
+WEBP_QUALITY = 80
+WEBP_METHOD = 2
+
+# 1つのワーカーにまとめて渡す件数（プロセス間のやり取りを減らす）
+CHUNK_SIZE = 32
+
+PAGE_STYLE = """
+body { font-family: sans-serif; margin: 12px; background: #222; color: #eee; }
+a { color: #9cf; }
+nav { margin: 8px 0; }
+.grid { display: flex; flex-wrap: wrap; gap: 6px; }
+figure { position: relative; margin: 0; width: {size}px; height: {size}px; background: #333; }
+figure img { width: 100%; height: 100%; object-fit: contain; }
+figcaption { position: absolute; left: 0; right: 0; bottom: 0; max-height: 45%; overflow: hidden;
+  padding: 3px 4px; font-size: 11px; line-height: 1.3; background: rgba(0, 0, 0, 0.65); }
+figure:hover figcaption { max-height: 100%; overflow-y: auto; }
+.name { color: #fc6; }
+.jp { color: #cfc; }
+.missing { color: #f66; }
+"""
+
+
+def thumbnail_name(digest: str, size: int) -> str:
+    """サムネイルのファイル名（内容のハッシュとサイズ）"""
+    return f"{digest}-{size}.webp"
+
+
+def make_thumbnail(item: Tuple[str, str, int]) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    1枚のサムネイルを作成（ワーカープロセスで実行、同じ内容のサムネイルがあれば作成しない）
+
+    Args:
+        item: (画像のパス, サムネイルのディレクトリ, 長辺のサイズ) のタプル
+
+    Returns:
+        (画像のパス, 内容のハッシュ or None, エラーメッセージ or None) のタプル
+    """
+    path, thumbs_dir, size = item
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = content_hash(data)
+        thumb_path = os.path.join(thumbs_dir, thumbnail_name(digest, size))
+        if not os.path.exists(thumb_path):
+            with Image.open(io.BytesIO(data)) as img:
+                # JPEG は縮小しながらデコード（元のサイズで展開しない）
+                img.draft('RGB', (size, size))
+                img = img.convert('RGB')
+                img.thumbnail((size, size), Image.Resampling.LANCZOS)
+                tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+                img.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=WEBP_METHOD)
+            os.replace(tmp_path, thumb_path)
+        return path, digest, None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def read_tags(path: Path) -> Optional[str]:
+    """タグファイルの内容（ファイルがなければ None）"""
+    try:
+        return path.read_text(encoding='utf-8').strip()
+    except OSError:
+        return None
+
+
+def update_thumbnails(
+    images: List[Path],
+    output_dir: Path,
+    size: int,
+    workers: int
+) -> Tuple[Dict[str, str], int, List[Tuple[Path, str]]]:
+    """
+    更新時刻・サイズが変わった画像のサムネイルを作り直す
+
+    Args:
+        images: 画像ファイルのパスのリスト
+        output_dir: 出力先
+        size: サムネイルの長辺のサイズ
+        workers: 並列に作成するプロセス数
+
+    Returns:
+        ({画像名: サムネイルのファイル名}, 確認した画像数, (画像, エラーメッセージ)のリスト) のタプル
+    """
+    thumbs_dir = output_dir / THUMBNAILS_DIRNAME
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest_path = output_dir / MANIFEST_FILENAME
+    try:
+        recorded = json.loads(manifest_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        recorded = {}
+    if recorded.get("size") != size:
+        recorded = {}
+    recorded_files: Dict[str, List] = recorded.get("files", {})
+
+    files: Dict[str, List] = {}
+    pending: List[Tuple[str, str, int]] = []
+    for path in images:
+        st = path.stat()
+        entry = recorded_files.get(path.name)
+        if (entry and entry[:2] == [st.st_mtime_ns, st.st_size]
+                and (thumbs_dir / thumbnail_name(entry[2], size)).exists()):
+            files[path.name] = entry
+        else:
+            files[path.name] = [st.st_mtime_ns, st.st_size, None]
+            pending.append((str(path), str(thumbs_dir), size))
+
+    errors: List[Tuple[Path, str]] = []
+    if pending:
+        # デコードと縮小はCPUを使うため、スレッドではなくプロセスで並列化
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+            for path, digest, error in executor.map(make_thumbnail, pending, chunksize=CHUNK_SIZE):
+                name = Path(path).name
+                if error is not None:
+                    errors.append((Path(path), error))
+                    del files[name]
+                else:
+                    files[name][2] = digest
+
+    # どの画像からも参照されなくなったサムネイルを削除
+    used = {thumbnail_name(entry[2], size) for entry in files.values()}
+    for thumb_path in thumbs_dir.glob("*.webp"):
+        if thumb_path.name not in used:
+            thumb_path.unlink()
+
+    atomic_write_text(manifest_path, json.dumps({"size": size, "files": files}))
+    thumbnails = {name: thumbnail_name(entry[2], size) for name, entry in files.items()}
+    return thumbnails, len(pending), errors
+
+
+def render_page(
+    entries: List[Dict[str, Optional[str]]],
+    page: int,
+    page_count: int,
+    size: int,
+    title: str
+) -> str:
+    """
+    1ページ分のHTMLを作成
+
+    Args:
+        entries: {"name", "href", "thumb", "tags", "tags_jp"} のリスト
+        page: ページ番号（1から）
+        page_count: 全ページ数
+        size: サムネイルの表示サイズ
+        title: ページのタイトル
+
+    Returns:
+        HTML
+    """
+    def link(number: int, label: str) -> str:
+        if number < 1 or number > page_count or number == page:
+            return f"<span>{label}</span>"
+        return f'<a href="{page_filename(number)}">{label}</a>'
+
+    nav = (f"<nav>{link(page - 1, '← 前へ')} | {page}/{page_count}ページ | "
+           f"{link(page + 1, '次へ →')} | <a href=\"index.html\">一覧</a></nav>")
+
+    figures = []
+    for entry in entries:
+        if entry["tags"] is None:
+            tags = '<span class="missing">タグファイルがありません</span>'
+        else:
+            tags = html.escape(entry["tags"])
+        if entry["tags_jp"]:
+            tags += f'<br><span class="jp">{html.escape(entry["tags_jp"])}</span>'
+        figures.append(
+            f'<figure><a href="{html.escape(entry["href"])}" target="_blank">'
+            f'<img src="{THUMBNAILS_DIRNAME}/{entry["thumb"]}" loading="lazy" alt="{html.escape(entry["name"])}"></a>'
+            f'<figcaption><span class="name">{html.escape(entry["name"])}</span><br>{tags}</figcaption></figure>'
+        )
+
+    return (
+        f'<!DOCTYPE html>\n<html lang="ja"><head><meta charset="utf-8">'
+        f'<title>{html.escape(title)} ({page}/{page_count})</title>'
+        f'<style>{PAGE_STYLE.replace("{size}", str(size))}</style></head><body>\n'
+        f'{nav}\n<div class="grid">\n' + "\n".join(figures) + f'\n</div>\n{nav}\n</body></html>\n'
+    )
+
+
+def page_filename(page: int) -> str:
+    """ページのファイル名"""
+    return f"page_{page:03d}.html"
+
+
+def build_contact_sheet(
+    input_dir: Path,
+    output_dir: Path,
+    size: int = 192,
+    per_page: int = 200,
+    workers: int = 4
+) -> Tuple[int, int, List[Tuple[Path, str]]]:
+    """
+    サムネイルとHTMLを作成
+
+    Args:
+        input_dir: 画像とタグファイルがあるディレクトリ
+        output_dir: 出力先
+        size: サムネイルの長辺のサイズ（デフォルト: 192）
+        per_page: 1ページの画像数（デフォルト: 200）
+        workers: サムネイルを並列に作成するプロセス数（デフォルト: 4）
+
+    Returns:
+        (画像数, ページ数, (画像, エラーメッセージ)のリスト) のタプル
+    """
+    images = get_image_files(input_dir)
+    thumbnails, updated, errors = update_thumbnails(images, output_dir, size, workers)
+    print(f"サムネイル: {len(thumbnails)}枚（{updated}枚を確認・作成, {len(images) - updated}枚は変更なし）")
+
+    entries = []
+    for path in images:
+        if path.name not in thumbnails:
+            continue
+        txt_path = path.with_suffix('.txt')
+        entries.append({
+            "name": path.name,
+            "href": quote(Path(os.path.relpath(path, output_dir)).as_posix()),
+            "thumb": thumbnails[path.name],
+            "tags": read_tags(txt_path),
+            "tags_jp": read_tags(jp_path_for(txt_path)),
+        })
+
+    per_page = max(1, per_page)
+    page_count = max(1, -(-len(entries) // per_page))
+    title = input_dir.resolve().parent.name + "/" + input_dir.name
+    for page in range(1, page_count + 1):
+        page_entries = entries[(page - 1) * per_page:page * per_page]
+        atomic_write_text(output_dir / page_filename(page), render_page(page_entries, page, page_count, size, title))
+
+    # 前回より減ったページを削除
+    pages = {page_filename(page) for page in range(1, page_count + 1)}
+    for page_path in output_dir.glob("page_*.html"):
+        if page_path.name not in pages:
+            page_path.unlink()
+
+    untagged = sum(1 for entry in entries if entry["tags"] is None)
+    index_lines = [
+        f'<li><a href="{page_filename(page)}">{page}ページ</a>'
+        f'（{entries[(page - 1) * per_page]["name"] if entries else "-"} 〜）</li>'
+        for page in range(1, page_count + 1)
+    ]
+    atomic_write_text(
+        output_dir / "index.html",
+        f'<!DOCTYPE html>\n<html lang="ja"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+        f'<style>{PAGE_STYLE.replace("{size}", str(size))}</style></head><body>\n'
+        f'<h1>{html.escape(title)}</h1>\n<p>画像 {len(entries)}枚, タグファイルなし {untagged}枚</p>\n'
+        f'<ul>\n' + "\n".join(index_lines) + '\n</ul>\n</body></html>\n'
+    )
+
+    return len(entries), page_count, errors
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='タグ確認用のサムネイル一覧（HTML）を作成',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  python scripts/contact_sheet.py --input projects/nasumiso_v1/3_tagged
+  # → projects/nasumiso_v1/3_tagged/.contact_sheet/index.html をブラウザで開く
+
+  # 大きめのサムネイルで1ページ100枚
+  python scripts/contact_sheet.py --input projects/nasumiso_v1/3_tagged --size 256 --per-page 100
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='画像とタグファイルがあるディレクトリのパス（3_tagged）'
+    )
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help=f'出力先（デフォルト: 入力ディレクトリの {DEFAULT_OUTPUT_DIRNAME}/）'
+    )
+
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=192,
+        help='サムネイルの長辺のサイズ（デフォルト: 192）'
+    )
+
+    parser.add_argument(
+        '--per-page',
+        type=int,
+        default=200,
+        help='1ページの画像数（デフォルト: 200）'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='サムネイルを並列に作成するプロセス数（デフォルト: CPU数）'
+    )
+
+    args = parser.parse_args()
+
+    input_dir = Path(args.input)
+    if not input_dir.is_dir():
+        print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    output_dir = Path(args.output) if args.output else input_dir / DEFAULT_OUTPUT_DIRNAME
+
+    count, page_count, errors = build_contact_sheet(input_dir, output_dir, args.size, args.per_page, args.workers)
+
+    for path, error in errors:
+        print(f"✗ {path.name}: エラー - {error}")
+
+    print("-" * 50)
+    print(f"完了: {count}枚, {page_count}ページ")
+    print(f"一覧: {output_dir / 'index.html'}")
+
+    # 結果に応じて終了コードを設定
+    if count == 0:
+        sys.exit(1)
+    elif errors:
+        sys.exit(2)
+    else:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
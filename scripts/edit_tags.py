@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグファイルの一括編集スクリプト
+
+機能:
+- 複数の編集操作（追加・削除・置換・正規表現・重複除去・並べ替え・ブラックリスト）を
+  指定順に適用
+- 操作はコマンドラインまたはルールファイルで指定
+- 1ファイルにつき読み込み1回・アトミックな書き込み1回で全操作を反映
+- ドライラン（差分表示のみ）と並列処理に対応
+"""
+
+import argparse
+import difflib
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from tag_io import TagJournal, atomic_write_text
+
+
+# 編集操作: (操作名, 引数)
+Operation = Tuple[str, Any]
+
+# ルールファイルで使える操作名
+OPERATION_NAMES = ('add', 'append', 'remove', 'replace', 'regex', 'dedupe', 'front', 'blacklist')
+
+# replace / regex の 旧=新 の区切り（\= はエスケープされた = として区切りにしない）
+PAIR_SEPARATOR = re.compile(r'(?<!\\)=')
+
+
+def load_blacklist(path: Path) -> frozenset:
+    """
+    ブラックリストファイル（1行1タグ、#以降はコメント）を読み込む
+
+    Args:
+        path: ブラックリストファイルのパス
+
+    Returns:
+        削除対象タグの集合
+    """
+    tags = set()
+    for line in path.read_text(encoding='utf-8').splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            tags.add(line)
+    return frozenset(tags)
+
+
+def parse_operation(name: str, value: Optional[str], base_dir: Path = Path('.')) -> Operation:
+    """
+    操作名と引数から編集操作を作成
+
+    Args:
+        name: 操作名（OPERATION_NAMES のいずれか）
+        value: 操作の引数（dedupe は None）
+        base_dir: blacklist の相対パスの基準ディレクトリ
+
+    Returns:
+        編集操作
+
+    Raises:
+        ValueError: 操作名や引数が不正な場合
+    """
+    if name not in OPERATION_NAMES:
+        raise ValueError(f"不明な操作です: {name}")
+
+    if name == 'dedupe':
+        return (name, None)
+
+    if not value:
+        raise ValueError(f"{name} には引数が必要です")
+
+    if name in ('replace', 'regex'):
+        # = を含める場合は \= と書く（最初のエスケープされていない = で区切る）
+        parts = PAIR_SEPARATOR.split(value, 1)
+        if len(parts) != 2:
+            raise ValueError(f"{name} の引数は 旧=新 の形式で指定してください: {value}")
+        old, new = parts
+        new = new.replace('\\=', '=')
+        if name == 'regex':
+            # 正規表現では \= はそのまま = に一致する
+            try:
+                return (name, (re.compile(old), new))
+            except re.error as e:
+                raise ValueError(f"正規表現が不正です: {old} ({e})")
+        old = old.replace('\\=', '=').strip()
+        if not old:
+            raise ValueError(f"{name} の置換前のタグが空です: {value}")
+        return (name, (old, new.strip()))
+
+    if name == 'blacklist':
+        path = Path(value)
+        if not path.is_absolute():
+            path = base_dir / path
+        return (name, load_blacklist(path))
+
+    return (name, value.strip())
+
+
+def load_rules(rules_path: Path) -> List[Operation]:
+    """
+    ルールファイルを読み込む
+
+    書式（1行1操作、空行と#で始まる行は無視）:
+        add nasumiso_style
+        remove general
+        replace smiling=smile
+        replace general=
+        regex ^(.*)_\\(cosplay\\)$=\\1
+        regex ^score\\=(.*)$=score_\\1
+        dedupe
+        front nasumiso_style
+        blacklist ratings.txt
+
+    Args:
+        rules_path: ルールファイルのパス
+
+    Returns:
+        編集操作のリスト
+
+    Raises:
+        ValueError: ルールが不正な場合（行番号付き）
+    """
+    operations = []
+    lines = rules_path.read_text(encoding='utf-8').splitlines()
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(None, 1)
+        value = parts[1] if len(parts) > 1 else None
+        try:
+            operations.append(parse_operation(parts[0], value, rules_path.parent))
+        except (ValueError, OSError) as e:
+            raise ValueError(f"{rules_path}:{line_no}: {e}")
+    return operations
+
+
+def apply_operations(tags: List[str], operations: List[Operation]) -> List[str]:
+    """
+    タグのリストに編集操作を順番に適用
+
+    Args:
+        tags: タグのリスト
+        operations: 編集操作のリスト
+
+    Returns:
+        編集後のタグのリスト
+    """
+    for name, arg in operations:
+        if name == 'add':
+            if arg not in tags:
+                tags = [arg] + tags
+        elif name == 'append':
+            if arg not in tags:
+                tags = tags + [arg]
+        elif name == 'remove':
+            tags = [t for t in tags if t != arg]
+        elif name == 'replace':
+            old, new = arg
+            # 新が空の場合は削除と同じ
+            tags = [new if t == old else t for t in tags]
+            tags = [t for t in tags if t]
+        elif name == 'regex':
+            pattern, repl = arg
+            tags = [pattern.sub(repl, t).strip() for t in tags]
+            tags = [t for t in tags if t]
+        elif name == 'dedupe':
+            tags = list(dict.fromkeys(tags))
+        elif name == 'front':
+            if arg in tags:
+                tags = [arg] + [t for t in tags if t != arg]
+        elif name == 'blacklist':
+            tags = [t for t in tags if t not in arg]
+    return tags
+
+
+def edit_file(
+    txt_path: Path,
+    operations: List[Operation],
+    dry_run: bool = False,
+    journal: Optional[TagJournal] = None
+) -> Tuple[Path, bool, str, str]:
+    """
+    1つのタグファイルに全ての編集操作を適用
+
+    Args:
+        txt_path: タグファイルのパス
+        operations: 編集操作のリスト
+        dry_run: Trueの場合は書き込まない
+        journal: 書き換え前の内容を記録するジャーナル（None の場合は記録しない）
+
+    Returns:
+        (パス, 変更されたか, 編集前の内容, 編集後の内容) のタプル
+    """
+    content = txt_path.read_text(encoding='utf-8')
+    tags = [t.strip() for t in content.split(',')]
+    tags = [t for t in tags if t]
+
+    new_tags = apply_operations(tags, operations)
+    new_content = ', '.join(new_tags)
+
+    # 区切りの空白や末尾の改行だけの違いは変更に数えない
+    changed = new_tags != tags
+    if changed and not dry_run:
+        if journal is not None:
+            journal.record_content(txt_path, content)
+        atomic_write_text(txt_path, new_content)
+
+    return txt_path, changed, content, new_content
+
+
+class OperationAction(argparse.Action):
+    """コマンドラインの指定順を保ったまま編集操作を積み上げるアクション"""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        operations = getattr(namespace, self.dest, None) or []
+        name = option_string.lstrip('-')
+        try:
+            if name == 'rules':
+                operations.extend(load_rules(Path(values)))
+            else:
+                operations.append(parse_operation(name, values))
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+        setattr(namespace, self.dest, operations)
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='タグファイルに複数の編集操作を一括適用',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+操作は指定した順番に適用されます。
+
+使用例:
+  # よくある整理を1回の実行で行う（まずはドライランで差分を確認）
+  python scripts/edit_tags.py \\
+    --input projects/nasumiso_v1/3_tagged \\
+    --add nasumiso_style \\
+    --remove general --remove sensitive \\
+    --replace smiling=smile \\
+    --dedupe \\
+    --front nasumiso_style \\
+    --dry-run
+
+  # ルールファイルで指定
+  python scripts/edit_tags.py \\
+    --input projects/nasumiso_v1/3_tagged \\
+    --rules config/tag_rules.txt
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='タグファイルがあるディレクトリのパス'
+    )
+
+    parser.add_argument('--add', dest='operations', action=OperationAction, metavar='TAG',
+                        help='タグを先頭に追加（すでにあればスキップ）')
+    parser.add_argument('--append', dest='operations', action=OperationAction, metavar='TAG',
+                        help='タグを末尾に追加（すでにあればスキップ）')
+    parser.add_argument('--remove', dest='operations', action=OperationAction, metavar='TAG',
+                        help='タグを削除')
+    parser.add_argument('--replace', dest='operations', action=OperationAction, metavar='OLD=NEW',
+                        help='タグを置換（例: smiling=smile、NEW が空なら削除、= は \\= と書く）')
+    parser.add_argument('--regex', dest='operations', action=OperationAction, metavar='PATTERN=REPL',
+                        help='各タグに正規表現置換を適用（結果が空のタグは削除、= は \\= と書く）')
+    parser.add_argument('--dedupe', dest='operations', action=OperationAction, nargs=0,
+                        help='重複タグを除去（最初の出現を残す）')
+    parser.add_argument('--front', dest='operations', action=OperationAction, metavar='TAG',
+                        help='タグがあれば先頭に移動（トリガーワード用）')
+    parser.add_argument('--blacklist', dest='operations', action=OperationAction, metavar='FILE',
+                        help='ファイルに列挙したタグを全て削除（1行1タグ）')
+    parser.add_argument('--rules', dest='operations', action=OperationAction, metavar='FILE',
+                        help='ルールファイルの操作をこの位置に展開')
+
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='ファイルを書き換えず、差分のみ表示する'
+    )
+
+    parser.add_argument(
+        '--backup',
+        action='store_true',
+        help='書き換え前の内容をジャーナルに記録する（tag_io.py --undo で取り消し可能）'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help='並列処理数（デフォルト: CPU数、最大8）'
+    )
+
+    args = parser.parse_args()
+
+    operations = args.operations or []
+    if not operations:
+        parser.error('編集操作を1つ以上指定してください')
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+
+    # ディレクトリの存在確認
+    if not input_dir.exists():
+        print(f"エラー: ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not input_dir.is_dir():
+        print(f"エラー: パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    # タグファイルを取得（_jp.txtを除外）
+    txt_files = sorted(input_dir.glob('*.txt'))
+    txt_files = [f for f in txt_files if not f.name.endswith('_jp.txt')]
+
+    if not txt_files:
+        print(f"エラー: {input_dir} にタグファイルが見つかりません", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"処理対象: {len(txt_files)}個のタグファイル")
+    print(f"編集操作: {len(operations)}個")
+    if args.dry_run:
+        print("ドライラン: 有効（ファイルは書き換えません）")
+    print("-" * 50)
+
+    changed_count = 0
+    unchanged_count = 0
+    error_count = 0
+
+    journal = TagJournal(input_dir, 'edit_tags') if args.backup and not args.dry_run else None
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [
+            executor.submit(edit_file, txt_file, operations, args.dry_run, journal)
+            for txt_file in txt_files
+        ]
+
+        # 表示はファイル名順
+        for txt_file, future in zip(txt_files, futures):
+            try:
+                _, changed, old_content, new_content = future.result()
+            except Exception as e:
+                print(f"✗ {txt_file.name}: エラー - {e}")
+                error_count += 1
+                continue
+
+            if not changed:
+                unchanged_count += 1
+                continue
+
+            changed_count += 1
+            if args.dry_run:
+                diff = difflib.unified_diff(
+                    [old_content], [new_content],
+                    fromfile=txt_file.name, tofile=f"{txt_file.name}（編集後）",
+                    lineterm=''
+                )
+                print('\n'.join(diff))
+            else:
+                print(f"✓ {txt_file.name}: 更新しました")
+
+    if journal is not None:
+        journal.close()
+
+    print("-" * 50)
+    label = "変更予定" if args.dry_run else "更新"
+    print(f"完了: {changed_count}個{label}, {unchanged_count}個変更なし, {error_count}個エラー")
+
+    if journal is not None:
+        print(f"ジャーナル: {journal.path}")
+        print(f"取り消し: python scripts/tag_io.py --input {input_dir} --undo")
+
+    if changed_count > 0 and not args.dry_run:
+        print("\n次のステップ: git diff で変更を確認し、コミットしてください")
+
+    if error_count > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
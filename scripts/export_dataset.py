@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学習用データセットのシャード出力スクリプト
+
+機能:
+- 3_tagged/ の画像とタグファイル(.txt)のペアを一定サイズのtarシャードにまとめる
+  （WebDataset形式: 同じベース名の img001.png と img001.txt が1サンプル）
+- ベース名の "." は "_" に置き換え、重なるキーには連番を付ける
+  （WebDatasetはメンバー名の最初の "." までをキーとして読むため）
+- シャードの一覧・サンプル数・各メンバーの位置を index.json に記録
+- 複数シャードを並列に書き込み
+- 学習側ではシャードを先頭から順に読むだけでよい（iter_dataset）
+"""
+
+import argparse
+import json
+import os
+import sys
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+
+# サポートする画像形式
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
+
+INDEX_FILENAME = "index.json"
+SHARD_PATTERN = "shard-{:06d}.tar"
+
+# tarヘッダ（512バイト）とブロック境界の分を見込んだサイズ計算用
+TAR_BLOCK = 512
+
+# USTARヘッダに収まるメンバー名の長さ（超える名前や非ASCIIの名前にはPAX拡張ヘッダが付く）
+USTAR_NAME_BYTES = 100
+
+
+def collect_samples(input_dir: Path) -> Tuple[List[Tuple[str, Path, Path]], List[str]]:
+    """
+    画像とタグファイルのペアを取得
+
+    Args:
+        input_dir: 3_tagged ディレクトリ
+
+    Returns:
+        ([(キー, 画像パス, タグファイルパス)], [タグファイルがない画像名]) のタプル
+        （キーはベース名の "." を "_" に置き換え、重なる場合は連番を付けたもの）
+    """
+    pairs = []
+    missing = []
+    for image_path in sorted(input_dir.iterdir()):
+        if not image_path.is_file() or image_path.suffix not in IMAGE_EXTENSIONS:
+            continue
+        txt_path = image_path.with_suffix('.txt')
+        if txt_path.exists():
+            pairs.append((image_path, txt_path))
+        else:
+            missing.append(image_path.name)
+
+    # "." を含まないベース名はそのままのキーを優先し、置き換えたキーや重複には連番を付ける
+    used = set()
+    keys = {}
+    for image_path, _ in sorted(pairs, key=lambda pair: '.' in pair[0].stem):
+        base = image_path.stem.replace('.', '_')
+        key, number = base, 2
+        while key in used:
+            key = f"{base}_{number}"
+            number += 1
+        used.add(key)
+        keys[image_path] = key
+
+    samples = [(keys[image_path], image_path, txt_path) for image_path, txt_path in pairs]
+    return samples, missing
+
+
+def blocks(size: int) -> int:
+    """512バイト境界に切り上げたサイズ"""
+    return (size + TAR_BLOCK - 1) // TAR_BLOCK * TAR_BLOCK
+
+
+def member_size(name: str, size: int) -> int:
+    """
+    tar内でのメンバーの占有サイズ（ヘッダ + 512バイト境界に切り上げたデータ）
+
+    日本語や長い名前は、PAX拡張ヘッダ（ヘッダ1ブロック + path のレコード）が前に付く。
+    """
+    header = TAR_BLOCK
+    if not name.isascii() or len(name) > USTAR_NAME_BYTES:
+        record = len(f"path={name}\n".encode('utf-8'))
+        header += TAR_BLOCK + blocks(record + len(str(record)) + 2)
+    return header + blocks(size)
+
+
+def plan_shards(
+    samples: List[Tuple[str, Path, Path]],
+    shard_bytes: int,
+    max_count: int
+) -> List[List[Tuple[str, Path, Path]]]:
+    """
+    サンプルをシャードに割り当てる（サイズ・件数の上限を超えたら次のシャードへ）
+
+    Args:
+        samples: (ベース名, 画像パス, タグファイルパス) のリスト
+        shard_bytes: 1シャードの最大バイト数
+        max_count: 1シャードの最大サンプル数
+
+    Returns:
+        シャードごとのサンプルリスト
+    """
+    shards: List[List[Tuple[str, Path, Path]]] = []
+    current: List[Tuple[str, Path, Path]] = []
+    current_bytes = 0
+
+    for sample in samples:
+        key, image_path, txt_path = sample
+        size = (member_size(f"{key}{image_path.suffix.lower()}", image_path.stat().st_size)
+                + member_size(f"{key}.txt", txt_path.stat().st_size))
+        if current and (current_bytes + size > shard_bytes or len(current) >= max_count):
+            shards.append(current)
+            current = []
+            current_bytes = 0
+        current.append(sample)
+        current_bytes += size
+
+    if current:
+        shards.append(current)
+
+    return shards
+
+
+def write_shard(shard_path: Path, samples: List[Tuple[str, Path, Path]]) -> Dict:
+    """
+    1つのシャードを書き込む（一時ファイルに書いてからリネーム）
+
+    Args:
+        shard_path: 出力するtarファイルのパス
+        samples: (ベース名, 画像パス, タグファイルパス) のリスト
+
+    Returns:
+        index.json に記録するシャード情報
+    """
+    tmp_path = shard_path.with_name(shard_path.name + '.tmp')
+    members = []
+
+    try:
+        # 日本語や100バイトを超える名前も入るようにPAX形式（USTARでは ValueError になる）
+        with tarfile.open(tmp_path, 'w', format=tarfile.PAX_FORMAT, encoding='utf-8') as tar:
+            for key, image_path, txt_path in samples:
+                for path in (image_path, txt_path):
+                    # 実行環境に依存しない情報だけを記録（再出力で同じtarになる）
+                    info = tarfile.TarInfo(name=f"{key}{path.suffix.lower()}")
+                    st = path.stat()
+                    info.size = st.st_size
+                    info.mtime = int(st.st_mtime)
+                    info.mode = 0o644
+                    with path.open('rb') as f:
+                        tar.addfile(info, f)
+                    # PAX拡張ヘッダの有無でヘッダの長さが変わるため、データ位置は書き込み後の末尾から求める
+                    offset = tar.offset - blocks(info.size)
+                    members.append({
+                        "name": info.name,
+                        "offset": offset,
+                        "size": info.size,
+                    })
+        os.replace(tmp_path, shard_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return {
+        "name": shard_path.name,
+        "count": len(samples),
+        "size": shard_path.stat().st_size,
+        "members": members,
+    }
+
+
+def export_dataset(
+    input_dir: Path,
+    output_dir: Path,
+    shard_size_mb: int = 256,
+    max_count: int = 10000,
+    workers: int = 4
+) -> Tuple[int, int]:
+    """
+    データセットをシャードに出力
+
+    Args:
+        input_dir: 3_tagged ディレクトリ
+        output_dir: 出力ディレクトリ（4_dataset）
+        shard_size_mb: 1シャードの最大サイズ（MB）
+        max_count: 1シャードの最大サンプル数
+        workers: 並列書き込み数
+
+    Returns:
+        (サンプル数, シャード数) のタプル
+    """
+    samples, missing = collect_samples(input_dir)
+
+    for name in missing:
+        print(f"- {name}: タグファイルがないためスキップ")
+    for key, image_path, _ in samples:
+        if key != image_path.stem:
+            print(f"- {image_path.name}: サンプルのキーを {key} に変更")
+
+    if not samples:
+        print(f"エラー: {input_dir} に画像とタグファイルのペアが見つかりません")
+        return 0, 0
+
+    shards = plan_shards(samples, shard_size_mb * 1024 * 1024, max_count)
+
+    print(f"サンプル数: {len(samples)}")
+    print(f"シャード数: {len(shards)}（最大 {shard_size_mb}MB / {max_count}サンプル）")
+    print("-" * 50)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 以前の出力のうち、今回使わないシャードを削除
+    expected = {SHARD_PATTERN.format(i) for i in range(len(shards))}
+    for old in output_dir.glob("shard-*.tar"):
+        if old.name not in expected:
+            old.unlink()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(write_shard, output_dir / SHARD_PATTERN.format(i), shard)
+            for i, shard in enumerate(shards)
+        ]
+        shard_infos = []
+        for future in futures:
+            info = future.result()
+            print(f"✓ {info['name']}: {info['count']}サンプル, {info['size'] / 1024 / 1024:.1f}MB")
+            shard_infos.append(info)
+
+    index = {
+        "format": "webdataset",
+        "source": str(input_dir),
+        "count": len(samples),
+        "shards": shard_infos,
+    }
+    index_path = output_dir / INDEX_FILENAME
+    tmp_index = index_path.with_name(INDEX_FILENAME + '.tmp')
+    tmp_index.write_text(json.dumps(index, ensure_ascii=False, indent=1), encoding='utf-8')
+    os.replace(tmp_index, index_path)
+
+    print("-" * 50)
+    print(f"完了: {len(samples)}サンプルを{len(shards)}個のシャードに出力しました")
+    print(f"インデックス: {index_path}")
+
+    return len(samples), len(shards)
+
+
+def iter_shard(shard_path: Path) -> Iterator[Tuple[str, Dict[str, bytes]]]:
+    """
+    シャードを先頭から順に読み、サンプルを1つずつ返す（ストリーミング読み込み）
+
+    Args:
+        shard_path: tarファイルのパス
+
+    Yields:
+        (ベース名, {拡張子: 内容}) のタプル（例: ("img001", {"png": b"...", "txt": b"..."})）
+    """
+    current_key = None
+    current: Dict[str, bytes] = {}
+
+    # 'r|' はシーク無しの逐次読み込み（ネットワークストレージやパイプでも高速）
+    with tarfile.open(shard_path, 'r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            # キーは最初の "." まで（拡張子が .tar.gz のように複数でも同じキー）
+            key, _, ext = member.name.partition('.')
+            if key != current_key:
+                if current_key is not None:
+                    yield current_key, current
+                current_key = key
+                current = {}
+            current[ext] = tar.extractfile(member).read()
+
+    if current_key is not None:
+        yield current_key, current
+
+
+def iter_dataset(dataset_dir: Path) -> Iterator[Tuple[str, Dict[str, bytes]]]:
+    """
+    index.json に記録された全シャードを順に読む
+
+    Args:
+        dataset_dir: export_dataset の出力ディレクトリ
+
+    Yields:
+        (ベース名, {拡張子: 内容}) のタプル
+    """
+    index = json.loads((dataset_dir / INDEX_FILENAME).read_text(encoding='utf-8'))
+    for shard in index["shards"]:
+        yield from iter_shard(dataset_dir / shard["name"])
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='画像とタグファイルのペアをtarシャード（WebDataset形式）に出力',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  python scripts/export_dataset.py \\
+    --input projects/nasumiso_v1/3_tagged \\
+    --output projects/nasumiso_v1/4_dataset \\
+    --shard-size 256
+
+学習側（Colab など）での読み込み:
+  from export_dataset import iter_dataset
+  for key, sample in iter_dataset(Path("4_dataset")):
+      image_bytes, caption = sample["png"], sample["txt"].decode("utf-8")
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='入力ディレクトリのパス（3_tagged）'
+    )
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        required=True,
+        help='出力ディレクトリのパス（4_dataset）'
+    )
+
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=256,
+        help='1シャードの最大サイズ（MB、デフォルト: 256）'
+    )
+
+    parser.add_argument(
+        '--max-count',
+        type=int,
+        default=10000,
+        help='1シャードの最大サンプル数（デフォルト: 10000）'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='並列に書き込むシャード数（デフォルト: 4）'
+    )
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
+
+    # 入力ディレクトリの存在確認
+    if not input_dir.exists():
+        print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not input_dir.is_dir():
+        print(f"エラー: 入力パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.shard_size < 1 or args.max_count < 1:
+        print("エラー: --shard-size と --max-count は1以上を指定してください", file=sys.stderr)
+        sys.exit(1)
+
+    # 処理実行
+    count, _ = export_dataset(
+        input_dir,
+        output_dir,
+        args.shard_size,
+        args.max_count,
+        args.workers
+    )
+
+    sys.exit(0 if count > 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,101 +7,120 @@
 - 英語タグファイルを日本語に翻訳して確認用ファイルを生成
 - _jp.txt というサフィックスで保存
 - タグレビュー時に使用
+- 翻訳辞書は外部ファイル（config/tag_translations.csv）から読み込み、
+  変換済みの辞書（pickle）をキャッシュして次回以降は即座に読み込む
+- 元の .txt または翻訳辞書が変わったファイルだけを並列に再生成
+- アトミックな書き込み（--backup でジャーナルに記録）
 """
 
 import argparse
+import csv
+import hashlib
+import json
+import os
+import pickle
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
-
-
-# タグの日本語翻訳辞書
-TAG_TRANSLATIONS: Dict[str, str] = {
-    # キャラクター数
-    "1boy": "男の子1人",
-    "1girl": "女の子1人",
-    "2boys": "男の子2人",
-    "2girls": "女の子2人",
-    "multiple_boys": "複数の男の子",
-    "multiple_girls": "複数の女の子",
-    "solo": "単独",
-    "no_humans": "人物なし",
-
-    # 焦点
-    "male_focus": "男性中心",
-    "female_focus": "女性中心",
-
-    # 外見
-    "black_hair": "黒髪",
-    "short_hair": "短髪",
-    "long_hair": "長髪",
-    "blue_skin": "青い肌色",
-    "colored_skin": "色付きの肌",
-    "chibi": "ちびキャラ",
-
-    # 服装
-    "shirt": "シャツ",
-    "short_sleeves": "半袖",
-    "serafuku": "セーラー服",
-    "school_uniform": "制服",
-    "sailor_collar": "セーラーカラー",
-    "japanese_clothes": "和服",
-    "glasses": "眼鏡",
-
-    # 動作
-    "eating": "食べている",
-    "holding": "持っている",
-    "holding_food": "食べ物を持っている",
-    "chewing": "噛んでいる",
-    "open_mouth": "口を開けている",
-    "closed_eyes": "目を閉じている",
-    "looking_at_viewer": "こちらを見ている",
-    "smile": "笑顔",
-    "smiling": "微笑んでいる",
-
-    # アイテム
-    "food": "食べ物",
-    "bread": "パン",
-    "food_on_face": "顔に食べ物",
-    "monitor": "モニター",
-
-    # 背景
-    "green_background": "緑背景",
-    "white_background": "白背景",
-    "simple_background": "シンプルな背景",
-    "black_background": "黒背景",
-    "negative_space": "余白",
-
-    # 構図
-    "upper_body": "上半身",
-    "full_body": "全身",
-    "cropped_torso": "胴体クロップ",
-
-    # カラー
-    "green_sailor_collar": "緑のセーラーカラー",
-
-    # スタイル・品質
-    "nasumiso_style": "なすみそ風",
-    "simple_lineart": "シンプルな線画",
-    "masterpiece": "傑作",
-    "best_quality": "最高品質",
-    "high_quality": "高品質",
-
-    # その他
-    "general": "一般",
-    "sensitive": "センシティブ",
-    "comic": "コミック",
-    "monochrome": "モノクロ",
-    "greyscale": "グレースケール",
-}
-
-
-def translate_tags(tags: list[str]) -> list[str]:
+from typing import Dict, List, Optional, Tuple
+
+from tag_io import TagJournal, atomic_write_text, write_tag_file
+
+
+# デフォルトの翻訳辞書（リポジトリの config/ 以下）
+DEFAULT_DICT_PATH = Path(__file__).resolve().parent.parent / "config" / "tag_translations.csv"
+
+# 生成済みファイルの記録（タグディレクトリ内に作成）
+MANIFEST_FILENAME = ".jp_tags_manifest.json"
+
+# 翻訳辞書キャッシュの形式（変更したら上げる）
+CACHE_FORMAT = 1
+
+
+def _cache_path(dict_path: Path) -> Path:
+    """翻訳辞書キャッシュのパス（辞書と同じディレクトリの隠しファイル）"""
+    return dict_path.with_name(f".{dict_path.name}.pickle")
+
+
+def compile_translations(dict_path: Path) -> Tuple[Dict[str, str], str]:
+    """
+    翻訳辞書（CSV）を読み込んで辞書に変換
+
+    CSVの書式: 1行目はヘッダ（tag,japanese）、#で始まる行と空行は無視。
+    タグの空白はアンダースコアに統一する（"long hair" → "long_hair"）。
+
+    Args:
+        dict_path: 翻訳辞書CSVのパス
+
+    Returns:
+        ({英語タグ: 日本語}, 辞書のバージョン) のタプル
+    """
+    data = dict_path.read_bytes()
+    version = hashlib.sha1(data).hexdigest()[:12]
+
+    translations = {}
+    rows = csv.reader(data.decode('utf-8-sig').splitlines())
+    for row in rows:
+        if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+            continue
+        if len(row) < 2:
+            continue
+        tag, japanese = row[0].strip(), row[1].strip()
+        if (tag, japanese) == ('tag', 'japanese'):
+            continue
+        translations[tag.replace(' ', '_')] = japanese
+
+    return translations, version
+
+
+def load_translations(dict_path: Path = DEFAULT_DICT_PATH) -> Tuple[Dict[str, str], str]:
+    """
+    翻訳辞書を読み込む（CSVが変わっていなければpickleキャッシュを使用）
+
+    Args:
+        dict_path: 翻訳辞書CSVのパス
+
+    Returns:
+        ({英語タグ: 日本語}, 辞書のバージョン) のタプル
+    """
+    st = dict_path.stat()
+    source_key = (st.st_mtime_ns, st.st_size)
+    cache_path = _cache_path(dict_path)
+
+    try:
+        with cache_path.open('rb') as f:
+            cache = pickle.load(f)
+        if cache.get("format") == CACHE_FORMAT and cache.get("source") == source_key:
+            return cache["translations"], cache["version"]
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        pass
+
+    translations, version = compile_translations(dict_path)
+
+    try:
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        with tmp_path.open('wb') as f:
+            pickle.dump(
+                {"format": CACHE_FORMAT, "source": source_key, "version": version,
+                 "translations": translations},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # キャッシュが書けなくても翻訳はできる
+        pass
+
+    return translations, version
+
+
+def translate_tags(tags: list[str], translations: Dict[str, str]) -> list[str]:
     """
     タグのリストを日本語に翻訳
 
     Args:
         tags: 英語タグのリスト
+        translations: 翻訳辞書
 
     Returns:
         日本語タグのリスト（翻訳がない場合は元のタグ + "(原文)"）
@@ -109,34 +128,156 @@ def translate_tags(tags: list[str]) -> list[str]:
     translated = []
     for tag in tags:
         tag = tag.strip()
-        if tag in TAG_TRANSLATIONS:
-            translated.append(TAG_TRANSLATIONS[tag])
+        japanese = translations.get(tag) or translations.get(tag.replace(' ', '_'))
+        if japanese:
+            translated.append(japanese)
         else:
             translated.append(f"{tag}(原文)")
     return translated
 
 
-def generate_jp_file(txt_path: Path) -> None:
+def jp_path_for(txt_path: Path) -> Path:
+    """英語タグファイルに対応する日本語タグファイルのパス"""
+    return txt_path.parent / (txt_path.stem + '_jp.txt')
+
+
+def generate_jp_file(
+    txt_path: Path,
+    translations: Dict[str, str],
+    journal: Optional[TagJournal] = None
+) -> None:
     """
     英語タグファイルから日本語版を生成
 
     Args:
         txt_path: 英語タグファイルのパス
+        translations: 翻訳辞書
+        journal: 書き換え前の内容を記録するジャーナル（None の場合は記録しない）
     """
     # タグを読み込み
     content = txt_path.read_text(encoding='utf-8')
     tags = content.split(', ')
 
     # 日本語に翻訳
-    tags_jp = translate_tags(tags)
-
-    # 日本語ファイルを作成
-    jp_filename = txt_path.stem + '_jp.txt'
-    jp_filepath = txt_path.parent / jp_filename
+    tags_jp = translate_tags(tags, translations)
 
     # カンマ区切りで保存
     jp_content = ', '.join(tags_jp)
-    jp_filepath.write_text(jp_content, encoding='utf-8')
+    write_tag_file(jp_path_for(txt_path), jp_content, journal)
+
+
+def load_manifest(input_dir: Path) -> Dict:
+    """生成済みファイルの記録を読み込む（なければ空）"""
+    try:
+        return json.loads((input_dir / MANIFEST_FILENAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def scan_tag_files(input_dir: Path) -> Tuple[Dict[str, List[int]], set]:
+    """
+    英語タグファイルの更新時刻・サイズと、既存の _jp.txt を1回の走査で取得
+
+    Args:
+        input_dir: タグファイルがあるディレクトリ
+
+    Returns:
+        ({ファイル名: [更新時刻ns, サイズ]}, {既存の_jp.txtのファイル名}) のタプル
+    """
+    stats = {}
+    jp_names = set()
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith('.txt') or not entry.is_file():
+                continue
+            if name.endswith('_jp.txt'):
+                jp_names.add(name)
+            else:
+                st = entry.stat()
+                stats[name] = [st.st_mtime_ns, st.st_size]
+    return stats, jp_names
+
+
+def update_jp_files(
+    input_dir: Path,
+    translations: Dict[str, str],
+    version: str,
+    txt_files: Optional[List[Path]] = None,
+    force: bool = False,
+    workers: int = 4,
+    journal: Optional[TagJournal] = None
+) -> Tuple[List[Path], List[Path], List[Tuple[Path, Exception]]]:
+    """
+    元の .txt または翻訳辞書が変わったファイルだけ日本語版を再生成
+
+    Args:
+        input_dir: タグファイルがあるディレクトリ
+        translations: 翻訳辞書
+        version: 翻訳辞書のバージョン
+        txt_files: 対象の英語タグファイル（None の場合はディレクトリ内の全ファイル）
+        force: Trueの場合は変更の有無に関わらず再生成
+        workers: 並列処理数
+        journal: 書き換え前の内容を記録するジャーナル
+
+    Returns:
+        (生成したファイル, 変更がなくスキップしたファイル, (ファイル, エラー)のリスト) のタプル
+    """
+    manifest = load_manifest(input_dir)
+    recorded = manifest.get("files", {}) if manifest.get("dictionary") == version else {}
+
+    if txt_files is None:
+        stats, jp_names = scan_tag_files(input_dir)
+        txt_files = [input_dir / name for name in sorted(stats)]
+    else:
+        stats = {}
+        jp_names = set()
+        for txt_path in txt_files:
+            st = txt_path.stat()
+            stats[txt_path.name] = [st.st_mtime_ns, st.st_size]
+            if jp_path_for(txt_path).exists():
+                jp_names.add(jp_path_for(txt_path).name)
+
+    targets = []
+    skipped = []
+    for txt_path in txt_files:
+        name = txt_path.name
+        if (not force and recorded.get(name) == stats[name]
+                and name[:-len('.txt')] + '_jp.txt' in jp_names):
+            skipped.append(txt_path)
+        else:
+            targets.append(txt_path)
+
+    if not targets and manifest.get("dictionary") == version:
+        return [], skipped, []
+
+    generated = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(generate_jp_file, txt_path, translations, journal)
+            for txt_path in targets
+        ]
+        for txt_path, future in zip(targets, futures):
+            try:
+                future.result()
+                generated.append(txt_path)
+            except Exception as e:
+                errors.append((txt_path, e))
+                stats.pop(txt_path.name, None)
+
+    # 記録を更新（他のファイルの記録は残す）
+    files = dict(recorded)
+    for txt_path in generated + skipped:
+        files[txt_path.name] = stats[txt_path.name]
+    for txt_path, _ in errors:
+        files.pop(txt_path.name, None)
+    atomic_write_text(
+        input_dir / MANIFEST_FILENAME,
+        json.dumps({"dictionary": version, "files": files}, ensure_ascii=False)
+    )
+
+    return generated, skipped, errors
 
 
 def main():
@@ -146,7 +287,7 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 使用例:
-  # 3_tagged/内の全タグファイルを日本語化
+  # 3_tagged/内のタグファイルを日本語化（変更があったファイルのみ）
   python scripts/generate_jp_tags.py \\
     --input projects/nasumiso_v1/3_tagged
 
@@ -154,6 +295,12 @@ def main():
   python scripts/generate_jp_tags.py \\
     --input projects/nasumiso_v1/3_tagged \\
     --file img001.txt
+
+  # 別の翻訳辞書を使い、全ファイルを作り直す
+  python scripts/generate_jp_tags.py \\
+    --input projects/nasumiso_v1/3_tagged \\
+    --dict path/to/full_translations.csv \\
+    --force
         """
     )
 
@@ -170,10 +317,37 @@ def main():
         help='特定のファイル名（指定しない場合は全ファイル）'
     )
 
+    parser.add_argument(
+        '--dict',
+        type=str,
+        default=str(DEFAULT_DICT_PATH),
+        help='翻訳辞書CSVのパス（デフォルト: config/tag_translations.csv）'
+    )
+
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='変更がないファイルも再生成する'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help='並列処理数（デフォルト: CPU数、最大8）'
+    )
+
+    parser.add_argument(
+        '--backup',
+        action='store_true',
+        help='書き換え前の内容をジャーナルに記録する（tag_io.py --undo で取り消し可能）'
+    )
+
     args = parser.parse_args()
 
     # パスをPathオブジェクトに変換
     input_dir = Path(args.input)
+    dict_path = Path(args.dict)
 
     # ディレクトリの存在確認
     if not input_dir.exists():
@@ -184,31 +358,58 @@ def main():
         print(f"エラー: パスがディレクトリではありません: {input_dir}", file=sys.stderr)
         sys.exit(1)
 
-    # タグファイルを取得
+    if not dict_path.is_file():
+        print(f"エラー: 翻訳辞書が見つかりません: {dict_path}", file=sys.stderr)
+        sys.exit(1)
+
+    # タグファイルを取得（--file 指定がなければ全ファイル、_jp.txtは除外）
     if args.file:
         txt_files = [input_dir / args.file]
         if not txt_files[0].exists():
             print(f"エラー: ファイルが見つかりません: {txt_files[0]}", file=sys.stderr)
             sys.exit(1)
+        total = 1
     else:
-        txt_files = sorted(input_dir.glob('*.txt'))
-        # _jp.txtを除外
-        txt_files = [f for f in txt_files if not f.name.endswith('_jp.txt')]
+        txt_files = None
+        total = len(scan_tag_files(input_dir)[0])
 
-    if not txt_files:
+    if total == 0:
         print(f"エラー: {input_dir} にタグファイルが見つかりません", file=sys.stderr)
         sys.exit(1)
 
-    print(f"処理対象: {len(txt_files)}個のタグファイル\n")
-
-    for txt_file in txt_files:
-        generate_jp_file(txt_file)
-
-        jp_filename = txt_file.stem + '_jp.txt'
-        print(f"✓ {txt_file.name} → {jp_filename}")
-
-    print(f"\n完了: {len(txt_files)}個の日本語タグファイルを生成しました")
+    translations, version = load_translations(dict_path)
+
+    print(f"処理対象: {total}個のタグファイル")
+    print(f"翻訳辞書: {dict_path}（{len(translations)}語, バージョン {version}）\n")
+
+    journal = TagJournal(input_dir, 'generate_jp_tags') if args.backup else None
+
+    try:
+        generated, skipped, errors = update_jp_files(
+            input_dir,
+            translations,
+            version,
+            txt_files=txt_files,
+            force=args.force or bool(args.file),
+            workers=args.workers,
+            journal=journal
+        )
+    finally:
+        if journal is not None:
+            journal.close()
+
+    for txt_file in generated:
+        print(f"✓ {txt_file.name} → {jp_path_for(txt_file).name}")
+    for txt_file, e in errors:
+        print(f"✗ {txt_file.name}: エラー - {e}")
+
+    print(f"\n完了: {len(generated)}個の日本語タグファイルを生成しました（{len(skipped)}個は変更なし）")
     print(f"確認用ファイル: *_jp.txt")
+    if journal is not None:
+        print(f"ジャーナル: {journal.path}")
+
+    if errors:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+類似画像検索スクリプト（WD14 Tagger の埋め込みベクトル）
+
+機能:
+- WD14 Tagger の分類層直前（プーリング後）の出力を画像の埋め込みベクトルとして取り出す
+- 全画像のベクトルを float16 の行列ファイル（embeddings.npy）に保存し、メモリマップで読む
+  （2回目以降は追加・変更された画像だけを推論）
+- 基準画像に似た画像をコサイン類似度で検索
+  - 少数（既定では5万枚以下）: 全件との内積を一括計算（厳密）
+  - 多数: IVF（粗いクラスタ分割）+ PQ（直積量子化）の近似インデックスで候補を絞り、
+    候補だけ元のベクトルで再計算
+- データセット整理（重複・似た構図の確認）に使用
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from image_sources import get_image_files, open_image
+from tag_io import atomic_write_text
+from tag_stats import image_key
+
+
+# 埋め込みベクトルの保存ファイル（入力ディレクトリに作成）
+EMBEDDINGS_FILENAME = "embeddings.npy"
+EMBEDDINGS_META_FILENAME = "embeddings.json"
+IVFPQ_FILENAME = "embeddings_ivfpq.npz"
+
+# これ以下の枚数は近似インデックスを使わず全件を計算
+EXACT_SEARCH_LIMIT = 50000
+
+# 一度に計算する行数（メモリマップから読み込む単位）
+SEARCH_CHUNK_ROWS = 65536
+
+# k-means の学習に使う最大サンプル数（IVF / PQ）
+KMEANS_MAX_SAMPLES = 65536
+PQ_TRAIN_SAMPLES = 16384
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """行ごとにL2正規化（内積 = コサイン類似度になるように）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def save_embeddings(
+    output_dir: Path,
+    images: List[str],
+    stats: List[Tuple[int, int]],
+    vectors: np.ndarray
+) -> Path:
+    """
+    埋め込みベクトルを正規化して float16 の行列ファイルに保存
+
+    Args:
+        output_dir: 保存先ディレクトリ
+        images: 画像名のリスト（行の順序）
+        stats: 画像ごとの (更新時刻ns, サイズ)
+        vectors: (画像数, 次元数) の埋め込みベクトル
+
+    Returns:
+        行列ファイルのパス
+    """
+    matrix_path = output_dir / EMBEDDINGS_FILENAME
+    tmp_path = matrix_path.with_name(matrix_path.name + '.tmp')
+    vectors = np.asarray(vectors)
+
+    try:
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16, shape=vectors.shape)
+        for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+            matrix[start:start + SEARCH_CHUNK_ROWS] = normalize(vectors[start:start + SEARCH_CHUNK_ROWS])
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, matrix_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    meta = {"dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0, "images": images, "stats": stats}
+    atomic_write_text(output_dir / EMBEDDINGS_META_FILENAME, json.dumps(meta, ensure_ascii=False))
+    return matrix_path
+
+
+def load_embeddings(input_dir: Path) -> Optional[Tuple[List[str], List[Tuple[int, int]], np.ndarray]]:
+    """
+    保存済みの埋め込みベクトルをメモリマップで読み込む
+
+    Args:
+        input_dir: 埋め込みベクトルを保存したディレクトリ
+
+    Returns:
+        (画像名のリスト, 画像ごとの (更新時刻ns, サイズ), (画像数, 次元数) の行列) のタプル
+        （ファイルがない場合は None）
+    """
+    matrix_path = input_dir / EMBEDDINGS_FILENAME
+    meta_path = input_dir / EMBEDDINGS_META_FILENAME
+    if not matrix_path.exists() or not meta_path.exists():
+        return None
+    meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    matrix = np.load(matrix_path, mmap_mode='r')
+    return meta["images"], [tuple(stat) for stat in meta["stats"]], matrix
+
+
+def build_embeddings(
+    input_dir: Path,
+    batch_size: int = 8,
+    use_coreml: bool = False,
+    rescore: bool = False
+) -> Tuple[List[str], np.ndarray]:
+    """
+    全画像の埋め込みベクトルを用意（保存済みの行は再利用し、新しい画像だけ推論）
+
+    Args:
+        input_dir: 画像があるディレクトリ（保存先も同じ）
+        batch_size: 1回の推論でまとめて処理する画像数
+        use_coreml: CoreML高速化を使用するか
+        rescore: Trueの場合は保存済みの行を使わず全画像を推論
+
+    Returns:
+        (画像名のリスト, (画像数, 次元数) の行列) のタプル
+    """
+    image_files = get_image_files(input_dir)
+    keys = [image_key(source) for source in image_files]
+
+    cached = None if rescore else load_embeddings(input_dir)
+    cached_rows: Dict[str, int] = {}
+    if cached is not None:
+        current = dict(keys)
+        for row, (name, stat) in enumerate(zip(cached[0], cached[1])):
+            if current.get(name) == stat:
+                cached_rows[name] = row
+
+    missing = [i for i, (name, _) in enumerate(keys) if name not in cached_rows]
+    if not missing and cached is not None and len(cached_rows) == len(cached[0]):
+        return cached[0], cached[2]
+
+    new_vectors: Dict[int, np.ndarray] = {}
+    if missing:
+        # onnxruntime などの読み込みは推論が必要な場合のみ
+        from auto_caption import get_tagger
+
+        tagger = get_tagger(use_coreml=use_coreml, with_embeddings=True)
+        print(f"推論する画像: {len(missing)}個（保存済み: {len(cached_rows)}個）")
+        for start in range(0, len(missing), batch_size):
+            batch_indices = []
+            arrays = []
+            for i in missing[start:start + batch_size]:
+                try:
+                    with open_image(image_files[i]) as img:
+                        arrays.append(tagger._preprocess_image(img.convert('RGB')))
+                    batch_indices.append(i)
+                except Exception as e:
+                    print(f"✗ {image_files[i].name}: エラー - {e}")
+            if not arrays:
+                continue
+            _, embeddings = tagger.predict_with_embeddings(arrays)
+            for i, embedding in zip(batch_indices, embeddings):
+                new_vectors[i] = embedding
+            print(f"  {min(start + batch_size, len(missing))}/{len(missing)}")
+
+    # 入力の画像順に並べ直す（読み込めなかった画像は除外）
+    images = []
+    stats = []
+    rows = []
+    for i, (name, stat) in enumerate(keys):
+        if name in cached_rows:
+            # メモリマップから行をコピーして取り出す（下で同じファイルを置き換えるため）
+            rows.append(np.array(cached[2][cached_rows[name]], dtype=np.float32))
+        elif i in new_vectors:
+            rows.append(new_vectors[i])
+        else:
+            continue
+        images.append(name)
+        stats.append(stat)
+
+    # 開いたままのメモリマップがあると Windows では embeddings.npy を置き換えられない
+    del cached
+
+    if not rows:
+        return [], np.zeros((0, 0), dtype=np.float16)
+
+    matrix_path = save_embeddings(input_dir, images, stats, np.stack(rows))
+    print(f"✓ 埋め込みベクトルを保存しました: {matrix_path}（{len(images)}枚）")
+    return images, np.load(matrix_path, mmap_mode='r')
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, inner_product: bool) -> np.ndarray:
+    """各ベクトルに最も近いセントロイドの番号（内積最大 または ユークリッド距離最小）"""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    sq_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        # 部分ベクトル（列の一部）は連続配列にしないと行列積が極端に遅くなる
+        chunk = np.ascontiguousarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+        products = chunk @ centroids.T
+        if inner_product:
+            assign[start:start + len(chunk)] = products.argmax(axis=1)
+        else:
+            # |x - c|^2 = |x|^2 - 2x・c + |c|^2（|x|^2 は比較に不要）
+            assign[start:start + len(chunk)] = (sq_norms - 2 * products).argmin(axis=1)
+    return assign
+
+
+def kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = 10,
+    inner_product: bool = False,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    k-means でセントロイドを学習
+
+    Args:
+        vectors: (サンプル数, 次元数) の学習データ
+        k: クラスタ数
+        iterations: 反復回数
+        inner_product: Trueの場合は内積で割り当て、セントロイドを正規化（球面k-means）
+        seed: 乱数シード
+
+    Returns:
+        (k, 次元数) のセントロイド
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = _nearest_centroids(vectors, centroids, inner_product)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+
+        # クラスタごとの合計（割り当て順に並べて区間ごとに足す）
+        order = np.argsort(assign, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        # 空のクラスタはランダムな点で置き直す
+        if not filled.all():
+            centroids[~filled] = vectors[rng.choice(len(vectors), int((~filled).sum()), replace=False)]
+        if inner_product:
+            centroids = normalize(centroids)
+
+    return centroids
+
+
+def build_ivfpq(
+    matrix: np.ndarray,
+    nlist: Optional[int] = None,
+    subspaces: Optional[int] = None,
+    seed: int = 0
+) -> Dict[str, np.ndarray]:
+    """
+    IVF-PQ 近似インデックスを作成
+
+    ベクトルを nlist 個のクラスタに分け（IVF）、クラスタ中心からの差分を
+    subspaces 個の部分ベクトルごとに256種類のコードで表す（PQ、1ベクトル subspaces バイト）。
+
+    Args:
+        matrix: (画像数, 次元数) の正規化済み行列
+        nlist: クラスタ数（None の場合は √画像数）
+        subspaces: PQの分割数（None の場合は1部分あたり約8次元になる数）
+        seed: 乱数シード
+
+    Returns:
+        インデックス（save / search_ivfpq で使用する配列の辞書）
+    """
+    n, dim = matrix.shape
+    if nlist is None:
+        nlist = int(np.sqrt(n))
+    nlist = max(1, min(nlist, n))
+    if subspaces is None:
+        subspaces = max(1, dim // 8)
+    while dim % subspaces:
+        subspaces -= 1
+    sub_dim = dim // subspaces
+
+    rng = np.random.default_rng(seed)
+    # 学習データはクラスタあたり最大64点（それ以上増やしても精度はほぼ変わらない）
+    sample_ids = np.sort(rng.choice(n, min(n, 64 * max(nlist, 256), KMEANS_MAX_SAMPLES), replace=False))
+    sample = np.asarray(matrix[sample_ids], dtype=np.float32)
+
+    # 粗いクラスタ分割（球面k-means）
+    centroids = kmeans(sample, nlist, inner_product=True, seed=seed)
+    assign = _nearest_centroids(matrix, centroids, inner_product=True)
+
+    # クラスタ中心からの差分を部分ベクトルごとに量子化
+    residual_sample = (sample - centroids[assign[sample_ids]]).reshape(len(sample), subspaces, sub_dim)
+    # 部分ベクトルは8次元程度なので、コード帳の学習は一部のサンプルで十分
+    residual_sample = np.ascontiguousarray(residual_sample[:PQ_TRAIN_SAMPLES].transpose(1, 0, 2))
+    ksub = min(256, residual_sample.shape[1])
+    codebooks = np.stack([
+        kmeans(residual_sample[j], ksub, seed=seed + j)
+        for j in range(subspaces)
+    ])
+
+    codes = np.empty((n, subspaces), dtype=np.uint8)
+    for start in range(0, n, SEARCH_CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+        residual = (chunk - centroids[assign[start:start + len(chunk)]]).reshape(len(chunk), subspaces, sub_dim)
+        residual = np.ascontiguousarray(residual.transpose(1, 0, 2))
+        for j in range(subspaces):
+            codes[start:start + len(chunk), j] = _nearest_centroids(residual[j], codebooks[j], False)
+
+    # クラスタごとに連続して並べる（検索時はクラスタ単位でまとめて読む）
+    order = np.argsort(assign, kind='stable')
+    offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+
+    return {
+        "centroids": centroids,
+        "codebooks": codebooks.astype(np.float32),
+        "codes": codes[order],
+        "ids": order.astype(np.int64),
+        "offsets": offsets.astype(np.int64),
+    }
+
+
+def _source_signature(input_dir: Path) -> np.ndarray:
+    """インデックス作成元の行列ファイルの (更新時刻ns, サイズ)（古いインデックスの検出用）"""
+    st = (input_dir / EMBEDDINGS_FILENAME).stat()
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def save_ivfpq(input_dir: Path, index: Dict[str, np.ndarray]) -> Path:
+    """IVF-PQ インデックスを保存（一時ファイルに書いてからリネーム）"""
+    index_path = input_dir / IVFPQ_FILENAME
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    try:
+        with tmp_path.open('wb') as f:
+            np.savez(f, source=_source_signature(input_dir), **index)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return index_path
+
+
+def load_ivfpq(input_dir: Path) -> Optional[Dict[str, np.ndarray]]:
+    """保存済みの IVF-PQ インデックスを読み込む（ないか、行列ファイルより古い場合は None）"""
+    index_path = input_dir / IVFPQ_FILENAME
+    if not index_path.exists():
+        return None
+    with np.load(index_path) as data:
+        index = {key: data[key] for key in data.files}
+    if not np.array_equal(index.pop("source"), _source_signature(input_dir)):
+        return None
+    return index
+
+
+def search_exact(matrix: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    全件との内積を計算して上位k件を取得
+
+    Args:
+        matrix: (画像数, 次元数) の正規化済み行列（メモリマップ可）
+        query: 正規化済みのクエリベクトル
+        k: 取得件数
+
+    Returns:
+        (行番号の配列, 類似度の配列) のタプル（類似度の降順）
+    """
+    similarities = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), SEARCH_CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+        similarities[start:start + len(chunk)] = chunk @ query
+
+    k = min(k, len(similarities))
+    top = np.argpartition(-similarities, k - 1)[:k]
+    top = top[np.argsort(-similarities[top], kind='stable')]
+    return top, similarities[top]
+
+
+def search_ivfpq(
+    index: Dict[str, np.ndarray],
+    matrix: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    nprobe: int = 16,
+    rerank: int = 200
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    IVF-PQ インデックスで候補を絞り、候補だけ元のベクトルで類似度を計算し直す
+
+    Args:
+        index: build_ivfpq で作成したインデックス
+        matrix: (画像数, 次元数) の正規化済み行列（メモリマップ可）
+        query: 正規化済みのクエリベクトル
+        k: 取得件数
+        nprobe: 調べるクラスタ数
+        rerank: 元のベクトルで計算し直す候補数
+
+    Returns:
+        (行番号の配列, 類似度の配列) のタプル（類似度の降順）
+    """
+    centroids = index["centroids"]
+    codebooks = index["codebooks"]
+    offsets = index["offsets"]
+    subspaces, _, sub_dim = codebooks.shape
+
+    # クエリに近いクラスタを選ぶ
+    coarse = centroids @ query
+    nprobe = min(nprobe, len(centroids))
+    probes = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+
+    # 部分ベクトルごとに「クエリ・各コードの内積」の表を作り、候補の類似度を表引きの合計で近似
+    table = np.einsum('mkd,md->mk', codebooks, query.reshape(subspaces, sub_dim))
+    positions = np.concatenate([np.arange(offsets[p], offsets[p + 1]) for p in probes])
+    if len(positions) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    base = np.repeat(coarse[probes], offsets[probes + 1] - offsets[probes])
+    approx = base + table[np.arange(subspaces), index["codes"][positions]].sum(axis=1)
+
+    # 近似類似度の上位を元のベクトルで計算し直す
+    rerank = min(max(rerank, k), len(positions))
+    candidates = np.argpartition(-approx, rerank - 1)[:rerank]
+    ids = np.sort(index["ids"][positions[candidates]])
+    similarities = np.asarray(matrix[ids], dtype=np.float32) @ query
+
+    top = np.argsort(-similarities, kind='stable')[:k]
+    return ids[top], similarities[top]
+
+
+def embed_image(image_path: Path, use_coreml: bool = False) -> np.ndarray:
+    """
+    1枚の画像の埋め込みベクトルを計算（検索の基準画像用）
+
+    Args:
+        image_path: 画像ファイルのパス
+        use_coreml: CoreML高速化を使用するか
+
+    Returns:
+        正規化済みのベクトル
+    """
+    from auto_caption import get_tagger
+
+    tagger = get_tagger(use_coreml=use_coreml, with_embeddings=True)
+    with open_image(image_path) as img:
+        array = tagger._preprocess_image(img.convert('RGB'))
+    _, embeddings = tagger.predict_with_embeddings([array])
+    return normalize(embeddings[0])
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='WD14 Tagger の埋め込みベクトルで似た画像を検索',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 埋め込みベクトルを作成・更新（大量の画像では近似インデックスも作成）
+  python scripts/image_search.py build --input projects/nasumiso_v1/3_tagged
+
+  # データセット内の画像に似た画像を10件
+  python scripts/image_search.py query --input projects/nasumiso_v1/3_tagged img001.png
+
+  # データセット外の画像を基準にする
+  python scripts/image_search.py query --input projects/nasumiso_v1/3_tagged ~/Desktop/ref.png -k 20
+        """
+    )
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='画像があるディレクトリのパス（埋め込みベクトルもここに保存）'
+    )
+    common.add_argument(
+        '--use-coreml',
+        action='store_true',
+        help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
+    )
+
+    build_parser = subparsers.add_parser('build', parents=[common], help='埋め込みベクトルとインデックスを作成・更新')
+    build_parser.add_argument('--batch-size', type=int, default=8, help='1回の推論でまとめて処理する画像数（デフォルト: 8）')
+    build_parser.add_argument('--rescore', action='store_true', help='保存済みのベクトルを使わず全画像を推論し直す')
+    build_parser.add_argument(
+        '--index',
+        choices=['auto', 'exact', 'ivfpq'],
+        default='auto',
+        help=f'検索方式（auto: {EXACT_SEARCH_LIMIT}枚を超えたら ivfpq、デフォルト: auto）'
+    )
+    build_parser.add_argument('--nlist', type=int, default=None, help='IVFのクラスタ数（デフォルト: √画像数）')
+
+    query_parser = subparsers.add_parser('query', parents=[common], help='似た画像を検索')
+    query_parser.add_argument('reference', type=str, help='基準画像（データセット内の画像名 または 画像ファイルのパス）')
+    query_parser.add_argument('-k', type=int, default=10, help='表示件数（デフォルト: 10）')
+    query_parser.add_argument('--exact', action='store_true', help='近似インデックスがあっても全件を計算')
+    query_parser.add_argument('--nprobe', type=int, default=16, help='IVFで調べるクラスタ数（デフォルト: 16）')
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+
+    # ディレクトリの存在確認
+    if not input_dir.exists():
+        print(f"エラー: ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not input_dir.is_dir():
+        print(f"エラー: パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == 'build':
+        images, matrix = build_embeddings(
+            input_dir,
+            batch_size=max(1, args.batch_size),
+            use_coreml=args.use_coreml,
+            rescore=args.rescore
+        )
+        if not images:
+            print(f"エラー: {input_dir} に画像ファイルが見つかりません", file=sys.stderr)
+            sys.exit(1)
+
+        use_ivfpq = args.index == 'ivfpq' or (args.index == 'auto' and len(images) > EXACT_SEARCH_LIMIT)
+        index_path = input_dir / IVFPQ_FILENAME
+        if use_ivfpq:
+            if load_ivfpq(input_dir) is None or args.nlist is not None:
+                start_time = time.perf_counter()
+                index_path = save_ivfpq(input_dir, build_ivfpq(matrix, nlist=args.nlist))
+                print(f"✓ 近似インデックスを作成しました: {index_path}（{time.perf_counter() - start_time:.1f}秒）")
+        elif index_path.exists():
+            index_path.unlink()
+
+        print(f"完了: {len(images)}枚（{matrix.shape[1]}次元, 検索方式: {'ivfpq' if use_ivfpq else 'exact'}）")
+        return
+
+    loaded = load_embeddings(input_dir)
+    if loaded is None:
+        print(f"エラー: 埋め込みベクトルがありません。先に build を実行してください: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+    images, _, matrix = loaded
+
+    # 基準画像（データセット内の画像は保存済みのベクトルを使う）
+    self_row = images.index(args.reference) if args.reference in images else None
+    if self_row is not None:
+        query = np.asarray(matrix[self_row], dtype=np.float32)
+    else:
+        reference = Path(args.reference)
+        if not reference.is_file():
+            print(f"エラー: 基準画像が見つかりません: {reference}", file=sys.stderr)
+            sys.exit(1)
+        query = embed_image(reference, args.use_coreml)
+
+    index = None if args.exact else load_ivfpq(input_dir)
+    k = args.k + (1 if self_row is not None else 0)
+
+    start_time = time.perf_counter()
+    if index is not None:
+        rows, similarities = search_ivfpq(index, matrix, query, k, nprobe=args.nprobe)
+    else:
+        rows, similarities = search_exact(matrix, query, k)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    results = [(row, similarity) for row, similarity in zip(rows, similarities) if row != self_row]
+    for row, similarity in results[:args.k]:
+        print(f"{similarity:.4f}  {images[row]}")
+    print(f"{'ivfpq' if index is not None else 'exact'}: {len(images)}枚から検索（{elapsed_ms:.1f}ms）", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
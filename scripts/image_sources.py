@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像の取得元（ディレクトリ / zip・tarアーカイブ）
+
+機能:
+- ディレクトリまたはアーカイブ（.zip / .tar / .tar.gz など）から画像ファイルを列挙
+- アーカイブは展開せず、メンバーを1つずつ読み込んでPILで開く
+  （同時にメモリに載るのは1メンバー分のみ。読み込んだ内容は推論と出力の両方に使い回す）
+- アーカイブ内はパス順にソートし、連番が毎回同じになるようにする
+  （圧縮tarは後ろに戻ると先頭から展開し直すため、アーカイブ内の格納順のまま）
+- 別のフォルダにある同じファイル名は出力先で重ならないようにフォルダ名を付ける
+- macOS が付ける __MACOSX/ や ._ ファイルは除外
+"""
+
+import hashlib
+import io
+import shutil
+import tarfile
+import threading
+import zipfile
+from collections import Counter
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional, Union
+
+from PIL import Image
+
+
+# サポートする画像形式
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
+
+# サポートするアーカイブ形式
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+# 圧縮されたtar（シークできないため格納順に読む）
+COMPRESSED_TAR_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+# 1メンバーの最大サイズ（壊れた・悪意のあるアーカイブでメモリを使い切らないように）
+MAX_MEMBER_BYTES = 256 * 1024 * 1024
+
+
+def is_archive(path: Path) -> bool:
+    """アーカイブファイルかどうか"""
+    return path.is_file() and path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _decode_zip_name(info: zipfile.ZipInfo) -> str:
+    """
+    zipのファイル名を復元（UTF-8フラグのない日本語名はShift_JISとして読む）
+
+    Windowsで作られたzipはファイル名がcp932で、zipfileはcp437として読んでしまう。
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('cp932')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+class ArchiveImage:
+    """アーカイブ内の画像ファイル（Path と同じように name / stem / suffix を持つ）"""
+
+    # 開いたアーカイブを使い回す（メンバーごとに開き直さない）
+    _handles: Dict[Path, Union[zipfile.ZipFile, tarfile.TarFile]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, archive_path: Path, member: str, display_name: str, size: int):
+        """
+        Args:
+            archive_path: アーカイブファイルのパス
+            member: アーカイブ内のメンバー名（読み込み用）
+            display_name: 表示・出力用のメンバーパス
+            size: 展開後のサイズ（バイト）
+        """
+        self.archive_path = archive_path
+        self.member = member
+        self.display_name = display_name
+        self.size = size
+        self._set_name(PurePosixPath(display_name).name)
+
+    def _set_name(self, name: str) -> None:
+        """出力用のファイル名（name / stem / suffix）を設定"""
+        path = PurePosixPath(name)
+        self.name = path.name
+        self.stem = path.stem
+        self.suffix = path.suffix
+
+    def __str__(self) -> str:
+        return f"{self.archive_path}:{self.display_name}"
+
+    def __repr__(self) -> str:
+        return f"ArchiveImage({str(self)!r})"
+
+    def __lt__(self, other: 'ArchiveImage') -> bool:
+        return (str(self.archive_path), self.display_name) < (str(other.archive_path), other.display_name)
+
+    @classmethod
+    def _open_archive(cls, archive_path: Path) -> Union[zipfile.ZipFile, tarfile.TarFile]:
+        handle = cls._handles.get(archive_path)
+        if handle is None:
+            if archive_path.name.lower().endswith('.zip'):
+                handle = zipfile.ZipFile(archive_path)
+            else:
+                handle = tarfile.open(archive_path)
+            cls._handles[archive_path] = handle
+        return handle
+
+    def read_bytes(self) -> bytes:
+        """
+        メンバーの内容を読み込む
+
+        Returns:
+            メンバーの内容
+
+        Raises:
+            ValueError: サイズが MAX_MEMBER_BYTES を超える場合
+        """
+        if self.size > MAX_MEMBER_BYTES:
+            raise ValueError(f"ファイルが大きすぎます（{self.size}バイト）: {self}")
+
+        # zipfile / tarfile は同時読み込みに対応していないためロックする
+        with self._lock:
+            handle = self._open_archive(self.archive_path)
+            if isinstance(handle, zipfile.ZipFile):
+                with handle.open(self.member) as f:
+                    data = f.read(MAX_MEMBER_BYTES + 1)
+            else:
+                f = handle.extractfile(self.member)
+                data = f.read(MAX_MEMBER_BYTES + 1)
+
+        if len(data) > MAX_MEMBER_BYTES:
+            raise ValueError(f"ファイルが大きすぎます: {self}")
+        return data
+
+
+# 画像の取得元（通常のファイル または アーカイブ内のファイル）
+ImageSource = Union[Path, ArchiveImage]
+
+
+def _is_image_member(name: str) -> bool:
+    """アーカイブのメンバー名が対象の画像かどうか（macOSのメタデータは除外）"""
+    path = PurePosixPath(name)
+    if path.parts and path.parts[0] == '__MACOSX':
+        return False
+    if path.name.startswith('._'):
+        return False
+    return path.suffix in IMAGE_EXTENSIONS
+
+
+def _dedupe_names(images: List[ArchiveImage]) -> None:
+    """
+    別のフォルダにある同じファイル名の画像に、フォルダ名を付けた出力名を設定
+
+    出力先は1つのフォルダなので、a/001.png と b/001.png は a_001.png と b_001.png にする。
+    それでも重なる場合は末尾に連番を付ける。
+    """
+    counts = Counter(image.name for image in images)
+    if all(count == 1 for count in counts.values()):
+        return
+
+    used = {image.name for image in images if counts[image.name] == 1}
+    for image in images:
+        if counts[image.name] == 1:
+            continue
+        name = "_".join(PurePosixPath(image.display_name).parts)
+        candidate, number = name, 2
+        while candidate in used:
+            path = PurePosixPath(name)
+            candidate = f"{path.stem}_{number}{path.suffix}"
+            number += 1
+        used.add(candidate)
+        image._set_name(candidate)
+
+
+def get_archive_images(archive_path: Path) -> List[ArchiveImage]:
+    """
+    アーカイブ内の画像ファイルを取得（展開しない）
+
+    Args:
+        archive_path: アーカイブファイルのパス
+
+    Returns:
+        画像のリスト（アーカイブ内のパス順、圧縮tarは格納順）
+    """
+    images = []
+    if archive_path.name.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                display_name = _decode_zip_name(info)
+                if _is_image_member(display_name):
+                    images.append(ArchiveImage(archive_path, info.filename, display_name, info.file_size))
+    else:
+        with tarfile.open(archive_path) as tf:
+            for info in tf.getmembers():
+                if info.isfile() and _is_image_member(info.name):
+                    images.append(ArchiveImage(archive_path, info.name, info.name, info.size))
+
+    if not archive_path.name.lower().endswith(COMPRESSED_TAR_SUFFIXES):
+        images.sort()
+    _dedupe_names(images)
+    return images
+
+
+def get_image_files(input_path: Path) -> List[ImageSource]:
+    """
+    指定ディレクトリ（またはアーカイブ）から画像ファイルを取得
+
+    Args:
+        input_path: 入力ディレクトリまたはアーカイブファイルのパス
+
+    Returns:
+        画像ファイルのリスト（ソート済み）
+    """
+    if is_archive(input_path):
+        return get_archive_images(input_path)
+
+    image_files = [
+        f for f in input_path.iterdir()
+        if f.is_file() and f.suffix in IMAGE_EXTENSIONS
+    ]
+
+    # ファイル名でソート
+    return sorted(image_files)
+
+
+def content_hash(data: bytes) -> str:
+    """画像ファイルの内容のハッシュ（ファイル名の変更・コピーでは変わらないキャッシュのキー）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def read_archive_bytes(source: ImageSource) -> Optional[bytes]:
+    """
+    アーカイブ内の画像の内容を読み込む（通常のファイルは None）
+
+    圧縮tarは後ろに戻って読むと先頭から展開し直すため、
+    読み込んだ内容を open_image() と出力の書き込みに渡して1回の読み込みで済ませる。
+    """
+    if isinstance(source, ArchiveImage):
+        return source.read_bytes()
+    return None
+
+
+def open_image(source: ImageSource, data: Optional[bytes] = None) -> Image.Image:
+    """
+    画像を開く
+
+    Args:
+        source: 画像ファイルのパス、またはアーカイブ内の画像
+        data: 読み込み済みの内容（read_archive_bytes() の結果、None の場合は source から読む）
+
+    Returns:
+        PIL画像
+    """
+    if data is not None:
+        return Image.open(io.BytesIO(data))
+    if isinstance(source, ArchiveImage):
+        return Image.open(io.BytesIO(source.read_bytes()))
+    return Image.open(source)
+
+
+def source_size(source: ImageSource) -> int:
+    """画像ファイルのサイズ（バイト、アーカイブ内の画像は展開後のサイズ）"""
+    if isinstance(source, ArchiveImage):
+        return source.size
+    return source.stat().st_size
+
+
+def copy_image(source: ImageSource, dest: Path) -> None:
+    """
+    画像をそのままコピー（アーカイブ内の画像は内容を書き出す）
+
+    Args:
+        source: 画像ファイルのパス、またはアーカイブ内の画像
+        dest: コピー先のパス
+    """
+    if isinstance(source, ArchiveImage):
+        dest.write_bytes(source.read_bytes())
+    else:
+        shutil.copy2(source, dest)
+
+
+def is_valid_input(input_path: Path) -> bool:
+    """入力として使えるパス（ディレクトリまたはアーカイブ）かどうか"""
+    return input_path.is_dir() or is_archive(input_path)
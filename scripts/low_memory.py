@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+省メモリモードでのモデル読み込み
+
+機能:
+- ONNXモデルの重みを別ファイル（weights.bin）に書き出し、グラフだけのモデルから参照する
+  （重みはページ境界に揃えて配置し、onnxruntime がコピーせずメモリマップで直接使う）
+- メモリマップした重みは読み取り専用のため、複数のワーカープロセスで同じ物理メモリを共有できる
+- onnxruntime のCPUメモリアリーナ・メモリパターン・重みの事前パッキング（重みの複製）を無効化
+- 変換したモデルは config/.low_memory_model/ に保存し、次回から再利用
+- 単体で実行すると、通常モードと省メモリモードでワーカーを起動し、ワーカーごとのメモリ使用量を比較
+"""
+
+import argparse
+import contextlib
+import io
+import mmap
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 変換したモデルの保存先（元のモデルごとにサブディレクトリを作成）
+LOW_MEMORY_DIR = Path(__file__).resolve().parent.parent / "config" / ".low_memory_model"
+GRAPH_FILENAME = "model.onnx"
+EMBEDDING_GRAPH_FILENAME = "model_embeddings.onnx"
+WEIGHTS_FILENAME = "weights.bin"
+
+# これより小さい重みはグラフ内に残す（形状指定の定数など）
+MIN_EXTERNAL_BYTES = 1024
+
+
+def _cache_dir(model_path: str) -> Path:
+    """元のモデルに対応する保存先（モデルが更新されたら別のディレクトリになる）"""
+    stat = os.stat(model_path)
+    return LOW_MEMORY_DIR / f"{Path(model_path).stem}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def split_weights(model_path: str, output_dir: Path) -> None:
+    """
+    モデルの重みを weights.bin に書き出し、グラフだけのモデルを保存
+
+    各重みの開始位置をメモリマップの単位（ページ）に揃える。
+    揃っていない重みは onnxruntime がメモリにコピーしてしまうため。
+
+    Args:
+        model_path: 元のONNXモデルのパス
+        output_dir: 保存先ディレクトリ
+    """
+    # モデルの変換にのみ使用するため、必要になるまで読み込まない
+    import onnx
+    from onnx import numpy_helper
+
+    model = onnx.load(model_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    offset = 0
+    with open(output_dir / WEIGHTS_FILENAME, 'wb') as f:
+        for tensor in model.graph.initializer:
+            if tensor.data_type == onnx.TensorProto.STRING:
+                continue
+            data = numpy_helper.to_array(tensor).tobytes()
+            if len(data) < MIN_EXTERNAL_BYTES:
+                continue
+
+            padding = -offset % mmap.ALLOCATIONGRANULARITY
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(data)
+
+            for field in ('raw_data', 'float_data', 'int32_data', 'int64_data', 'double_data', 'uint64_data'):
+                tensor.ClearField(field)
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+            del tensor.external_data[:]
+            for key, value in (('location', WEIGHTS_FILENAME), ('offset', str(offset)), ('length', str(len(data)))):
+                entry = tensor.external_data.add()
+                entry.key = key
+                entry.value = value
+            offset += len(data)
+
+    onnx.save(model, str(output_dir / GRAPH_FILENAME))
+
+
+def prepare_low_memory_model(model_path: str, with_embeddings: bool = False) -> Path:
+    """
+    省メモリモード用のモデルを取得（なければ作成）
+
+    Args:
+        model_path: 元のONNXモデルのパス
+        with_embeddings: 埋め込みベクトルの出力を追加したモデルを使うか
+
+    Returns:
+        グラフだけのモデルのパス（重みは同じディレクトリの weights.bin）
+    """
+    cache_dir = _cache_dir(model_path)
+
+    if not (cache_dir / GRAPH_FILENAME).exists():
+        print("省メモリモード用にモデルを変換中（初回のみ）...")
+        # 途中で中断しても壊れたモデルが残らないよう、別名で作成してから置き換える
+        temp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        split_weights(model_path, temp_dir)
+        # 同じモデルの古い変換結果は削除
+        for old_dir in LOW_MEMORY_DIR.glob(f"{Path(model_path).stem}-*"):
+            if old_dir != temp_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        temp_dir.rename(cache_dir)
+        print(f"✓ 変換完了: {cache_dir}")
+
+    if not with_embeddings:
+        return cache_dir / GRAPH_FILENAME
+
+    embedding_path = cache_dir / EMBEDDING_GRAPH_FILENAME
+    if not embedding_path.exists():
+        import onnx
+
+        from auto_caption import add_embedding_output
+
+        # 重みは読み込まずにグラフだけを書き換える（weights.bin は共有）
+        model = onnx.load(str(cache_dir / GRAPH_FILENAME), load_external_data=False)
+        add_embedding_output(model)
+        temp_path = embedding_path.with_name(embedding_path.name + ".tmp")
+        temp_path.write_bytes(model.SerializeToString())
+        os.replace(temp_path, embedding_path)
+    return embedding_path
+
+
+def apply_low_memory_options(options):
+    """
+    SessionOptions を省メモリ向けに変更
+
+    Args:
+        options: onnxruntime.SessionOptions
+
+    Returns:
+        変更した SessionOptions
+    """
+    # 推論ごとの一時メモリを使い回すための確保（アリーナ・メモリパターン）をしない
+    options.enable_cpu_mem_arena = False
+    options.enable_mem_pattern = False
+    # 事前パッキングは重みを並べ替えた複製を作るため、メモリマップした重みをそのまま使う
+    options.add_session_config_entry('session.disable_prepacking', '1')
+    return options
+
+
+def memory_usage() -> Dict[str, Optional[float]]:
+    """
+    現在のプロセスのメモリ使用量（MB）
+
+    PSS は共有メモリを共有しているプロセス数で割った値で、共有の効果が分かる（Linuxのみ）。
+
+    Returns:
+        {"rss", "pss"} の辞書（取得できない値は None。Linux以外の rss は最大値で、Windowsでは取得しない）
+    """
+    usage: Dict[str, Optional[float]] = {"rss": None, "pss": None}
+    try:
+        with open('/proc/self/smaps_rollup', encoding='utf-8') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                if name in ('Rss', 'Pss'):
+                    usage[name.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        if sys.platform == 'win32':
+            return usage
+        # macOS などは最大常駐メモリのみ（macOS はバイト、Linux はKB単位）
+        import resource
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["rss"] = max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+    return usage
+
+
+def _worker(image_files, low_memory, use_coreml, batch_size, results, barrier) -> None:
+    """ワーカープロセス: 割り当てられた画像を推論し、全ワーカーが揃った時点のメモリ使用量を返す"""
+    from auto_caption import WD14Tagger
+    from image_sources import open_image
+
+    try:
+        # モデル読み込みの表示はワーカーの数だけ重複するため表示しない
+        with contextlib.redirect_stdout(io.StringIO()):
+            tagger = WD14Tagger(use_coreml=use_coreml, low_memory=low_memory)
+
+        start_time = time.perf_counter()
+        for start in range(0, len(image_files), batch_size):
+            arrays = []
+            for source in image_files[start:start + batch_size]:
+                with open_image(source) as img:
+                    arrays.append(tagger._preprocess_image(img.convert("RGB")))
+            tagger.predict_probabilities(arrays)
+        elapsed = time.perf_counter() - start_time
+    except Exception as e:
+        # 他のワーカーを待たせたままにしない
+        barrier.abort()
+        results.put((os.getpid(), 0, 0.0, {"error": str(e)}))
+        return
+
+    # 全ワーカーがモデルを読み込んだ状態で計測（共有されているメモリを正しく数えるため）
+    with contextlib.suppress(threading.BrokenBarrierError):
+        barrier.wait()
+    results.put((os.getpid(), len(image_files), elapsed, memory_usage()))
+    with contextlib.suppress(threading.BrokenBarrierError):
+        barrier.wait()
+
+
+def run_workers(
+    image_files: List,
+    workers: int,
+    low_memory: bool,
+    use_coreml: bool = False,
+    batch_size: int = 4
+) -> List[Dict]:
+    """
+    ワーカープロセスを起動して画像を分担して推論し、ワーカーごとのメモリ使用量を取得
+
+    ワーカーは fork で起動し、それぞれがモデルを読み込む
+    （onnxruntime のセッションは fork をまたいで使えないため）。
+    省メモリモードでは全ワーカーが同じ weights.bin のメモリマップを共有する。
+
+    Args:
+        image_files: 画像のリスト
+        workers: ワーカー数
+        low_memory: 省メモリモードで読み込むか
+        use_coreml: CoreML高速化を使用するか
+        batch_size: 1回の推論でまとめる画像数
+
+    Returns:
+        ワーカーごとの {"pid", "images", "seconds", "rss", "pss"} のリスト
+        （失敗したワーカーは {"pid", "images", "seconds", "error"}）
+    """
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    barrier = context.Barrier(workers)
+    processes = [
+        context.Process(
+            target=_worker,
+            args=(image_files[i::workers], low_memory, use_coreml, batch_size, results, barrier)
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    stats = []
+    for _ in processes:
+        pid, images, seconds, usage = results.get()
+        stats.append({"pid": pid, "images": images, "seconds": seconds, **usage})
+    for process in processes:
+        process.join()
+    return sorted(stats, key=lambda s: s["pid"])
+
+
+def print_comparison(results: Dict[str, List[Dict]]) -> None:
+    """
+    モードごとのワーカーのメモリ使用量を表示
+
+    Args:
+        results: {モード名: run_workers() の結果} の辞書
+    """
+    def mb(value: Optional[float]) -> str:
+        return f"{value:>8.0f}MB" if value is not None else f"{'-':>10}"
+
+    print(f"{'mode':<12}{'pid':>8}{'images':>8}{'seconds':>9}{'RSS':>10}{'PSS':>10}")
+    for mode, stats in results.items():
+        for s in stats:
+            if "error" in s:
+                print(f"✗ {mode:<10}{s['pid']:>8}: エラー - {s['error']}")
+                continue
+            print(f"{mode:<12}{s['pid']:>8}{s['images']:>8}{s['seconds']:>9.1f}{mb(s['rss'])}{mb(s['pss'])}")
+
+    print("-" * 50)
+    for mode, stats in results.items():
+        stats = [s for s in stats if "error" not in s]
+        values = [s["pss"] if s["pss"] is not None else s["rss"] for s in stats]
+        if not values or None in values:
+            continue
+        label = "PSS" if stats[0]["pss"] is not None else "RSS"
+        print(f"{mode}: ワーカーあたり平均 {sum(values) / len(values):.0f}MB（{label}）, 合計 {sum(values):.0f}MB")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='通常モードと省メモリモードでワーカーごとのメモリ使用量を比較',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  python scripts/low_memory.py --input projects/nasumiso_v1/2_processed --workers 4
+
+  # 省メモリモードでタグ付け
+  python scripts/auto_caption.py --input projects/nasumiso_v1/2_processed \\
+    --output projects/nasumiso_v1/3_tagged --low-memory
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='推論に使う画像のディレクトリ（またはzip/tarアーカイブ）のパス'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='ワーカープロセス数（デフォルト: 4）'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=4,
+        help='1回の推論でまとめる画像数（デフォルト: 4）'
+    )
+
+    parser.add_argument(
+        '--use-coreml',
+        action='store_true',
+        help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
+    )
+
+    args = parser.parse_args()
+
+    from image_sources import get_image_files, is_valid_input
+
+    input_dir = Path(args.input)
+    if not input_dir.exists() or not is_valid_input(input_dir):
+        print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print("エラー: この環境ではワーカーを fork で起動できません", file=sys.stderr)
+        sys.exit(1)
+
+    image_files = get_image_files(input_dir)
+    if not image_files:
+        print(f"エラー: {input_dir} に画像ファイルが見つかりません", file=sys.stderr)
+        sys.exit(1)
+
+    workers = max(1, args.workers)
+    print(f"処理対象: {len(image_files)}枚の画像, ワーカー数: {workers}")
+    print("-" * 50)
+
+    # 変換が必要な場合はワーカーの起動前に1回だけ行う
+    from auto_caption import MODEL_FILENAME, MODEL_ID
+    from huggingface_hub import hf_hub_download
+    prepare_low_memory_model(hf_hub_download(repo_id=MODEL_ID, filename=MODEL_FILENAME))
+
+    results = {}
+    for mode, low_memory in (('default', False), ('low-memory', True)):
+        print(f"{mode} で実行中...")
+        results[mode] = run_workers(image_files, workers, low_memory, args.use_coreml, max(1, args.batch_size))
+
+    print("-" * 50)
+    print_comparison(results)
+
+    if any("error" in stats for mode_stats in results.values() for stats in mode_stats):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
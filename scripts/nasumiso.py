@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+なすみそクリエイターの共通コマンド
+
+機能:
+- 各スクリプトをサブコマンドとして1つのコマンドから実行
+  （例: python scripts/nasumiso.py caption --input ... --output ...）
+- 選んだサブコマンドのスクリプトだけを読み込む
+  （add-tag / jp-tags などは onnxruntime・pandas などを読み込まないので即座に起動）
+- Python から使う場合は scripts/ を import パスに追加し、各スクリプトの関数を直接呼ぶ。
+  auto_caption.get_tagger() で読み込んだモデルは同じプロセス内で使い回される。
+
+    import sys
+    sys.path.insert(0, "scripts")
+    from auto_caption import get_tagger, process_images
+
+    get_tagger(use_coreml=True)   # モデルの読み込みは1回だけ
+    process_images(Path("projects/a/2_processed"), Path("projects/a/3_tagged"), use_coreml=True)
+    process_images(Path("projects/b/2_processed"), Path("projects/b/3_tagged"), use_coreml=True)
+"""
+
+import argparse
+import importlib
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+
+# サブコマンド名: (スクリプトのモジュール名, 説明)
+COMMANDS = {
+    'prepare': ('prepare_images', '画像の前処理（リサイズ・クロップ・連番リネーム）'),
+    'caption': ('auto_caption', 'WD14 Tagger で自動タグ付け'),
+    'prepare-caption': ('prepare_and_caption', '前処理とタグ付けを一括実行'),
+    'batch-caption': ('batch_caption', '複数プロジェクトをまとめてタグ付け'),
+    'add-tag': ('add_common_tag', '全タグファイルに共通タグを追加'),
+    'edit': ('edit_tags', 'タグの一括編集（置換・削除・並べ替えなど）'),
+    'jp-tags': ('generate_jp_tags', '日本語タグファイル（_jp.txt）を生成'),
+    'index': ('tag_index', 'タグ検索インデックスの作成・検索'),
+    'undo': ('tag_io', '--backup 付きで実行したタグ書き込みを取り消す'),
+    'validate': ('validate_dataset', '学習用データセット（画像とタグファイル）を検証'),
+    'contact-sheet': ('contact_sheet', 'タグ確認用のサムネイル一覧（HTML）を作成'),
+    'export': ('export_dataset', '学習用データセットをtarシャードに出力'),
+    'watch': ('watch_tagged', 'タグディレクトリを監視して自動更新'),
+    'stats': ('tag_stats', 'しきい値スイープ・タグ頻度の分析'),
+    'diff': ('caption_diff', '2つのタグ付け結果（タグディレクトリ / スコア行列）を比較'),
+    'search': ('image_search', '埋め込みベクトルで似た画像を検索'),
+    'benchmark': ('benchmark_coreml', 'CoreML高速化のベンチマーク'),
+    'low-memory': ('low_memory', '省メモリモードのメモリ使用量を比較'),
+    'tensor-cache': ('tensor_cache', '前処理済み画像のキャッシュを確認・削除'),
+}
+
+
+def run_command(command: str, args: List[str]) -> None:
+    """
+    サブコマンドのスクリプトを読み込んで実行
+
+    Args:
+        command: サブコマンド名
+        args: スクリプトに渡す引数
+    """
+    module_name, _ = COMMANDS[command]
+    # スクリプトの使い方表示が「nasumiso.py <サブコマンド>」になるようにする
+    sys.argv = [f"{Path(sys.argv[0]).name} {command}", *args]
+    module = importlib.import_module(module_name)
+    module.main()
+
+
+def main(argv: Optional[List[str]] = None):
+    """メイン関数"""
+    command_list = "\n".join(f"  {name:<16}{description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description='なすみそクリエイターの共通コマンド',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+サブコマンド:
+{command_list}
+
+使用例:
+  python scripts/nasumiso.py caption --input projects/nasumiso_v1/2_processed \\
+    --output projects/nasumiso_v1/3_tagged
+  python scripts/nasumiso.py add-tag --input projects/nasumiso_v1/3_tagged --tag nasumiso_style
+
+  # サブコマンドごとのオプション
+  python scripts/nasumiso.py caption --help
+        """
+    )
+
+    parser.add_argument(
+        'command',
+        choices=COMMANDS,
+        metavar='COMMAND',
+        help='サブコマンド（下の一覧を参照）'
+    )
+
+    parser.add_argument(
+        'args',
+        nargs=argparse.REMAINDER,
+        help='サブコマンドに渡す引数'
+    )
+
+    args = parser.parse_args(argv)
+    run_command(args.command, args.args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime の実行設定の自動調整（オートチューニング）
+
+機能:
+- サンプル画像で、スレッド数（intra / inter）・実行モード → バッチサイズ → グラフ最適化レベルの順に
+  1項目ずつ短時間試し、最も速い設定を選ぶ（全組み合わせは試さず、遅くなった時点で打ち切る）
+- 選んだ設定はマシンごとにキャッシュ（config/.ort_tuning.json）し、次回から自動で使用
+- マシン名・実行プロバイダー・onnxruntime のバージョン・CPU数が同じ場合のみ再利用
+- auto_caption.py から使用（--retune で調整し直し、--no-autotune で無効化）
+"""
+
+import json
+import os
+import platform
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tag_io import atomic_write_text
+
+
+# 調整結果のキャッシュ（マシンごとのキーで複数台分を保存）
+TUNING_CACHE_PATH = Path(__file__).resolve().parent.parent / "config" / ".ort_tuning.json"
+
+# 試すバッチサイズとグラフ最適化レベル
+BATCH_SIZES = (1, 4, 8)
+OPTIMIZATION_LEVELS = ('all', 'extended', 'basic')
+
+# スレッド設定を比べるときのバッチサイズ
+THREAD_BATCH_SIZE = 4
+
+# 1つの設定を計測する最短時間（秒）
+MEASURE_SECONDS = 0.5
+
+
+def host_key(providers: List[str], model_id: str) -> str:
+    """
+    キャッシュのキー（設定を使い回せる条件）
+
+    Args:
+        providers: 実行プロバイダーのリスト
+        model_id: モデルID
+
+    Returns:
+        マシン名・プロバイダー・onnxruntime のバージョン・CPU数・モデルを含むキー
+    """
+    import onnxruntime as ort
+
+    return "|".join([
+        socket.gethostname(),
+        platform.machine(),
+        f"cpu{os.cpu_count()}",
+        f"ort{ort.__version__}",
+        "+".join(providers),
+        model_id,
+    ])
+
+
+def load_cached_config(key: str) -> Optional[Dict]:
+    """保存済みの設定を取得（ない場合は None）"""
+    if not TUNING_CACHE_PATH.exists():
+        return None
+    try:
+        cache = json.loads(TUNING_CACHE_PATH.read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return None
+    return cache.get(key)
+
+
+def save_cached_config(key: str, config: Dict) -> None:
+    """設定を保存（他のマシンの設定は残す）"""
+    cache = {}
+    if TUNING_CACHE_PATH.exists():
+        try:
+            cache = json.loads(TUNING_CACHE_PATH.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError):
+            cache = {}
+    cache[key] = config
+    TUNING_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(TUNING_CACHE_PATH, json.dumps(cache, ensure_ascii=False, indent=1))
+
+
+def make_session_options(config: Optional[Dict]):
+    """
+    設定から onnxruntime.SessionOptions を作成
+
+    Args:
+        config: {"intra_threads", "inter_threads", "parallel", "optimization"} の辞書
+                （None の場合は onnxruntime のデフォルト）
+
+    Returns:
+        onnxruntime.SessionOptions
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if config is None:
+        return options
+
+    levels = {
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    options.graph_optimization_level = levels[config["optimization"]]
+    options.intra_op_num_threads = config["intra_threads"]
+    options.inter_op_num_threads = config["inter_threads"]
+    options.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if config["parallel"] else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    return options
+
+
+def thread_candidates() -> List[Tuple[int, int, bool]]:
+    """
+    試すスレッド設定
+
+    Returns:
+        (intra スレッド数, inter スレッド数, 並列実行モードか) のリスト
+    """
+    cpus = os.cpu_count() or 1
+    intra_counts = sorted({cpus, max(1, cpus // 2), min(4, cpus)}, reverse=True)
+    candidates = [(intra, 1, False) for intra in intra_counts]
+    # 並列実行モード（独立したノードを同時に実行）はCPUが多い場合のみ試す
+    if cpus >= 4:
+        candidates.append((max(1, cpus // 2), 2, True))
+    return candidates
+
+
+def measure(session, input_name: str, output_name: str, batch: np.ndarray) -> float:
+    """
+    1つのバッチサイズでの処理速度を計測
+
+    Args:
+        session: onnxruntime.InferenceSession
+        input_name: 入力名
+        output_name: 出力名
+        batch: (バッチサイズ, H, W, C) の入力
+
+    Returns:
+        1秒あたりの処理枚数
+    """
+    # 1回目は初期化を含むため計測しない
+    session.run([output_name], {input_name: batch})
+
+    runs = 0
+    start_time = time.perf_counter()
+    while True:
+        session.run([output_name], {input_name: batch})
+        runs += 1
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= MEASURE_SECONDS and runs >= 2:
+            return runs * len(batch) / elapsed
+
+
+def autotune(
+    create_session: Callable,
+    sample_arrays: List[np.ndarray],
+    batch_sizes: Tuple[int, ...] = BATCH_SIZES
+) -> Dict:
+    """
+    サンプル画像で設定を順に試し、最も速い設定を選ぶ
+
+    全組み合わせは試さず、1項目ずつ決める（セッションの作成と計測の回数を抑える）。
+    1. スレッド設定: バッチサイズ THREAD_BATCH_SIZE・グラフ最適化最大で比べる
+       （スレッドを減らして遅くなったらそれ以上は減らさない）
+    2. バッチサイズ: 選んだスレッド設定のセッションのまま比べる
+    3. グラフ最適化レベル: 下げて遅くなったらそれ以上は下げない
+
+    Args:
+        create_session: SessionOptions を受け取り InferenceSession を返す関数
+        sample_arrays: _preprocess_image() の出力 (1, H, W, C) のリスト
+        batch_sizes: 試すバッチサイズ
+
+    Returns:
+        {"batch_size", "intra_threads", "inter_threads", "parallel", "optimization",
+         "images_per_second"} の辞書
+    """
+    samples = np.concatenate(sample_arrays, axis=0)
+
+    def batch_of(size: int) -> np.ndarray:
+        # サンプルが足りない場合は繰り返して埋める
+        return samples[np.arange(size) % len(samples)]
+
+    def try_config(intra: int, inter: int, parallel: bool, optimization: str, size: int) -> Tuple[Dict, object, float]:
+        config = {
+            "intra_threads": intra,
+            "inter_threads": inter,
+            "parallel": parallel,
+            "optimization": optimization,
+            "batch_size": size,
+        }
+        session = create_session(make_session_options(config))
+        speed = measure_config(session, config)
+        return config, session, speed
+
+    def measure_config(session, config: Dict) -> float:
+        input_name = session.get_inputs()[0].name
+        output_name = session.get_outputs()[0].name
+        speed = measure(session, input_name, output_name, batch_of(config["batch_size"]))
+        config["images_per_second"] = round(speed, 2)
+        print(f"  intra={config['intra_threads']} inter={config['inter_threads']} "
+              f"{'parallel' if config['parallel'] else 'sequential'} opt={config['optimization']} "
+              f"バッチ{config['batch_size']}: {speed:.2f}枚/秒")
+        return speed
+
+    # 1. スレッド設定（多い順に試し、減らして遅くなったら打ち切る。並列実行モードは別に1回）
+    thread_size = min(THREAD_BATCH_SIZE, max(batch_sizes))
+    best = None
+    slowed = False
+    for intra, inter, parallel in thread_candidates():
+        if slowed and not parallel:
+            continue
+        result = try_config(intra, inter, parallel, OPTIMIZATION_LEVELS[0], thread_size)
+        if best is None or result[2] > best[2]:
+            best = result
+        elif not parallel:
+            slowed = True
+    config, session, speed = best
+
+    # 2. バッチサイズ（セッションは作り直さない）
+    for size in batch_sizes:
+        if size == thread_size:
+            continue
+        candidate = {**config, "batch_size": size}
+        candidate_speed = measure_config(session, candidate)
+        if candidate_speed > speed:
+            config, speed = candidate, candidate_speed
+    del session, best
+
+    # 3. グラフ最適化レベル（下げて遅くなったら打ち切る）
+    for optimization in OPTIMIZATION_LEVELS[1:]:
+        candidate, _, candidate_speed = try_config(
+            config["intra_threads"], config["inter_threads"], config["parallel"], optimization, config["batch_size"]
+        )
+        if candidate_speed <= speed:
+            break
+        config, speed = candidate, candidate_speed
+
+    config["images_per_second"] = round(speed, 2)
+    return config
+
+
+def tuned_config(
+    key: str,
+    create_session: Callable,
+    load_samples: Callable[[], List[np.ndarray]],
+    retune: bool = False
+) -> Optional[Dict]:
+    """
+    保存済みの設定を取得し、なければ（または retune=True の場合）調整して保存
+
+    Args:
+        key: host_key() で作成したキー
+        create_session: SessionOptions を受け取り InferenceSession を返す関数
+        load_samples: サンプル画像の前処理済み配列を返す関数（調整が必要な場合のみ呼ぶ）
+        retune: Trueの場合は保存済みの設定を使わず調整し直す
+
+    Returns:
+        設定の辞書（サンプル画像を1枚も読み込めなかった場合は None）
+    """
+    config = None if retune else load_cached_config(key)
+    if config is not None:
+        return config
+
+    print("実行設定を調整中（このマシンで初回のみ）...")
+    start_time = time.perf_counter()
+    samples = load_samples()
+    if not samples:
+        print("警告: 調整用の画像を読み込めなかったため、既定の実行設定を使用します", file=sys.stderr)
+        return None
+    config = autotune(create_session, samples)
+    config["tuned_at"] = time.strftime('%Y-%m-%d %H:%M:%S')
+    save_cached_config(key, config)
+    print(f"✓ 調整完了（{time.perf_counter() - start_time:.1f}秒）: 設定を保存しました: {TUNING_CACHE_PATH}")
+    return config
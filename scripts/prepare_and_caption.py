@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+前処理＋自動タグ付けの一括実行スクリプト
+
+機能:
+- 元画像を1回だけデコードし、学習用の正方形画像（512x512）と
+  WD14 Tagger用の入力（448x448）を同じ画像から作成
+- タグ付けはまとめてバッチ推論
+- 画像と.txtを 3_tagged/ に直接出力（2_processed/ を経由しない）
+  （画像はタグが付いてから保存し、タグのない画像を残さない）
+- 入力はディレクトリのほか、zip/tarアーカイブも展開せずに直接読み込み可能
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+from auto_caption import WD14Tagger, get_tagger
+from image_sources import get_image_files, is_valid_input, open_image
+from prepare_images import resize_and_crop
+from tag_io import atomic_write_text
+
+
+def write_tag_files(
+    tagger: WD14Tagger,
+    pending: List[Tuple[int, str, Image.Image, np.ndarray]],
+    output_dir: Path,
+    total: int
+) -> Tuple[int, int]:
+    """
+    溜めた入力をバッチ推論し、学習用画像とタグファイルを書き出す
+
+    書き込みに失敗した画像はスキップに数え、書きかけの画像は削除する。
+
+    Args:
+        tagger: WD14Taggerインスタンス
+        pending: (連番, 出力ファイル名, 学習用画像, 前処理済み配列) のリスト
+        output_dir: 出力ディレクトリ
+        total: 全画像数（表示用）
+
+    Returns:
+        (成功数, スキップ数) のタプル
+    """
+    try:
+        results = tagger.predict_arrays([array for _, _, _, array in pending])
+    except Exception as e:
+        for idx, output_filename, _, _ in pending:
+            print(f"✗ [{idx:02d}/{total}] {output_filename}: 推論エラー - {e}")
+        return 0, len(pending)
+
+    success_count = 0
+    skip_count = 0
+    for (idx, output_filename, processed, _), tag_scores in zip(pending, results):
+        tags = list(tag_scores.keys())
+        output_image = output_dir / output_filename
+
+        try:
+            # 学習用画像をPNG形式で保存し、タグを.txtファイルに保存（画像と同じベース名）
+            processed.save(output_image, 'PNG', optimize=True)
+            output_txt = output_dir / f"{Path(output_filename).stem}.txt"
+            atomic_write_text(output_txt, ", ".join(tags))
+        except Exception as e:
+            output_image.unlink(missing_ok=True)
+            print(f"✗ [{idx:02d}/{total}] {output_filename}: 書き込みエラー - {e}")
+            skip_count += 1
+            continue
+
+        print(f"✓ [{idx:02d}/{total}] {output_filename}（タグ数: {len(tags)}）")
+        success_count += 1
+
+    return success_count, skip_count
+
+
+def process_images(
+    input_dir: Path,
+    output_dir: Path,
+    target_size: int = 512,
+    threshold: float = 0.35,
+    batch_size: int = 8,
+    use_coreml: bool = False
+) -> Tuple[int, int]:
+    """
+    元画像を前処理してタグ付けまで一括で行う
+
+    Args:
+        input_dir: 元画像のディレクトリ（1_raw_images）
+        output_dir: 出力ディレクトリ（3_tagged）
+        target_size: 学習用画像のサイズ（デフォルト: 512）
+        threshold: タグの信頼度しきい値（デフォルト: 0.35）
+        batch_size: 1回の推論でまとめる画像数（デフォルト: 8）
+        use_coreml: CoreML高速化を使用するか（デフォルト: False）
+
+    Returns:
+        (成功数, スキップ数) のタプル
+    """
+    # 出力ディレクトリが存在しない場合は作成
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 画像ファイルを取得
+    image_files = get_image_files(input_dir)
+
+    if not image_files:
+        print(f"エラー: {input_dir} に画像ファイルが見つかりません")
+        return 0, 0
+
+    total = len(image_files)
+    print(f"処理対象: {total}枚の画像")
+    print(f"出力サイズ: {target_size}x{target_size}")
+    print(f"バッチサイズ: {batch_size}")
+    print("-" * 50)
+
+    # WD14 Taggerを初期化
+    tagger = get_tagger(threshold=threshold, use_coreml=use_coreml)
+
+    success_count = 0
+    skip_count = 0
+    pending: List[Tuple[int, str, Image.Image, np.ndarray]] = []
+
+    for idx, image_path in enumerate(image_files, start=1):
+        # 出力ファイル名（連番: img001.png, img002.png, ...）
+        output_filename = f"img{idx:03d}.png"
+
+        try:
+            # 画像を開く（デコードはここでの1回のみ）
+            with open_image(image_path) as img:
+                # RGBAまたはRGBに変換（モード統一）
+                if img.mode not in ('RGB', 'RGBA'):
+                    img = img.convert('RGB')
+
+                # 学習用画像: リサイズ・クロップ（保存はタグ付け後）
+                processed = resize_and_crop(img, target_size)
+
+            # Tagger用入力: 学習用画像から作成
+            # （従来の prepare_images.py → auto_caption.py と同じ入力になる）
+            pending.append((idx, output_filename, processed, tagger._preprocess_image(processed.convert('RGB'))))
+
+        except Exception as e:
+            print(f"✗ [{idx:02d}/{total}] {image_path.name}: エラー - {e}")
+            skip_count += 1
+            continue
+
+        # バッチが溜まったら推論
+        if len(pending) >= batch_size:
+            success, skip = write_tag_files(tagger, pending, output_dir, total)
+            success_count += success
+            skip_count += skip
+            pending = []
+
+    # 残りを推論
+    if pending:
+        success, skip = write_tag_files(tagger, pending, output_dir, total)
+        success_count += success
+        skip_count += skip
+
+    print("-" * 50)
+    print(f"完了: {success_count}枚成功, {skip_count}枚スキップ")
+
+    return success_count, skip_count
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='元画像の前処理と自動タグ付けを1回のデコードで一括実行',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  python scripts/prepare_and_caption.py \\
+    --input projects/nasumiso_v1/1_raw_images \\
+    --output projects/nasumiso_v1/3_tagged \\
+    --size 512 \\
+    --threshold 0.35
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='元画像ディレクトリ（またはzip/tarアーカイブ）のパス'
+    )
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        required=True,
+        help='出力ディレクトリのパス（画像と.txtを出力）'
+    )
+
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=512,
+        help='出力画像のサイズ（正方形の一辺、デフォルト: 512）'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.35,
+        help='タグの信頼度しきい値（デフォルト: 0.35）'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=8,
+        help='1回の推論でまとめる画像数（デフォルト: 8）'
+    )
+
+    parser.add_argument(
+        '--use-coreml',
+        action='store_true',
+        help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
+    )
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
+
+    # 入力ディレクトリの存在確認
+    if not input_dir.exists():
+        print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not is_valid_input(input_dir):
+        print(f"エラー: 入力パスがディレクトリまたはアーカイブではありません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.batch_size < 1:
+        print("エラー: --batch-size は1以上を指定してください", file=sys.stderr)
+        sys.exit(1)
+
+    # 処理実行
+    success, skip = process_images(
+        input_dir,
+        output_dir,
+        args.size,
+        args.threshold,
+        args.batch_size,
+        args.use_coreml
+    )
+
+    # 結果に応じて終了コードを設定
+    if success == 0:
+        sys.exit(1)
+    elif skip > 0:
+        sys.exit(2)
+    else:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
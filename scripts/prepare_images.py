@@ -7,36 +7,19 @@
 - 指定フォルダ内の画像を連番リネーム（img001.png など）
 - 指定サイズにリサイズ（デフォルト: 512x512）
 - アスペクト比を維持し、中央クロップで調整
+- 入力はディレクトリのほか、zip/tarアーカイブも展開せずに直接読み込み可能
+- 進捗（処理速度・残り時間）を一定間隔で表示、--metrics で処理量を記録、--quiet で1枚ごとの表示を省略
 """
 
 import argparse
 import sys
 from pathlib import Path
-from typing import List, Tuple
+from typing import Optional, Tuple
 
 from PIL import Image
 
-
-def get_image_files(input_dir: Path) -> List[Path]:
-    """
-    指定ディレクトリから画像ファイルを取得
-
-    Args:
-        input_dir: 入力ディレクトリのパス
-
-    Returns:
-        画像ファイルのパスリスト（ソート済み）
-    """
-    # サポートする画像形式
-    image_extensions = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
-
-    image_files = [
-        f for f in input_dir.iterdir()
-        if f.is_file() and f.suffix in image_extensions
-    ]
-
-    # ファイル名でソート
-    return sorted(image_files)
+from image_sources import get_image_files, is_valid_input, open_image, source_size
+from run_metrics import RunMetrics
 
 
 def resize_and_crop(image: Image.Image, target_size: int) -> Image.Image:
@@ -82,7 +65,9 @@ def resize_and_crop(image: Image.Image, target_size: int) -> Image.Image:
 def process_images(
     input_dir: Path,
     output_dir: Path,
-    target_size: int = 512
+    target_size: int = 512,
+    quiet: bool = False,
+    metrics_path: Optional[Path] = None
 ) -> Tuple[int, int]:
     """
     画像を一括処理
@@ -91,6 +76,8 @@ def process_images(
         input_dir: 入力ディレクトリ
         output_dir: 出力ディレクトリ
         target_size: 目標サイズ（デフォルト: 512）
+        quiet: 1枚ごとの表示を止めるか（デフォルト: False）
+        metrics_path: 処理量の記録先（run_metrics.py を参照、デフォルト: 記録しない）
 
     Returns:
         (成功数, スキップ数) のタプル
@@ -109,13 +96,12 @@ def process_images(
     print(f"出力サイズ: {target_size}x{target_size}")
     print("-" * 50)
 
-    success_count = 0
-    skip_count = 0
+    metrics = RunMetrics('prepare_images', len(image_files), quiet, metrics_path)
 
     for idx, image_path in enumerate(image_files, start=1):
         try:
             # 画像を開く
-            with Image.open(image_path) as img:
+            with metrics.stage('decode'), open_image(image_path) as img:
                 # RGBAまたはRGBに変換（モード統一）
                 if img.mode not in ('RGB', 'RGBA'):
                     img = img.convert('RGB')
@@ -123,22 +109,26 @@ def process_images(
                 # リサイズ・クロップ
                 processed = resize_and_crop(img, target_size)
 
-                # 出力ファイル名（連番: img001.png, img002.png, ...）
-                output_filename = f"img{idx:03d}.png"
-                output_path = output_dir / output_filename
+            # 出力ファイル名（連番: img001.png, img002.png, ...）
+            output_filename = f"img{idx:03d}.png"
+            output_path = output_dir / output_filename
 
-                # PNG形式で保存（ロスレス）
+            # PNG形式で保存（ロスレス）
+            with metrics.stage('write'):
                 processed.save(output_path, 'PNG', optimize=True)
 
-                print(f"✓ [{idx:02d}/{len(image_files)}] {image_path.name} → {output_filename}")
-                success_count += 1
+            metrics.add(bytes_read=source_size(image_path), bytes_written=output_path.stat().st_size)
+            metrics.item(f"✓ [{idx:02d}/{len(image_files)}] {image_path.name} → {output_filename}")
 
         except Exception as e:
-            print(f"✗ [{idx:02d}/{len(image_files)}] {image_path.name}: エラー - {e}")
-            skip_count += 1
+            metrics.item(f"✗ [{idx:02d}/{len(image_files)}] {image_path.name}: エラー - {e}", 'errors')
             continue
 
+    success_count = metrics.counters["processed"]
+    skip_count = metrics.counters["errors"]
+
     print("-" * 50)
+    metrics.finish()
     print(f"完了: {success_count}枚成功, {skip_count}枚スキップ")
 
     return success_count, skip_count
@@ -162,7 +152,7 @@ def main():
         '--input',
         type=str,
         required=True,
-        help='入力ディレクトリのパス'
+        help='入力ディレクトリ（またはzip/tarアーカイブ）のパス'
     )
 
     parser.add_argument(
@@ -179,6 +169,19 @@ def main():
         help='出力画像のサイズ（正方形の一辺、デフォルト: 512）'
     )
 
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help='1枚ごとの表示を止める（エラーと一定間隔の進捗のみ表示）'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        type=str,
+        default=None,
+        help='処理量の記録先（.prom は Prometheus の textfile 形式、それ以外は JSON Lines）'
+    )
+
     args = parser.parse_args()
 
     # パスをPathオブジェクトに変換
@@ -190,12 +193,18 @@ def main():
         print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
         sys.exit(1)
 
-    if not input_dir.is_dir():
-        print(f"エラー: 入力パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+    if not is_valid_input(input_dir):
+        print(f"エラー: 入力パスがディレクトリまたはアーカイブではありません: {input_dir}", file=sys.stderr)
         sys.exit(1)
 
     # 処理実行
-    success, skip = process_images(input_dir, output_dir, args.size)
+    success, skip = process_images(
+        input_dir,
+        output_dir,
+        args.size,
+        args.quiet,
+        Path(args.metrics) if args.metrics else None
+    )
 
     # 結果に応じて終了コードを設定
     if success == 0:
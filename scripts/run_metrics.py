@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+長時間の処理の進捗表示と処理量の記録（prepare_images / auto_caption / add_common_tag で共通）
+
+機能:
+- 一定間隔（デフォルト: 5秒）ごとに進捗・処理速度（枚/秒）・残り時間の目安を表示
+- 処理数・スキップ数・エラー数・読み書きしたバイト数・工程ごとの所要時間を集計
+- 集計を JSON Lines（1行1スナップショット）または Prometheus の textfile 形式で出力（--metrics）
+  （拡張子が .prom の場合は Prometheus 形式、node_exporter の textfile collector で収集可能）
+- --quiet で1ファイルごとの表示を止める（エラーと進捗は表示）
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from tag_io import atomic_write_text
+
+# 進捗を表示・記録する間隔（秒）
+PROGRESS_INTERVAL = 5.0
+
+# Prometheus のメトリクス名の接頭辞
+PROMETHEUS_PREFIX = "nasumiso"
+
+# textfile の権限（別のユーザーで動く node_exporter からも読めるように）
+PROMETHEUS_FILE_MODE = 0o644
+
+
+def format_duration(seconds: float) -> str:
+    """秒数を「1時間2分」「3分12秒」「12.3秒」の形式にする"""
+    if seconds < 60:
+        return f"{seconds:.1f}秒"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}時間{minutes}分"
+    if minutes:
+        return f"{minutes}分{secs}秒"
+    return f"{secs}秒"
+
+
+class RunMetrics:
+    """1回の実行の進捗と処理量"""
+
+    def __init__(
+        self,
+        script: str,
+        total: int,
+        quiet: bool = False,
+        metrics_path: Optional[Path] = None,
+        interval: float = PROGRESS_INTERVAL
+    ):
+        """
+        Args:
+            script: スクリプト名（記録に使用）
+            total: 処理対象の件数
+            quiet: 1ファイルごとの表示を止めるか
+            metrics_path: 集計の出力先（.prom は Prometheus 形式、それ以外は JSON Lines）
+            interval: 進捗を表示・記録する間隔（秒）
+        """
+        self.script = script
+        self.total = total
+        self.quiet = quiet
+        self.metrics_path = metrics_path
+        self.interval = interval
+        self.counters: Dict[str, int] = {
+            "processed": 0,
+            "skipped": 0,
+            "errors": 0,
+            "bytes_read": 0,
+            "bytes_written": 0,
+        }
+        # 工程名: [回数, 合計秒数]
+        self.stages: Dict[str, list] = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._last_report = self._start
+
+    @property
+    def done(self) -> int:
+        """処理済みの件数（成功・スキップ・エラーの合計）"""
+        return self.counters["processed"] + self.counters["skipped"] + self.counters["errors"]
+
+    def add(self, **counts: int) -> None:
+        """
+        カウンターを加算（例: add(bytes_read=1024)）
+
+        Args:
+            **counts: カウンター名と加算する値
+        """
+        for name, value in counts.items():
+            self.counters[name] += value
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        工程の所要時間を計測（with metrics.stage("inference"): ...）
+
+        Args:
+            name: 工程名
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+
+    def item(self, message: str, status: str = "processed", count: int = 1) -> None:
+        """
+        1ファイルの結果を記録して表示（quiet の場合はエラーのみ表示）
+
+        Args:
+            message: 表示するメッセージ（✓ / - / ✗ から始まる行）
+            status: "processed" / "skipped" / "errors"
+            count: 件数（バッチ単位で記録する場合）
+        """
+        self.counters[status] += count
+        if message and (not self.quiet or status == "errors"):
+            print(message)
+        self.tick()
+
+    def tick(self) -> None:
+        """前回の表示から interval 秒以上経っていれば進捗を表示・記録"""
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def snapshot(self) -> Dict:
+        """
+        現在の集計
+
+        Returns:
+            {"script", "time", "elapsed_seconds", "total", カウンター..., "images_per_second",
+             "eta_seconds", "stages"} の辞書
+        """
+        elapsed = time.perf_counter() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.done)
+        return {
+            "script": self.script,
+            "time": round(time.time(), 3),
+            "started_at": round(self.started_at, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "total": self.total,
+            **self.counters,
+            "images_per_second": round(rate, 3),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+            "stages": {
+                name: {"count": count, "seconds": round(seconds, 4)}
+                for name, (count, seconds) in self.stages.items()
+            },
+        }
+
+    def report(self) -> None:
+        """進捗を表示し、集計を出力"""
+        snapshot = self.snapshot()
+        percent = 100.0 * self.done / self.total if self.total else 100.0
+        line = (f"進捗: {self.done}/{self.total}（{percent:.1f}%）"
+                f" {snapshot['images_per_second']:.1f}枚/秒")
+        if snapshot["eta_seconds"] is not None and self.done < self.total:
+            line += f" 残り約{format_duration(snapshot['eta_seconds'])}"
+        if self.counters["errors"]:
+            line += f" エラー{self.counters['errors']}件"
+        print(line, flush=True)
+        self.write(snapshot)
+
+    def write(self, snapshot: Optional[Dict] = None) -> None:
+        """
+        集計を metrics_path に出力（指定がない場合は何もしない）
+
+        Args:
+            snapshot: snapshot() の結果（None の場合は現在の集計）
+        """
+        if self.metrics_path is None:
+            return
+        snapshot = snapshot or self.snapshot()
+        if self.metrics_path.suffix == '.prom':
+            # textfile collector は書き込み途中のファイルを読まないよう、置き換えで更新
+            atomic_write_text(self.metrics_path, format_prometheus(snapshot), mode=PROMETHEUS_FILE_MODE)
+        else:
+            with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+
+    def finish(self) -> Dict:
+        """
+        最後の集計を表示・出力
+
+        Returns:
+            最後の集計（snapshot() の結果）
+        """
+        snapshot = self.snapshot()
+        stages = ", ".join(
+            f"{name} {seconds:.1f}秒" for name, (_, seconds) in self.stages.items()
+        )
+        print(f"処理時間: {format_duration(snapshot['elapsed_seconds'])}"
+              f"（{snapshot['images_per_second']:.1f}枚/秒）" + (f" 内訳: {stages}" if stages else ""))
+        self.write(snapshot)
+        if self.metrics_path is not None:
+            print(f"メトリクス: {self.metrics_path}")
+        return snapshot
+
+
+def format_prometheus(snapshot: Dict) -> str:
+    """
+    集計を Prometheus の textfile 形式にする
+
+    Args:
+        snapshot: RunMetrics.snapshot() の結果
+
+    Returns:
+        textfile の内容
+    """
+    prefix = PROMETHEUS_PREFIX
+    label = f'script="{snapshot["script"]}"'
+    lines = [
+        f"# HELP {prefix}_items_total Items handled by status.",
+        f"# TYPE {prefix}_items_total counter",
+    ]
+    for status in ("processed", "skipped", "errors"):
+        lines.append(f'{prefix}_items_total{{{label},status="{status}"}} {snapshot[status]}')
+    lines += [
+        f"# HELP {prefix}_bytes_total Bytes read and written.",
+        f"# TYPE {prefix}_bytes_total counter",
+        f'{prefix}_bytes_total{{{label},direction="read"}} {snapshot["bytes_read"]}',
+        f'{prefix}_bytes_total{{{label},direction="written"}} {snapshot["bytes_written"]}',
+        f"# HELP {prefix}_stage_seconds_total Time spent in each stage.",
+        f"# TYPE {prefix}_stage_seconds_total counter",
+    ]
+    for name, stage in snapshot["stages"].items():
+        lines.append(f'{prefix}_stage_seconds_total{{{label},stage="{name}"}} {stage["seconds"]}')
+    lines += [
+        f"# HELP {prefix}_stage_calls_total Number of timed calls of each stage.",
+        f"# TYPE {prefix}_stage_calls_total counter",
+    ]
+    for name, stage in snapshot["stages"].items():
+        lines.append(f'{prefix}_stage_calls_total{{{label},stage="{name}"}} {stage["count"]}')
+    lines += [
+        f"# HELP {prefix}_items_expected Items to handle in this run.",
+        f"# TYPE {prefix}_items_expected gauge",
+        f"{prefix}_items_expected{{{label}}} {snapshot['total']}",
+        f"# HELP {prefix}_items_per_second Average throughput of this run.",
+        f"# TYPE {prefix}_items_per_second gauge",
+        f"{prefix}_items_per_second{{{label}}} {snapshot['images_per_second']}",
+        f"# HELP {prefix}_eta_seconds Estimated time to completion.",
+        f"# TYPE {prefix}_eta_seconds gauge",
+        f"{prefix}_eta_seconds{{{label}}} {snapshot['eta_seconds'] if snapshot['eta_seconds'] is not None else 0}",
+        f"# HELP {prefix}_run_start_timestamp_seconds Start time of this run.",
+        f"# TYPE {prefix}_run_start_timestamp_seconds gauge",
+        f"{prefix}_run_start_timestamp_seconds{{{label}}} {snapshot['started_at']}",
+        f"# HELP {prefix}_last_update_timestamp_seconds Time of this snapshot.",
+        f"# TYPE {prefix}_last_update_timestamp_seconds gauge",
+        f"{prefix}_last_update_timestamp_seconds{{{label}}} {snapshot['time']}",
+    ]
+    return "\n".join(lines) + "\n"
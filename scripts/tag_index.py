@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグ検索インデックス（SQLite）スクリプト
+
+機能:
+- 3_tagged/ のタグファイルから「タグ → 画像」の転置インデックスを作成
+- タグごとの出現数と、保存されていれば信頼度（tag_scores.jsonl）も記録
+- 更新時刻を見て変更のあったファイルだけを再インデックス
+- 論理式（AND / OR / NOT / 括弧）によるタグ検索と頻出タグの一覧
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# インデックスファイル名（タグディレクトリ内に作成）
+INDEX_FILENAME = ".tag_index.sqlite"
+
+# auto_caption.py --save-scores が出力する信頼度ファイル
+SCORES_FILENAME = "tag_scores.jsonl"
+
+# 画像ファイルの拡張子（タグファイルと同じベース名の画像を探す）
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    image TEXT,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS file_tags (
+    tag_id INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    prob REAL,
+    PRIMARY KEY (tag_id, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS file_tags_by_file ON file_tags (file_id);
+CREATE INDEX IF NOT EXISTS tags_by_count ON tags (count DESC);
+"""
+
+
+def open_index(db_path: Path) -> sqlite3.Connection:
+    """
+    インデックスを開く（なければ作成）
+
+    Args:
+        db_path: SQLiteファイルのパス
+
+    Returns:
+        SQLite接続
+    """
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def scan_directory(input_dir: Path) -> Tuple[Dict[str, Tuple[int, int]], Dict[str, str]]:
+    """
+    タグファイル（_jp.txtを除く）の更新時刻・サイズと、画像ファイル名を1回の走査で取得
+
+    Args:
+        input_dir: タグファイルがあるディレクトリ
+
+    Returns:
+        ({タグファイル名: (更新時刻ns, サイズ)}, {ベース名: 画像ファイル名}) のタプル
+    """
+    tag_files = {}
+    images = {}
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            stem, ext = os.path.splitext(name)
+            if ext in IMAGE_EXTENSIONS:
+                # 同じベース名の画像が複数ある場合は走査順によらず名前順で最初のもの
+                if stem not in images or name < images[stem]:
+                    images[stem] = name
+                continue
+            if ext != '.txt' or name.endswith('_jp.txt') or not entry.is_file():
+                continue
+            st = entry.stat()
+            tag_files[name] = (st.st_mtime_ns, st.st_size)
+    return tag_files, images
+
+
+def load_scores(scores_path: Path) -> Dict[str, Dict[str, float]]:
+    """
+    tag_scores.jsonl を読み込む
+
+    Args:
+        scores_path: 信頼度ファイルのパス
+
+    Returns:
+        {画像のベース名: {タグ名: 信頼度}} の辞書
+    """
+    scores = {}
+    with scores_path.open(encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            scores[Path(record["image"]).stem] = record["scores"]
+    return scores
+
+
+def update_index(conn: sqlite3.Connection, input_dir: Path) -> Tuple[int, int, int]:
+    """
+    変更のあったタグファイルだけをインデックスに反映
+
+    Args:
+        conn: SQLite接続
+        input_dir: タグファイルがあるディレクトリ
+
+    Returns:
+        (追加・更新数, 削除数, 変更なし数) のタプル
+    """
+    current, images = scan_directory(input_dir)
+    indexed = {}
+    indexed_images = {}
+    for file_id, name, image, mtime_ns, size in conn.execute(
+        "SELECT id, name, image, mtime_ns, size FROM files"
+    ):
+        indexed[name] = (file_id, mtime_ns, size)
+        indexed_images[name] = image
+
+    # 信頼度ファイルが更新されていれば全ファイルを再インデックス
+    scores_path = input_dir / SCORES_FILENAME
+    scores_mtime = str(scores_path.stat().st_mtime_ns) if scores_path.exists() else ""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'scores_mtime'").fetchone()
+    scores_changed = (row[0] if row else "") != scores_mtime
+
+    changed = [
+        name for name, stat in current.items()
+        if scores_changed or name not in indexed or indexed[name][1:] != stat
+    ]
+    removed = [name for name in indexed if name not in current]
+    # タグファイルは変わらず、対応する画像だけが追加・削除・差し替えされたファイル
+    changed_set = set(changed)
+    relinked = [
+        name for name in current
+        if name in indexed and name not in changed_set
+        and indexed_images[name] != images.get(name[:-len('.txt')])
+    ]
+
+    if not changed and not removed and not relinked:
+        return 0, 0, len(current)
+
+    scores = load_scores(scores_path) if scores_mtime and changed else {}
+    tag_ids = {name: tag_id for tag_id, name in conn.execute("SELECT id, name FROM tags")}
+
+    with conn:
+        # 削除・更新されたファイルの既存エントリを消す
+        for name in removed + [n for n in changed if n in indexed]:
+            file_id = indexed[name][0]
+            conn.execute("DELETE FROM file_tags WHERE file_id = ?", (file_id,))
+            if name in removed:
+                conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+        for name in relinked:
+            conn.execute(
+                "UPDATE files SET image = ? WHERE id = ?",
+                (images.get(name[:-len('.txt')]), indexed[name][0])
+            )
+
+        for name in changed:
+            mtime_ns, size = current[name]
+            stem = name[:-len('.txt')]
+            image = images.get(stem)
+
+            if name in indexed:
+                file_id = indexed[name][0]
+                conn.execute(
+                    "UPDATE files SET image = ?, mtime_ns = ?, size = ? WHERE id = ?",
+                    (image, mtime_ns, size, file_id)
+                )
+            else:
+                file_id = conn.execute(
+                    "INSERT INTO files (name, image, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                    (name, image, mtime_ns, size)
+                ).lastrowid
+
+            content = (input_dir / name).read_text(encoding='utf-8')
+            tags = [t.strip() for t in content.split(',')]
+            tag_probs = scores.get(stem, {})
+
+            rows = []
+            seen = set()
+            for position, tag in enumerate(tags):
+                if not tag or tag in seen:
+                    continue
+                seen.add(tag)
+                if tag not in tag_ids:
+                    tag_ids[tag] = conn.execute(
+                        "INSERT INTO tags (name) VALUES (?)", (tag,)
+                    ).lastrowid
+                rows.append((tag_ids[tag], file_id, position, tag_probs.get(tag)))
+            conn.executemany(
+                "INSERT INTO file_tags (tag_id, file_id, position, prob) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+        # タグごとの出現数を更新し、使われなくなったタグを削除
+        conn.execute(
+            "UPDATE tags SET count = (SELECT COUNT(*) FROM file_tags WHERE tag_id = tags.id)"
+        )
+        conn.execute("DELETE FROM tags WHERE count = 0")
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('scores_mtime', ?)",
+            (scores_mtime,)
+        )
+
+    return len(changed) + len(relinked), len(removed), len(current) - len(changed) - len(relinked)
+
+
+# ---------------------------------------------------------------------------
+# 検索式のパース
+#
+#   式     := OR式
+#   OR式   := AND式 ( ("OR" | "|") AND式 )*
+#   AND式  := 否定 ( ["AND" | "&"] 否定 )*      （演算子なしで並べた場合もAND）
+#   否定   := ("NOT" | "!") 否定 | "(" 式 ")" | タグ
+#
+# タグに括弧や空白を含む場合は "tag_(cosplay)" のようにダブルクォートで囲む。
+# タグに * や ? を含む場合はワイルドカード（例: *_hair）として扱う。
+# ---------------------------------------------------------------------------
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+KEYWORDS = {'AND': 'AND', '&': 'AND', 'OR': 'OR', '|': 'OR', 'NOT': 'NOT', '!': 'NOT'}
+
+
+def tokenize(expression: str) -> List[Tuple[str, str]]:
+    """
+    検索式をトークンに分割
+
+    Args:
+        expression: 検索式
+
+    Returns:
+        (種類, 値) のリスト。種類は "(" / ")" / "AND" / "OR" / "NOT" / "TAG"
+
+    Raises:
+        ValueError: 閉じていないクォートなどがある場合
+    """
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = TOKEN_PATTERN.match(expression, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"検索式を解析できません: {expression[pos:]}")
+        open_paren, close_paren, quoted, word = match.groups()
+        if open_paren:
+            tokens.append(('(', open_paren))
+        elif close_paren:
+            tokens.append((')', close_paren))
+        elif quoted is not None:
+            tokens.append(('TAG', quoted))
+        elif word.upper() in KEYWORDS:
+            tokens.append((KEYWORDS[word.upper()], word))
+        else:
+            tokens.append(('TAG', word))
+        pos = match.end()
+    return tokens
+
+
+class QueryCompiler:
+    """検索式をSQLの集合演算（INTERSECT / UNION / EXCEPT）に変換するクラス"""
+
+    def __init__(self, expression: str):
+        self.tokens = tokenize(expression)
+        self.pos = 0
+        self.params: List[str] = []
+
+    def compile(self) -> Tuple[str, List[str]]:
+        """
+        検索式をSQLに変換
+
+        Returns:
+            (file_idを返すSELECT文, パラメータ) のタプル
+
+        Raises:
+            ValueError: 検索式の文法が不正な場合
+        """
+        if not self.tokens:
+            raise ValueError("検索式が空です")
+        sql = self._parse_or()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"検索式の解析に失敗しました: '{self.tokens[self.pos][1]}' 付近")
+        return sql, self.params
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _parse_or(self) -> str:
+        sql = self._parse_and()
+        while self._peek() == 'OR':
+            self.pos += 1
+            right = self._parse_and()
+            sql = f"SELECT file_id FROM ({sql}) UNION SELECT file_id FROM ({right})"
+        return sql
+
+    def _parse_and(self) -> str:
+        sql = self._parse_not()
+        while self._peek() in ('AND', 'NOT', 'TAG', '('):
+            if self._peek() == 'AND':
+                self.pos += 1
+            # "a AND NOT b" は EXCEPT で直接計算する
+            if self._peek() == 'NOT':
+                self.pos += 1
+                right = self._parse_not()
+                sql = f"SELECT file_id FROM ({sql}) EXCEPT SELECT file_id FROM ({right})"
+            else:
+                right = self._parse_not()
+                sql = f"SELECT file_id FROM ({sql}) INTERSECT SELECT file_id FROM ({right})"
+        return sql
+
+    def _parse_not(self) -> str:
+        kind = self._peek()
+        if kind == 'NOT':
+            self.pos += 1
+            operand = self._parse_not()
+            return f"SELECT id AS file_id FROM files EXCEPT SELECT file_id FROM ({operand})"
+        if kind == '(':
+            self.pos += 1
+            sql = self._parse_or()
+            if self._peek() != ')':
+                raise ValueError("括弧が閉じられていません")
+            self.pos += 1
+            return sql
+        if kind == 'TAG':
+            tag = self.tokens[self.pos][1]
+            self.pos += 1
+            self.params.append(tag)
+            if '*' in tag or '?' in tag:
+                return ("SELECT DISTINCT file_id FROM file_tags WHERE tag_id IN "
+                        "(SELECT id FROM tags WHERE name GLOB ?)")
+            return "SELECT file_id FROM file_tags WHERE tag_id = (SELECT id FROM tags WHERE name = ?)"
+        if kind is None:
+            raise ValueError("検索式が途中で終わっています")
+        raise ValueError(f"検索式の解析に失敗しました: '{self.tokens[self.pos][1]}' 付近")
+
+
+def query_images(conn: sqlite3.Connection, expression: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    検索式に一致するファイルを取得
+
+    Args:
+        conn: SQLite接続
+        expression: 検索式（例: "glasses AND NOT smile"）
+
+    Returns:
+        (タグファイル名, 画像ファイル名) のリスト（ファイル名順）
+    """
+    sql, params = QueryCompiler(expression).compile()
+    return conn.execute(
+        f"SELECT name, image FROM files WHERE id IN ({sql}) ORDER BY name", params
+    ).fetchall()
+
+
+def top_tags(conn: sqlite3.Connection, limit: int = 50) -> List[Tuple[str, int, Optional[float]]]:
+    """
+    出現数の多いタグを取得
+
+    Args:
+        conn: SQLite接続
+        limit: 取得する件数
+
+    Returns:
+        (タグ名, 出現数, 平均信頼度) のリスト
+    """
+    return conn.execute(
+        """
+        SELECT t.name, t.count,
+               (SELECT AVG(prob) FROM file_tags WHERE tag_id = t.id)
+        FROM (SELECT id, name, count FROM tags ORDER BY count DESC, name LIMIT ?) AS t
+        ORDER BY t.count DESC, t.name
+        """,
+        (limit,)
+    ).fetchall()
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='タグファイルの転置インデックスを作成・検索',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # インデックスを作成・更新（変更のあったファイルのみ再読み込み）
+  python scripts/tag_index.py build --input projects/nasumiso_v1/3_tagged
+
+  # glasses があって smile がない画像
+  python scripts/tag_index.py query --input projects/nasumiso_v1/3_tagged \\
+    "glasses AND NOT smile"
+
+  # 括弧を含むタグはダブルクォートで囲む、* はワイルドカード
+  python scripts/tag_index.py query --input projects/nasumiso_v1/3_tagged \\
+    '(1girl OR 2girls) "hat_(object)" NOT *_background'
+
+  # 頻出タグ上位50件
+  python scripts/tag_index.py top --input projects/nasumiso_v1/3_tagged -n 50
+        """
+    )
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='タグファイルがあるディレクトリのパス'
+    )
+    common.add_argument(
+        '--db',
+        type=str,
+        help=f'インデックスファイルのパス（デフォルト: <input>/{INDEX_FILENAME}）'
+    )
+
+    subparsers.add_parser('build', parents=[common], help='インデックスを作成・更新')
+
+    query_parser = subparsers.add_parser('query', parents=[common], help='検索式で画像を検索')
+    query_parser.add_argument('expression', type=str, help='検索式（例: "glasses AND NOT smile"）')
+    query_parser.add_argument('--count', action='store_true', help='件数のみ表示')
+    query_parser.add_argument('--refresh', action='store_true', help='検索前にインデックスを更新')
+
+    top_parser = subparsers.add_parser('top', parents=[common], help='頻出タグを表示')
+    top_parser.add_argument('-n', type=int, default=50, help='表示件数（デフォルト: 50）')
+    top_parser.add_argument('--refresh', action='store_true', help='表示前にインデックスを更新')
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+
+    # ディレクトリの存在確認
+    if not input_dir.exists():
+        print(f"エラー: ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not input_dir.is_dir():
+        print(f"エラー: パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    db_path = Path(args.db) if args.db else input_dir / INDEX_FILENAME
+    conn = open_index(db_path)
+
+    try:
+        if args.command == 'build' or args.refresh:
+            start_time = time.perf_counter()
+            updated, removed, unchanged = update_index(conn, input_dir)
+            elapsed = time.perf_counter() - start_time
+            if args.command == 'build':
+                print(f"インデックス: {db_path}")
+                print(f"完了: {updated}個更新, {removed}個削除, {unchanged}個変更なし（{elapsed:.2f}秒）")
+                return
+
+        if args.command == 'query':
+            start_time = time.perf_counter()
+            try:
+                results = query_images(conn, args.expression)
+            except ValueError as e:
+                print(f"エラー: {e}", file=sys.stderr)
+                sys.exit(1)
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+            if not args.count:
+                for name, image in results:
+                    print(image or name)
+            print(f"{len(results)}件（{elapsed_ms:.1f}ms）", file=sys.stderr)
+
+        elif args.command == 'top':
+            for rank, (tag, count, prob) in enumerate(top_tags(conn, args.n), start=1):
+                prob_text = f"  平均信頼度 {prob:.3f}" if prob is not None else ""
+                print(f"{rank:3d}. {tag}: {count}{prob_text}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグファイルの安全な書き込みと取り消し（ジャーナル）
+
+機能:
+- 一時ファイルに書き込んでからリネームするアトミックな書き込み
+  （途中で中断しても書きかけのファイルが残らない）
+- 1回の実行につき1つの追記専用ジャーナルに、書き換え前の内容を記録
+  （ファイルごとの .bak を作らない）
+- ジャーナルから実行前の状態に戻す（undo）
+- 推論ループを止めないよう、書き込み・コピーを別スレッドでまとめて行う（BackgroundWriter）
+
+各スクリプトの --backup オプションで使用する。
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# ジャーナルの保存先（書き込み先ディレクトリ内）
+JOURNAL_DIRNAME = ".tag_journal"
+JOURNAL_SUFFIX = ".jsonl"
+UNDONE_SUFFIX = ".undone"
+
+# 新しく作るファイルの権限（通常の open() と同じく umask を適用する）
+# os.umask() は読み取るだけでも書き換えが必要なため、スレッドを使う前の import 時に1回だけ取得する
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+
+
+def atomic_write_text(path: Path, content: str, mode: Optional[int] = None) -> None:
+    """
+    一時ファイルに書き込んでからリネームし、途中で中断しても元のファイルを壊さない
+
+    一時ファイルは所有者のみ読み書きできる権限（0600）で作られるため、リネーム前に
+    元のファイルの権限（新しいファイルは umask を適用した 0666）に合わせる。
+
+    Args:
+        path: 書き込み先のパス
+        content: 書き込む内容
+        mode: ファイルの権限（None の場合は元のファイルの権限、新しいファイルは umask を適用した 0666）
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        if mode is None:
+            try:
+                mode = path.stat().st_mode & 0o7777
+            except FileNotFoundError:
+                mode = NEW_FILE_MODE
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+class TagJournal:
+    """書き換え前の内容を1つのファイルに追記していくジャーナル"""
+
+    def __init__(self, base_dir: Path, script_name: str):
+        """
+        ジャーナルを新規作成
+
+        Args:
+            base_dir: 書き込み先ディレクトリ（ジャーナルはこの中の .tag_journal/ に作成）
+            script_name: 実行したスクリプト名（ファイル名と記録に使用）
+        """
+        self.base_dir = base_dir
+        journal_dir = base_dir / JOURNAL_DIRNAME
+        journal_dir.mkdir(parents=True, exist_ok=True)
+
+        # 実行ID（ファイル名順 = 実行順になるようミリ秒まで含める）
+        while True:
+            run_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]
+            self.path = journal_dir / f"{run_id}_{script_name}{JOURNAL_SUFFIX}"
+            if not self.path.exists():
+                break
+            time.sleep(0.001)
+
+        self._file = self.path.open('x', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._recorded = set()
+        self._append({"script": script_name, "created": time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def _append(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # 書き換え前に記録がOSに渡っているようにする
+        self._file.flush()
+
+    def record(self, path: Path) -> None:
+        """
+        ファイルの現在の内容を記録（存在しない場合は「新規作成」として記録）
+
+        Args:
+            path: これから書き換えるファイルのパス
+        """
+        content = path.read_text(encoding='utf-8') if path.exists() else None
+        self.record_content(path, content)
+
+    def record_content(self, path: Path, content: Optional[str]) -> None:
+        """
+        読み込み済みの内容を記録（同じファイルは1回の実行で最初の1回のみ）
+
+        Args:
+            path: これから書き換えるファイルのパス
+            content: 書き換え前の内容（新規作成の場合は None）
+        """
+        name = os.path.relpath(path, self.base_dir)
+        with self._lock:
+            if name in self._recorded:
+                return
+            self._recorded.add(name)
+            self._append({"file": name, "content": content})
+
+    def close(self) -> None:
+        """ジャーナルを閉じる（ディスクへの書き込みを確定）"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self) -> 'TagJournal':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_tag_file(path: Path, content: str, journal: Optional[TagJournal] = None) -> None:
+    """
+    タグファイルをアトミックに書き込む（ジャーナル指定時は書き換え前の内容を記録）
+
+    Args:
+        path: 書き込み先のパス
+        content: 書き込む内容
+        journal: ジャーナル（None の場合は記録しない）
+    """
+    if journal is not None:
+        journal.record(path)
+    atomic_write_text(path, content)
+
+
+class BackgroundWriter:
+    """
+    ファイルの書き込み・コピーを別スレッドで行う書き込み係
+
+    - 待ちの件数が上限に達したら、投入側（推論ループ）を待たせる（メモリを使い切らない）
+    - 小さなタグファイルはまとめて1つの処理で書き込む（同じファイルへの書き込みは最後のみ）
+    - 画像のコピーは複数スレッドで同時に行う
+    - fsync=True の場合、ファイルごとではなく最後にまとめてディスクへの書き込みを確定
+    - エラーは投入時のキー（画像名など）ごとに記録し、close() で返す
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 64, batch_size: int = 32, fsync: bool = False):
+        """
+        Args:
+            workers: 書き込みスレッド数
+            max_pending: 未完了の処理の上限
+            batch_size: まとめて書き込むタグファイル数
+            fsync: 最後にまとめてディスクへの書き込みを確定するか
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._batch_size = max(1, batch_size)
+        self._fsync = fsync
+        self._texts: Dict[Path, Tuple[str, str, Optional[TagJournal]]] = {}
+        self._futures = []
+        self._lock = threading.Lock()
+        self._errors: Dict[str, Exception] = {}
+        self._written: List[Tuple[str, Path]] = []
+
+    def _done(self, key: str, path: Path) -> None:
+        with self._lock:
+            self._written.append((key, path))
+
+    def _fail(self, key: str, error: Exception) -> None:
+        with self._lock:
+            # 同じキーで複数失敗した場合は最初のエラーを残す
+            self._errors.setdefault(key, error)
+
+    def _submit(self, func: Callable[..., None], *args: Any) -> None:
+        # 上限に達していたら空きが出るまで待つ
+        self._slots.acquire()
+
+        def run():
+            try:
+                func(*args)
+            finally:
+                self._slots.release()
+
+        self._futures.append(self._executor.submit(run))
+
+    def _write_texts(self, items: List[Tuple[Path, Tuple[str, str, Optional[TagJournal]]]]) -> None:
+        for path, (key, content, journal) in items:
+            try:
+                write_tag_file(path, content, journal)
+                self._done(key, path)
+            except Exception as e:
+                self._fail(key, e)
+
+    def _copy(self, key: str, func: Callable[..., None], args: Tuple, dest: Path) -> None:
+        try:
+            func(*args)
+            self._done(key, dest)
+        except Exception as e:
+            self._fail(key, e)
+
+    def _flush_texts(self) -> None:
+        if self._texts:
+            items = list(self._texts.items())
+            self._texts = {}
+            self._submit(self._write_texts, items)
+
+    def write_text(self, key: str, path: Path, content: str, journal: Optional[TagJournal] = None) -> None:
+        """
+        タグファイルの書き込みを予約（write_tag_file と同じくアトミックに書き込む）
+
+        Args:
+            key: エラーを対応付けるキー（画像名など）
+            path: 書き込み先のパス
+            content: 書き込む内容
+            journal: 書き換え前の内容を記録するジャーナル
+        """
+        self._texts[path] = (key, content, journal)
+        if len(self._texts) >= self._batch_size:
+            self._flush_texts()
+
+    def copy(self, key: str, func: Callable[..., None], *args: Any, dest: Path) -> None:
+        """
+        コピー処理を予約（func(*args) を書き込みスレッドで実行）
+
+        Args:
+            key: エラーを対応付けるキー（画像名など）
+            func: コピーを行う関数（copy_image など）
+            *args: func に渡す引数
+            dest: コピー先のパス（fsync の対象）
+        """
+        self._submit(self._copy, key, func, args, dest)
+
+    def write_bytes(self, key: str, path: Path, data: bytes) -> None:
+        """
+        読み込み済みの内容の書き込みを予約（アーカイブ内の画像を読み直さずに出力する）
+
+        Args:
+            key: エラーを対応付けるキー（画像名など）
+            path: 書き込み先のパス
+            data: 書き込む内容
+        """
+        self._submit(self._copy, key, path.write_bytes, (data,), path)
+
+    def close(self) -> Dict[str, Exception]:
+        """
+        全ての書き込みの完了を待つ（fsync=True の場合はディスクへの書き込みも確定）
+
+        Returns:
+            {キー: エラー} の辞書（失敗がなければ空）
+        """
+        self._flush_texts()
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+        if self._fsync and self._written:
+            for key, error in self._executor.map(_fsync_path, self._written):
+                if error is not None:
+                    self._fail(key, error)
+            # リネームを確定するためディレクトリも同期
+            for directory in {path.parent for _, path in self._written}:
+                _fsync_directory(directory)
+
+        self._executor.shutdown()
+        return dict(self._errors)
+
+    def __enter__(self) -> 'BackgroundWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _fsync_path(item: Tuple[str, Path]) -> Tuple[str, Optional[Exception]]:
+    """ファイルの内容をディスクに書き込む（(キー, エラー) を返す）"""
+    key, path = item
+    try:
+        with open(path, 'rb') as f:
+            os.fsync(f.fileno())
+    except OSError as e:
+        return key, e
+    return key, None
+
+
+def _fsync_directory(directory: Path) -> None:
+    """ディレクトリのエントリ（リネーム結果）をディスクに書き込む（非対応のOSでは何もしない）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def list_journals(base_dir: Path) -> List[Path]:
+    """
+    取り消し可能なジャーナルを古い順に取得
+
+    Args:
+        base_dir: 書き込み先ディレクトリ
+
+    Returns:
+        ジャーナルファイルのパスリスト
+    """
+    journal_dir = base_dir / JOURNAL_DIRNAME
+    if not journal_dir.is_dir():
+        return []
+    return sorted(journal_dir.glob(f"*{JOURNAL_SUFFIX}"))
+
+
+def undo_journal(journal_path: Path) -> Tuple[int, int]:
+    """
+    ジャーナルに記録された内容でファイルを元に戻す
+
+    Args:
+        journal_path: ジャーナルファイルのパス
+
+    Returns:
+        (復元数, 削除数) のタプル
+    """
+    base_dir = journal_path.parent.parent
+    restored = 0
+    deleted = 0
+
+    with journal_path.open(encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断時の書きかけの行は無視（対応する書き換えは行われていない）
+                continue
+            if "file" not in record:
+                continue
+
+            path = base_dir / record["file"]
+            if record["content"] is None:
+                # 実行時に新規作成されたファイル
+                if path.exists():
+                    path.unlink()
+                    deleted += 1
+            else:
+                atomic_write_text(path, record["content"])
+                restored += 1
+
+    # 二重に取り消さないよう印を付ける
+    journal_path.rename(journal_path.with_name(journal_path.name + UNDONE_SUFFIX))
+
+    return restored, deleted
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='--backup 付きで実行したタグ書き込みを取り消す',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 取り消し可能な実行の一覧
+  python scripts/tag_io.py --input projects/nasumiso_v1/3_tagged --list
+
+  # 直前の実行を取り消す
+  python scripts/tag_io.py --input projects/nasumiso_v1/3_tagged --undo
+
+  # 指定した実行を取り消す
+  python scripts/tag_io.py --input projects/nasumiso_v1/3_tagged \\
+    --undo 20250101-120000-000_add_common_tag
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='タグファイルがあるディレクトリのパス'
+    )
+
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        '--list',
+        action='store_true',
+        help='取り消し可能な実行を一覧表示'
+    )
+    group.add_argument(
+        '--undo',
+        nargs='?',
+        const='',
+        metavar='RUN',
+        help='実行を取り消す（RUN 省略時は直前の実行）'
+    )
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+
+    # ディレクトリの存在確認
+    if not input_dir.is_dir():
+        print(f"エラー: ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    journals = list_journals(input_dir)
+
+    if args.list:
+        if not journals:
+            print("取り消し可能な実行はありません")
+        for journal_path in journals:
+            with journal_path.open(encoding='utf-8') as f:
+                count = sum(1 for _ in f) - 1
+            print(f"{journal_path.name[:-len(JOURNAL_SUFFIX)]}: {count}個のファイル")
+        return
+
+    if not journals:
+        print(f"エラー: {input_dir} に取り消し可能な実行がありません", file=sys.stderr)
+        sys.exit(1)
+
+    if args.undo:
+        journal_path = input_dir / JOURNAL_DIRNAME / f"{args.undo}{JOURNAL_SUFFIX}"
+        if journal_path not in journals:
+            print(f"エラー: 実行が見つかりません: {args.undo}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        journal_path = journals[-1]
+
+    restored, deleted = undo_journal(journal_path)
+    print(f"取り消し: {journal_path.name[:-len(JOURNAL_SUFFIX)]}")
+    print(f"完了: {restored}個を復元, {deleted}個を削除")
+
+
+if __name__ == '__main__':
+    main()
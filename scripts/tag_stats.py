@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+しきい値スイープ・タグ頻度の分析スクリプト
+
+機能:
+- WD14 Tagger を1回だけ実行し、全画像 × 全タグの確率値（スコア行列）を保存
+  （2回目以降は追加・変更された画像だけを推論）
+- 複数のしきい値について、画像あたりのタグ数の分布とタグごとの出現画像数を一度に計算
+- しきい値を上げたときに消えるタグ（下げたときに現れるタグ）を段階ごとに表示
+- auto_caption.py の --threshold を決めるための参考に使用
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from image_sources import ArchiveImage, ImageSource, get_image_files, is_valid_input, open_image
+
+
+# スコア行列の保存ファイル名（入力ディレクトリに作成）
+SCORE_MATRIX_FILENAME = "tag_score_matrix.npz"
+
+# デフォルトのしきい値
+DEFAULT_THRESHOLDS = "0.25,0.30,0.35,0.40,0.45,0.50"
+
+# 一度に集計する行数（N×T の中間配列でメモリを使い切らないように）
+SWEEP_CHUNK_ROWS = 1024
+
+
+def image_key(source: ImageSource) -> Tuple[str, Tuple[int, int]]:
+    """
+    スコア行列で画像を識別するキー
+
+    Args:
+        source: 画像ファイルのパス、またはアーカイブ内の画像
+
+    Returns:
+        (画像名, (更新時刻ns, サイズ)) のタプル（アーカイブ内の画像は更新時刻0）
+    """
+    if isinstance(source, ArchiveImage):
+        return source.display_name, (0, source.size)
+    st = source.stat()
+    return source.name, (st.st_mtime_ns, st.st_size)
+
+
+def load_score_matrix(matrix_path: Path) -> Optional[Dict[str, np.ndarray]]:
+    """
+    保存済みのスコア行列を読み込む
+
+    Args:
+        matrix_path: スコア行列ファイルのパス
+
+    Returns:
+        {"images", "stats", "tags", "scores"} の辞書（ファイルがない場合は None）
+    """
+    if not matrix_path.exists():
+        return None
+    with np.load(matrix_path) as data:
+        return {key: data[key] for key in ("images", "stats", "tags", "scores")}
+
+
+def save_score_matrix(
+    matrix_path: Path,
+    images: List[str],
+    stats: List[Tuple[int, int]],
+    tags: List[str],
+    scores: np.ndarray
+) -> None:
+    """
+    スコア行列を保存（一時ファイルに書いてからリネーム）
+
+    Args:
+        matrix_path: スコア行列ファイルのパス
+        images: 画像名のリスト（行の順序）
+        stats: 画像ごとの (更新時刻ns, サイズ)
+        tags: タグのリスト（列の順序）
+        scores: (画像数, タグ数) の確率値配列
+    """
+    tmp_path = matrix_path.with_name(matrix_path.name + '.tmp')
+    try:
+        with tmp_path.open('wb') as f:
+            np.savez(
+                f,
+                images=np.array(images, dtype=str),
+                stats=np.array(stats, dtype=np.int64).reshape(-1, 2),
+                tags=np.array(tags, dtype=str),
+                scores=scores.astype(np.float32),
+            )
+        os.replace(tmp_path, matrix_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def build_score_matrix(
+    input_path: Path,
+    matrix_path: Path,
+    batch_size: int = 8,
+    use_coreml: bool = False,
+    rescore: bool = False
+) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    全画像のスコア行列を用意（保存済みの行は再利用し、新しい画像だけ推論）
+
+    Args:
+        input_path: 入力ディレクトリまたはアーカイブのパス
+        matrix_path: スコア行列ファイルのパス
+        batch_size: 1回の推論でまとめて処理する画像数
+        use_coreml: CoreML高速化を使用するか
+        rescore: Trueの場合は保存済みの行を使わず全画像を推論
+
+    Returns:
+        (画像名のリスト, タグのリスト, (画像数, タグ数) のスコア配列) のタプル
+    """
+    image_files = get_image_files(input_path)
+    keys = [image_key(source) for source in image_files]
+
+    cached = None if rescore else load_score_matrix(matrix_path)
+    if cached is not None and cached["scores"].dtype != np.float32:
+        # 以前の float16 の行列は auto_caption.py（float32 で比較）としきい値付近の結果が変わるため使わない
+        print("保存済みのスコア行列は float16 のため、全画像を推論し直します")
+        cached = None
+    cached_rows: Dict[str, int] = {}
+    if cached is not None:
+        # 画像の更新時刻・サイズが変わっていれば再推論
+        current = dict(keys)
+        for row, (name, stat) in enumerate(zip(cached["images"], cached["stats"])):
+            name = str(name)
+            if current.get(name) == tuple(int(v) for v in stat):
+                cached_rows[name] = row
+
+    missing = [i for i, (name, _) in enumerate(keys) if name not in cached_rows]
+
+    tags = [str(tag) for tag in cached["tags"]] if cached is not None else []
+    new_scores: Dict[int, np.ndarray] = {}
+
+    if missing:
+        # onnxruntime などの読み込みは推論が必要な場合のみ
+        from auto_caption import get_tagger
+
+        tagger = get_tagger(use_coreml=use_coreml)
+        if tags != tagger.tags:
+            # モデルのタグリストが変わった場合は全画像を推論し直す
+            tags = tagger.tags
+            cached_rows = {}
+            missing = list(range(len(image_files)))
+
+        print(f"推論する画像: {len(missing)}個（保存済み: {len(cached_rows)}個）")
+        for start in range(0, len(missing), batch_size):
+            batch_indices = []
+            arrays = []
+            for i in missing[start:start + batch_size]:
+                try:
+                    with open_image(image_files[i]) as img:
+                        arrays.append(tagger._preprocess_image(img.convert('RGB')))
+                    batch_indices.append(i)
+                except Exception as e:
+                    print(f"✗ {image_files[i].name}: エラー - {e}")
+            if not arrays:
+                continue
+            for i, probabilities in zip(batch_indices, tagger.predict_probabilities(arrays)):
+                new_scores[i] = probabilities
+            print(f"  {min(start + batch_size, len(missing))}/{len(missing)}")
+
+    # 入力の画像順に並べ直す（読み込めなかった画像は除外）
+    images = []
+    stats = []
+    rows = []
+    for i, (name, stat) in enumerate(keys):
+        if name in cached_rows:
+            rows.append(cached["scores"][cached_rows[name]])
+        elif i in new_scores:
+            rows.append(new_scores[i])
+        else:
+            continue
+        images.append(name)
+        stats.append(stat)
+
+    scores = np.array(rows, dtype=np.float32).reshape(len(rows), len(tags))
+
+    cached_images = [str(name) for name in cached["images"]] if cached is not None else None
+    if new_scores or images != cached_images:
+        save_score_matrix(matrix_path, images, stats, tags, scores)
+        print(f"✓ スコア行列を保存しました: {matrix_path}")
+
+    return images, tags, scores
+
+
+def parse_thresholds(text: str) -> np.ndarray:
+    """
+    しきい値の指定を解釈
+
+    Args:
+        text: カンマ区切り（"0.3,0.35,0.4"）または 開始:終了:刻み（"0.2:0.6:0.05"、終了を含む）
+
+    Returns:
+        昇順に並べたしきい値の配列
+    """
+    if ':' in text:
+        start, stop, step = (float(v) for v in text.split(':'))
+        values = np.arange(start, stop + step / 2, step)
+    else:
+        values = np.array([float(v) for v in text.split(',') if v.strip()])
+    if values.size == 0 or np.any((values <= 0) | (values >= 1)):
+        raise ValueError(f"しきい値は0より大きく1未満で指定してください: {text}")
+    return np.unique(np.round(values, 4))
+
+
+def sweep_thresholds(scores: np.ndarray, thresholds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    全しきい値について、画像ごとのタグ数とタグごとの出現画像数を計算
+
+    各スコアが「いくつのしきい値以上か」を一度だけ求めて個数を数え、
+    しきい値ごとに比較し直さずに全しきい値分の結果を得る。
+
+    Args:
+        scores: (画像数, タグ数) のスコア配列
+        thresholds: 昇順のしきい値配列（K個）
+
+    Returns:
+        ((画像数, K) の画像ごとのタグ数, (K, タグ数) のタグごとの出現画像数) のタプル
+    """
+    n_images, n_tags = scores.shape
+    levels = len(thresholds) + 1
+    per_image = np.zeros((n_images, levels), dtype=np.int64)
+    per_tag = np.zeros((levels, n_tags), dtype=np.int64)
+    limits = thresholds.astype(np.float32)
+
+    for start in range(0, n_images, SWEEP_CHUNK_ROWS):
+        chunk = scores[start:start + SWEEP_CHUNK_ROWS].astype(np.float32)
+        rows = chunk.shape[0]
+        # level[i, j] = スコアがいくつのしきい値以上か（0〜K）
+        level = np.searchsorted(limits, chunk, side='right')
+
+        per_tag += np.bincount(
+            (level * n_tags + np.arange(n_tags)).ravel(),
+            minlength=levels * n_tags
+        ).reshape(levels, n_tags)
+        per_image[start:start + rows] = np.bincount(
+            (np.arange(rows)[:, None] * levels + level).ravel(),
+            minlength=rows * levels
+        ).reshape(rows, levels)
+
+    # しきい値 k 以上 = レベル k+1 以上の合計（後ろからの累積和）
+    per_tag = per_tag[::-1].cumsum(axis=0)[::-1][1:]
+    per_image = per_image[:, ::-1].cumsum(axis=1)[:, ::-1][:, 1:]
+    return per_image, per_tag
+
+
+def print_report(
+    tags: List[str],
+    thresholds: np.ndarray,
+    per_image: np.ndarray,
+    per_tag: np.ndarray,
+    min_df: int = 1,
+    top: int = 20
+) -> None:
+    """
+    スイープ結果を表示
+
+    Args:
+        tags: タグのリスト
+        thresholds: 昇順のしきい値配列
+        per_image: (画像数, K) の画像ごとのタグ数
+        per_tag: (K, タグ数) のタグごとの出現画像数
+        min_df: 語彙に含める最小出現画像数
+        top: 段階ごとに表示するタグの最大数
+    """
+    tag_names = np.array(tags)
+    in_vocab = per_tag >= min_df
+
+    print("画像あたりのタグ数:")
+    print(f"{'しきい値':>8} {'平均':>7} {'中央値':>6} {'最小':>5} {'10%':>5} {'90%':>5} {'最大':>5} "
+          f"{'タグ0個':>7} {'語彙数':>6}")
+    percentiles = np.percentile(per_image, [10, 50, 90], axis=0)
+    for k, threshold in enumerate(thresholds):
+        counts = per_image[:, k]
+        print(f"{threshold:>8.3f} {counts.mean():>7.1f} {percentiles[1, k]:>6.0f} {counts.min():>5} "
+              f"{percentiles[0, k]:>5.0f} {percentiles[2, k]:>5.0f} {counts.max():>5} "
+              f"{int((counts == 0).sum()):>7} {int(in_vocab[k].sum()):>6}")
+
+    print("-" * 50)
+    print(f"しきい値を上げると消えるタグ（出現画像数 {min_df} 未満になるタグ、下げると現れるタグ）:")
+    for k in range(len(thresholds) - 1):
+        vanished = np.flatnonzero(in_vocab[k] & ~in_vocab[k + 1])
+        # 出現画像数が多かった順
+        vanished = vanished[np.argsort(-per_tag[k, vanished], kind='stable')]
+        print(f"{thresholds[k]:.3f} → {thresholds[k + 1]:.3f}: {len(vanished)}個")
+        if len(vanished):
+            shown = ", ".join(f"{tag_names[j]}({per_tag[k, j]})" for j in vanished[:top])
+            more = f" ...他{len(vanished) - top}個" if len(vanished) > top else ""
+            print(f"  - {shown}{more}")
+
+        # 語彙には残るが、付く画像が大きく減るタグ
+        drop = per_tag[k] - per_tag[k + 1]
+        dropped = np.flatnonzero(in_vocab[k + 1] & (drop > 0))
+        dropped = dropped[np.argsort(-drop[dropped], kind='stable')][:min(top, 5)]
+        if len(dropped):
+            shown = ", ".join(f"{tag_names[j]}({per_tag[k, j]}→{per_tag[k + 1, j]})" for j in dropped)
+            print(f"  ↓ {shown}")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='しきい値ごとのタグ数・タグ頻度を分析（モデルの実行は1回のみ）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # デフォルトのしきい値（0.25〜0.50）で分析
+  python scripts/tag_stats.py --input projects/nasumiso_v1/2_processed
+
+  # 0.20〜0.60 を0.05刻みで分析
+  python scripts/tag_stats.py --input projects/nasumiso_v1/2_processed \\
+    --thresholds 0.2:0.6:0.05
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='入力ディレクトリまたはアーカイブ（.zip / .tar.gz など）のパス'
+    )
+
+    parser.add_argument(
+        '--scores',
+        type=str,
+        default=None,
+        help=f'スコア行列ファイルのパス（デフォルト: 入力ディレクトリの {SCORE_MATRIX_FILENAME}）'
+    )
+
+    parser.add_argument(
+        '--thresholds',
+        type=str,
+        default=DEFAULT_THRESHOLDS,
+        help=f'しきい値（カンマ区切り または 開始:終了:刻み、デフォルト: {DEFAULT_THRESHOLDS}）'
+    )
+
+    parser.add_argument(
+        '--min-df',
+        type=int,
+        default=1,
+        help='語彙に含める最小出現画像数（デフォルト: 1）'
+    )
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help='段階ごとに表示するタグの最大数（デフォルト: 20）'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=8,
+        help='1回の推論でまとめて処理する画像数（デフォルト: 8）'
+    )
+
+    parser.add_argument(
+        '--use-coreml',
+        action='store_true',
+        help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
+    )
+
+    parser.add_argument(
+        '--rescore',
+        action='store_true',
+        help='保存済みのスコアを使わず全画像を推論し直す'
+    )
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_path = Path(args.input)
+
+    # 入力の存在確認
+    if not input_path.exists():
+        print(f"エラー: 入力ディレクトリが存在しません: {input_path}", file=sys.stderr)
+        sys.exit(1)
+
+    if not is_valid_input(input_path):
+        print(f"エラー: 入力パスがディレクトリまたはアーカイブではありません: {input_path}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        thresholds = parse_thresholds(args.thresholds)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.scores:
+        matrix_path = Path(args.scores)
+    elif input_path.is_dir():
+        matrix_path = input_path / SCORE_MATRIX_FILENAME
+    else:
+        matrix_path = input_path.with_name(f"{input_path.name}.{SCORE_MATRIX_FILENAME}")
+
+    images, tags, scores = build_score_matrix(
+        input_path,
+        matrix_path,
+        batch_size=max(1, args.batch_size),
+        use_coreml=args.use_coreml,
+        rescore=args.rescore
+    )
+
+    if not images:
+        print(f"エラー: {input_path} に画像ファイルが見つかりません", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"画像数: {len(images)}, タグ数: {len(tags)}")
+    print("-" * 50)
+
+    per_image, per_tag = sweep_thresholds(scores, thresholds)
+    print_report(tags, thresholds, per_image, per_tag, min_df=max(1, args.min_df), top=args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WD14 Tagger の前処理済み入力のキャッシュ
+
+機能:
+- 前処理（縮小・正方形にパディング）済みの 448x448x3 の画像を uint8 のまま1つのファイルに追記して保存
+- 画像ファイルの内容のハッシュをキーにするため、ファイル名の変更やコピー（2_processed → 3_tagged）でも再利用
+- 読み込みはメモリマップ（コピーなし）で、float32 への変換は推論するバッチごとに行う（auto_caption.to_float_batch）
+- キャッシュにある画像はデコード・縮小・パディングを行わない
+- 保存先は config/.tensor_cache/（--clear で削除）
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+import numpy as np
+from PIL import Image
+
+from image_sources import ImageSource, content_hash
+from tag_io import atomic_write_text
+
+# ファイルのロック（Windows には fcntl がないため msvcrt を使う）
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# キャッシュの保存先
+TENSOR_CACHE_DIR = Path(__file__).resolve().parent.parent / "config" / ".tensor_cache"
+TENSORS_FILENAME = "tensors.u8"
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = ".lock"
+
+# 前処理の内容を変えたら上げる（古いキャッシュは使わない）
+PREPROCESS_VERSION = 1
+
+
+class TensorCache:
+    """
+    前処理済み画像のキャッシュ
+
+    - tensors.u8: (行数, H, W, C) の uint8 配列を追記していくファイル
+    - index.json: {ハッシュ: 行番号} と前処理の条件
+    複数のプロセスから同時に使う場合も、追記と索引の保存はロックして行う。
+    """
+
+    def __init__(
+        self,
+        preprocess: Callable[[Image.Image], np.ndarray],
+        image_size: int = 448,
+        cache_dir: Path = TENSOR_CACHE_DIR
+    ):
+        """
+        Args:
+            preprocess: RGBのPIL画像を (H, W, C) の uint8 配列にする関数（WD14Tagger._pad_image）
+            image_size: 前処理後の画像サイズ
+            cache_dir: キャッシュの保存先
+        """
+        self._preprocess = preprocess
+        self._shape = (image_size, image_size, 3)
+        self._row_bytes = image_size * image_size * 3
+        self._meta = {"image_size": image_size, "version": PREPROCESS_VERSION}
+        self.cache_dir = cache_dir
+        self.tensors_path = cache_dir / TENSORS_FILENAME
+        self.index_path = cache_dir / INDEX_FILENAME
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(cache_dir / LOCK_FILENAME, 'w')
+        self._index: Dict[str, int] = {}
+        self._new: Dict[str, int] = {}
+        self._rows: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+
+        with self._locked():
+            index = self._read_index()
+            if index is None:
+                # 前処理の条件が違う（または壊れている）キャッシュは作り直す
+                self.tensors_path.unlink(missing_ok=True)
+                atomic_write_text(self.index_path, json.dumps({**self._meta, "rows": {}}))
+                index = {}
+            self._index = index
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """キャッシュ全体のロック（他のプロセスと追記・索引の保存が重ならないように）"""
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            return
+
+        # Windows: ロックファイルの先頭1バイトをロック（LK_LOCK は10回試すと失敗するため取れるまで繰り返す）
+        fd = self._lock_file.fileno()
+        while True:
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                continue
+        try:
+            yield
+        finally:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def _read_index(self) -> Optional[Dict[str, int]]:
+        """索引を読み込む（前処理の条件が違う・壊れている場合は None）"""
+        try:
+            index = json.loads(self.index_path.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if any(index.get(key) != value for key, value in self._meta.items()):
+            return None
+        return index.get("rows", {})
+
+    def _row(self, row: int) -> np.ndarray:
+        """キャッシュの1行（メモリマップのビュー、コピーしない）"""
+        if self._rows is None or row >= len(self._rows):
+            # 追記されて行数が増えた場合はマップし直す
+            count = self.tensors_path.stat().st_size // self._row_bytes
+            self._rows = np.memmap(self.tensors_path, dtype=np.uint8, mode='r', shape=(count, *self._shape))
+        return self._rows[row]
+
+    def _append(self, key: str, array: np.ndarray) -> None:
+        """前処理済みの画像を追記（行番号はロック中のファイルサイズから決める）"""
+        data = np.ascontiguousarray(array, dtype=np.uint8).tobytes()
+        with self._locked():
+            with open(self.tensors_path, 'ab') as f:
+                size = f.seek(0, os.SEEK_END)
+                row = size // self._row_bytes
+                if size != row * self._row_bytes:
+                    # 書き込み途中で終了したプロセスが残した半端な行を切り詰め、行の境界から追記する
+                    f.truncate(row * self._row_bytes)
+                f.write(data)
+        self._index[key] = row
+        self._new[key] = row
+
+    def get(self, source: ImageSource, data: Optional[bytes] = None) -> np.ndarray:
+        """
+        前処理済みの画像を取得（キャッシュになければ前処理して追加）
+
+        Args:
+            source: 画像ファイルのパス、またはアーカイブ内の画像
+            data: 読み込み済みの内容（None の場合は source から読む）
+
+        Returns:
+            (H, W, C) の uint8 配列（キャッシュにある場合はメモリマップのビュー）
+        """
+        if data is None:
+            data = source.read_bytes()
+        key = content_hash(data)
+        row = self._index.get(key)
+        if row is not None:
+            self.hits += 1
+            return self._row(row)
+
+        with Image.open(io.BytesIO(data)) as img:
+            array = self._preprocess(img.convert("RGB"))
+        self._append(key, array)
+        self.misses += 1
+        return array
+
+    def close(self) -> None:
+        """追加した行を索引に保存（他のプロセスが追加した分と合わせる）"""
+        if self._new:
+            with self._locked():
+                index = self._read_index() or {}
+                index.update(self._new)
+                atomic_write_text(self.index_path, json.dumps({**self._meta, "rows": index}))
+            self._new = {}
+        self._rows = None
+        self._lock_file.close()
+
+    def __enter__(self) -> 'TensorCache':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='WD14 Tagger の前処理済み入力のキャッシュを確認・削除',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # キャッシュの件数とサイズを表示
+  python scripts/tensor_cache.py
+
+  # キャッシュを削除
+  python scripts/tensor_cache.py --clear
+        """
+    )
+
+    parser.add_argument(
+        '--clear',
+        action='store_true',
+        help='キャッシュを削除する'
+    )
+
+    args = parser.parse_args()
+
+    if not TENSOR_CACHE_DIR.exists():
+        print(f"キャッシュはありません: {TENSOR_CACHE_DIR}")
+        sys.exit(0)
+
+    if args.clear:
+        shutil.rmtree(TENSOR_CACHE_DIR)
+        print(f"✓ キャッシュを削除しました: {TENSOR_CACHE_DIR}")
+        sys.exit(0)
+
+    tensors_path = TENSOR_CACHE_DIR / TENSORS_FILENAME
+    size = tensors_path.stat().st_size if tensors_path.exists() else 0
+    try:
+        index = json.loads((TENSOR_CACHE_DIR / INDEX_FILENAME).read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        index = {}
+    print(f"キャッシュ: {TENSOR_CACHE_DIR}")
+    print(f"画像数: {len(index.get('rows', {}))}枚")
+    print(f"サイズ: {size / (1024 * 1024):.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学習用データセット（3_tagged）の検証スクリプト
+
+機能:
+- 画像とタグファイル(.txt)のペアを並列に検証（学習前に問題を見つける）
+- 画像はヘッダのみ読み込んでサイズを確認し、Image.verify() で壊れたファイル・途中で切れたファイルを検出
+  （画素のデコードは行わない）
+- タグファイルは1回だけ読み込み、空のファイル・UTF-8でないファイルを検出
+- タグファイルがない画像、画像がないタグファイル、残っている .txt.bak を検出
+- 結果をJSON（--report / --json）で出力し、エラーがあれば終了コード1
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from image_sources import IMAGE_EXTENSIONS
+from tag_io import atomic_write_text
+
+# 問題の種類: 重要度（error は終了コード1、warning は終了コード2）
+ISSUE_SEVERITY = {
+    'corrupt_image': 'error',
+    'unexpected_size': 'error',
+    'missing_caption': 'error',
+    'empty_caption': 'error',
+    'invalid_caption': 'error',
+    'stray_backup': 'error',
+    'orphan_caption': 'warning',
+}
+
+# 形式ごとのファイル末尾の終端マーカー（PNG: IENDチャンク, JPEG: EOI）
+END_MARKERS = {
+    'PNG': b'\x00\x00\x00\x00IEND\xaeB`\x82',
+    'JPEG': b'\xff\xd9',
+}
+
+# 1つのワーカーにまとめて渡す件数（プロセス間のやり取りを減らす）
+CHUNK_SIZE = 256
+
+
+def scan_dataset(input_dir: Path) -> Tuple[List[Tuple[str, Optional[str]]], List[str], List[str]]:
+    """
+    ディレクトリを1回走査して画像とタグファイルを対応付ける
+
+    Args:
+        input_dir: 3_tagged ディレクトリ
+
+    Returns:
+        ([(画像名, タグファイル名 or None)], [画像がないタグファイル名], [.txt.bak ファイル名]) のタプル
+    """
+    images = []
+    captions = set()
+    backups = []
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            name = entry.name
+            if name.endswith('.txt.bak'):
+                backups.append(name)
+            elif name.endswith('.txt') and not name.endswith('_jp.txt'):
+                captions.add(name)
+            elif os.path.splitext(name)[1] in IMAGE_EXTENSIONS:
+                images.append(name)
+
+    pairs = []
+    for name in sorted(images):
+        caption = os.path.splitext(name)[0] + '.txt'
+        pairs.append((name, caption if caption in captions else None))
+        captions.discard(caption)
+
+    return pairs, sorted(captions), sorted(backups)
+
+
+def has_end_marker(path: str, img_format: str) -> bool:
+    """
+    ファイルの末尾に終端マーカーがあるか（途中で切れていないか）を確認
+
+    Args:
+        path: 画像ファイルのパス
+        img_format: PILの画像形式（'PNG' / 'JPEG'）
+
+    Returns:
+        終端マーカーがある（または確認できない形式の）場合は True
+    """
+    marker = END_MARKERS.get(img_format)
+    if marker is None:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < len(marker):
+            return False
+        f.seek(-len(marker), os.SEEK_END)
+        return f.read(len(marker)) == marker
+
+
+def check_image(path: str, expected_size: Optional[Tuple[int, int]], verify: bool = True) -> List[Tuple[str, str]]:
+    """
+    画像を検証（ヘッダのみ読み込み、画素はデコードしない）
+
+    Args:
+        path: 画像ファイルのパス
+        expected_size: 期待する (幅, 高さ)（None の場合はサイズを確認しない）
+        verify: Image.verify() で全体を確認するか（False の場合はヘッダと終端マーカーのみ）
+
+    Returns:
+        (問題の種類, メッセージ) のリスト
+    """
+    try:
+        with Image.open(path) as img:
+            size = img.size
+            img_format = img.format
+            if verify:
+                # PNG はチャンクのCRCと終端（IEND）まで確認する
+                img.verify()
+        # JPEG の verify() は内容を確認しないため、終端マーカーで途中切れを検出
+        if (not verify or img_format == 'JPEG') and not has_end_marker(path, img_format):
+            return [('corrupt_image', '終端マーカーがありません（途中で切れています）')]
+    except Exception as e:
+        return [('corrupt_image', f"{type(e).__name__}: {e}")]
+
+    if expected_size is not None and size != expected_size:
+        return [('unexpected_size', f"{size[0]}x{size[1]}（期待: {expected_size[0]}x{expected_size[1]}）")]
+    return []
+
+
+def check_caption(path: str) -> List[Tuple[str, str]]:
+    """
+    タグファイルを検証（1回だけ読み込む）
+
+    Args:
+        path: タグファイルのパス
+
+    Returns:
+        (問題の種類, メッセージ) のリスト
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return [('invalid_caption', str(e))]
+
+    try:
+        content = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return [('invalid_caption', f"UTF-8ではありません: {e}")]
+
+    tags = [tag for tag in (t.strip() for t in content.split(',')) if tag]
+    if not tags:
+        return [('empty_caption', 'タグがありません')]
+    return []
+
+
+def check_pair(item: Tuple[str, str, Optional[str], Optional[Tuple[int, int]], bool]) -> List[Dict[str, str]]:
+    """
+    画像とタグファイルのペアを検証（ワーカープロセスで実行）
+
+    Args:
+        item: (ディレクトリ, 画像名, タグファイル名 or None, 期待するサイズ, verify) のタプル
+
+    Returns:
+        問題のリスト（{"file", "code", "message"}）
+    """
+    directory, image_name, caption_name, expected_size, verify = item
+    issues = [
+        {"file": image_name, "code": code, "message": message}
+        for code, message in check_image(os.path.join(directory, image_name), expected_size, verify)
+    ]
+    if caption_name is None:
+        issues.append({"file": image_name, "code": 'missing_caption', "message": 'タグファイル(.txt)がありません'})
+    else:
+        issues.extend(
+            {"file": caption_name, "code": code, "message": message}
+            for code, message in check_caption(os.path.join(directory, caption_name))
+        )
+    return issues
+
+
+def validate_dataset(
+    input_dir: Path,
+    expected_size: Optional[Tuple[int, int]],
+    workers: int,
+    verify: bool = True
+) -> Dict:
+    """
+    データセットを検証
+
+    Args:
+        input_dir: 3_tagged ディレクトリ
+        expected_size: 期待する画像の (幅, 高さ)（None の場合はサイズを確認しない）
+        workers: 並列に検証するプロセス数
+        verify: Image.verify() で画像全体を確認するか（False の場合はヘッダと終端マーカーのみ）
+
+    Returns:
+        レポートの辞書（{"input", "images", "captions", "errors", "warnings", "issues"}）
+    """
+    pairs, orphans, backups = scan_dataset(input_dir)
+
+    issues: List[Dict[str, str]] = []
+    items = [
+        (str(input_dir), image_name, caption_name, expected_size, verify)
+        for image_name, caption_name in pairs
+    ]
+    if items:
+        # 画像の検証はCPUを使うため、スレッドではなくプロセスで並列化
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+            for pair_issues in executor.map(check_pair, items, chunksize=CHUNK_SIZE):
+                issues.extend(pair_issues)
+
+    issues.extend({"file": name, "code": 'orphan_caption', "message": '対応する画像がありません'} for name in orphans)
+    issues.extend({"file": name, "code": 'stray_backup', "message": 'バックアップファイルが残っています'} for name in backups)
+
+    for issue in issues:
+        issue["severity"] = ISSUE_SEVERITY[issue["code"]]
+    issues.sort(key=lambda issue: (issue["file"], issue["code"]))
+
+    return {
+        "input": str(input_dir),
+        "expected_size": list(expected_size) if expected_size else None,
+        "images": len(pairs),
+        "captions": sum(1 for _, caption in pairs if caption) + len(orphans),
+        "errors": sum(1 for issue in issues if issue["severity"] == 'error'),
+        "warnings": sum(1 for issue in issues if issue["severity"] == 'warning'),
+        "issues": issues,
+    }
+
+
+def print_report(report: Dict, limit: int) -> None:
+    """
+    レポートを表示
+
+    Args:
+        report: validate_dataset() の結果
+        limit: 種類ごとに表示するファイル数の上限
+    """
+    by_code: Dict[str, List[Dict[str, str]]] = {}
+    for issue in report["issues"]:
+        by_code.setdefault(issue["code"], []).append(issue)
+
+    for code, issues in sorted(by_code.items()):
+        mark = '✗' if ISSUE_SEVERITY[code] == 'error' else '!'
+        print(f"{mark} {code}: {len(issues)}件")
+        for issue in issues[:limit]:
+            print(f"  {issue['file']}: {issue['message']}")
+        if len(issues) > limit:
+            print(f"  ...他 {len(issues) - limit}件")
+
+    print("-" * 50)
+    print(f"完了: 画像 {report['images']}枚, タグファイル {report['captions']}件, "
+          f"エラー {report['errors']}件, 警告 {report['warnings']}件")
+
+
+def parse_size(value: str) -> Optional[Tuple[int, int]]:
+    """'512' / '512x768' / 'any' を (幅, 高さ) に変換（'any' は None）"""
+    if value == 'any':
+        return None
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height or width)
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='学習用データセット（画像とタグファイルのペア）を検証',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  python scripts/validate_dataset.py --input projects/nasumiso_v1/3_tagged
+
+  # レポートをJSONファイルに保存（サイズは確認しない）
+  python scripts/validate_dataset.py --input projects/nasumiso_v1/3_tagged \\
+    --size any --report validation.json
+
+終了コード:
+  0: 問題なし / 1: エラーあり / 2: 警告のみ
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='検証するディレクトリのパス（3_tagged）'
+    )
+
+    parser.add_argument(
+        '--size',
+        type=str,
+        default='512',
+        help="期待する画像サイズ（'512' / '512x768'、'any' で確認しない、デフォルト: 512）"
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='並列に検証するプロセス数（デフォルト: CPU数）'
+    )
+
+    parser.add_argument(
+        '--quick',
+        action='store_true',
+        help='画像全体の確認（CRCなど）を省き、ヘッダと終端マーカーのみ確認する'
+    )
+
+    parser.add_argument(
+        '--report',
+        type=str,
+        default=None,
+        help='レポート（JSON）の保存先'
+    )
+
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='レポート（JSON）を標準出力に出力する（表示の代わりに）'
+    )
+
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='種類ごとに表示するファイル数の上限（デフォルト: 20）'
+    )
+
+    args = parser.parse_args()
+
+    input_dir = Path(args.input)
+    if not input_dir.is_dir():
+        print(f"エラー: 入力ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        expected_size = parse_size(args.size)
+    except ValueError:
+        print(f"エラー: サイズの指定が正しくありません: {args.size}", file=sys.stderr)
+        sys.exit(1)
+
+    report = validate_dataset(input_dir, expected_size, args.workers, verify=not args.quick)
+
+    if args.report:
+        atomic_write_text(Path(args.report), json.dumps(report, ensure_ascii=False, indent=1))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+    else:
+        print_report(report, args.limit)
+        if args.report:
+            print(f"レポート: {args.report}")
+
+    # 結果に応じて終了コードを設定
+    if report["errors"] > 0:
+        sys.exit(1)
+    elif report["warnings"] > 0:
+        sys.exit(2)
+    else:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
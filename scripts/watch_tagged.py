@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグディレクトリの監視スクリプト
+
+機能:
+- 3_tagged/ を監視し、タグファイル(.txt)や画像の追加・変更に反応
+- 変更された .txt に対応する _jp.txt だけを再生成
+- .txt のない新しい画像は、起動中に読み込んだままの WD14Tagger でタグ付け（--tag-new-images）
+- タグ検索インデックス（tag_index.py）があれば差分更新
+- 短時間に続けて起きた変更はまとめて処理（デバウンス）
+- watchdog（Linux: inotify / Mac: FSEvents / Windows）があれば使用し、
+  なければ定期的な走査（ポーリング）で変更を検出
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from generate_jp_tags import DEFAULT_DICT_PATH, jp_path_for, load_translations, update_jp_files
+from tag_index import INDEX_FILENAME, open_index, update_index
+from tag_io import atomic_write_text
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+# サポートする画像形式
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
+
+
+def is_watched(path: Path) -> bool:
+    """監視対象のファイルか（英語タグファイルまたは画像。隠しファイル・_jp.txtは除外）"""
+    name = path.name
+    if name.startswith('.'):
+        return False
+    if path.suffix == '.txt':
+        return not name.endswith('_jp.txt')
+    return path.suffix in IMAGE_EXTENSIONS
+
+
+class PendingChanges:
+    """変更されたパスを溜め、一定時間変更が止まったらまとめて取り出す"""
+
+    def __init__(self):
+        self._paths: Set[Path] = set()
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, path: Path) -> None:
+        if not is_watched(path):
+            return
+        with self._lock:
+            self._paths.add(path)
+            self._last_event = time.monotonic()
+
+    def take_if_quiet(self, debounce: float) -> List[Path]:
+        """
+        最後の変更から debounce 秒経っていれば溜まった変更を取り出す
+
+        Args:
+            debounce: 待ち時間（秒）
+
+        Returns:
+            変更されたパスのリスト（まだ待つ場合は空）
+        """
+        with self._lock:
+            if not self._paths or time.monotonic() - self._last_event < debounce:
+                return []
+            paths = sorted(self._paths)
+            self._paths.clear()
+            return paths
+
+
+class ChangeHandler(FileSystemEventHandler):
+    """watchdog のイベントを PendingChanges に渡すハンドラ"""
+
+    def __init__(self, pending: PendingChanges):
+        super().__init__()
+        self.pending = pending
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        self.pending.add(Path(event.src_path))
+        # アトミック書き込み（一時ファイル→リネーム）はリネーム先で検出
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.pending.add(Path(dest_path))
+
+
+def scan_snapshot(input_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """
+    ポーリング用: 監視対象ファイルの更新時刻とサイズを取得
+
+    Args:
+        input_dir: 監視するディレクトリ
+
+    Returns:
+        {ファイル名: (更新時刻ns, サイズ)} の辞書
+    """
+    snapshot = {}
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and is_watched(Path(entry.name)):
+                st = entry.stat()
+                snapshot[entry.name] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+class CaptionWorker:
+    """新しい画像をタグ付けする（モデルは初回だけ読み込み、以降は使い回す）"""
+
+    def __init__(self, threshold: float, use_coreml: bool, batch_size: int = 8):
+        self.threshold = threshold
+        self.use_coreml = use_coreml
+        self.batch_size = batch_size
+
+    def _get_tagger(self):
+        # onnxruntime などの読み込みは、実際にタグ付けが必要になるまで遅らせる
+        from auto_caption import get_tagger
+        return get_tagger(threshold=self.threshold, use_coreml=self.use_coreml)
+
+    def caption(self, image_paths: List[Path]) -> List[Path]:
+        """
+        画像をバッチ推論でタグ付けし、.txt を書き出す
+
+        Args:
+            image_paths: タグ付けする画像のパス
+
+        Returns:
+            書き出した .txt のパスリスト
+        """
+        from image_sources import open_image
+
+        tagger = self._get_tagger()
+        written = []
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = []
+            for image_path in image_paths[start:start + self.batch_size]:
+                try:
+                    with open_image(image_path) as img:
+                        batch.append((image_path, tagger._preprocess_image(img.convert('RGB'))))
+                except Exception as e:
+                    print(f"✗ {image_path.name}: 読み込みエラー - {e}")
+            if not batch:
+                continue
+
+            results = tagger.predict_arrays([array for _, array in batch])
+            for (image_path, _), tag_scores in zip(batch, results):
+                txt_path = image_path.with_suffix('.txt')
+                atomic_write_text(txt_path, ", ".join(tag_scores.keys()))
+                print(f"✓ {image_path.name}: タグ付けしました（タグ数: {len(tag_scores)}）")
+                written.append(txt_path)
+        return written
+
+
+def process_changes(
+    input_dir: Path,
+    paths: List[Path],
+    translations: Dict[str, str],
+    version: str,
+    caption_worker: Optional[CaptionWorker]
+) -> None:
+    """
+    溜まった変更をまとめて処理
+
+    Args:
+        input_dir: 監視しているディレクトリ
+        paths: 変更されたパス
+        translations: 翻訳辞書
+        version: 翻訳辞書のバージョン
+        caption_worker: 新しい画像のタグ付け（None の場合はタグ付けしない）
+    """
+    txt_files = {p for p in paths if p.suffix == '.txt' and p.exists()}
+
+    # .txt が削除された場合は対応する _jp.txt も削除
+    for p in paths:
+        if p.suffix == '.txt' and not p.exists():
+            jp_path = jp_path_for(p)
+            if jp_path.exists():
+                jp_path.unlink()
+                print(f"- {p.name}: 削除されたため {jp_path.name} を削除しました")
+
+    # .txt のない新しい画像をタグ付け
+    if caption_worker is not None:
+        new_images = [
+            p for p in paths
+            if p.suffix in IMAGE_EXTENSIONS and p.exists() and not p.with_suffix('.txt').exists()
+        ]
+        if new_images:
+            txt_files.update(caption_worker.caption(new_images))
+
+    # 変更された .txt の日本語版を再生成
+    if txt_files:
+        generated, _, errors = update_jp_files(
+            input_dir, translations, version, txt_files=sorted(txt_files)
+        )
+        for txt_file in generated:
+            print(f"✓ {txt_file.name} → {jp_path_for(txt_file).name}")
+        for txt_file, e in errors:
+            print(f"✗ {txt_file.name}: エラー - {e}")
+
+    # タグ検索インデックスがあれば差分更新
+    index_path = input_dir / INDEX_FILENAME
+    if index_path.exists():
+        conn = open_index(index_path)
+        try:
+            updated, removed, _ = update_index(conn, input_dir)
+        finally:
+            conn.close()
+        if updated or removed:
+            print(f"✓ タグ検索インデックス: {updated}個更新, {removed}個削除")
+
+
+def watch(
+    input_dir: Path,
+    dict_path: Path,
+    caption_worker: Optional[CaptionWorker],
+    use_polling: bool = False,
+    interval: float = 2.0,
+    debounce: float = 1.0
+) -> None:
+    """
+    ディレクトリを監視し続ける（Ctrl+C で終了）
+
+    Args:
+        input_dir: 監視するディレクトリ
+        dict_path: 翻訳辞書CSVのパス
+        caption_worker: 新しい画像のタグ付け（None の場合はタグ付けしない）
+        use_polling: watchdog があってもポーリングを使うか
+        interval: ポーリング間隔（秒）
+        debounce: 最後の変更から処理開始までの待ち時間（秒）
+    """
+    translations, version = load_translations(dict_path)
+    dict_mtime = dict_path.stat().st_mtime_ns
+
+    pending = PendingChanges()
+    observer = None
+    snapshot: Dict[str, Tuple[int, int]] = {}
+
+    if Observer is not None and not use_polling:
+        observer = Observer()
+        observer.schedule(ChangeHandler(pending), str(input_dir), recursive=False)
+        observer.start()
+        print("監視方式: watchdog（ファイルシステムの通知）")
+        tick = min(0.2, debounce)
+    else:
+        snapshot = scan_snapshot(input_dir)
+        if Observer is None and not use_polling:
+            print("ℹ watchdog がインストールされていないため、ポーリングで監視します")
+        print(f"監視方式: ポーリング（{interval}秒ごと）")
+        tick = interval
+
+    # 起動前の変更も反映しておく（変更がなければ何もしない）
+    generated, _, _ = update_jp_files(input_dir, translations, version)
+    if generated:
+        print(f"✓ 起動時に {len(generated)}個の日本語タグファイルを更新しました")
+
+    print(f"監視中: {input_dir}（Ctrl+C で終了）")
+    print("-" * 50)
+
+    try:
+        while True:
+            time.sleep(tick)
+
+            if observer is None:
+                current = scan_snapshot(input_dir)
+                for name in current.keys() | snapshot.keys():
+                    if current.get(name) != snapshot.get(name):
+                        pending.add(input_dir / name)
+                snapshot = current
+
+            # 翻訳辞書が更新されたら読み直して全ファイルを更新
+            mtime = dict_path.stat().st_mtime_ns
+            if mtime != dict_mtime:
+                dict_mtime = mtime
+                translations, version = load_translations(dict_path)
+                generated, _, _ = update_jp_files(input_dir, translations, version)
+                print(f"✓ 翻訳辞書の更新を反映しました（{len(generated)}個を再生成）")
+
+            paths = pending.take_if_quiet(debounce)
+            if paths:
+                print(f"[{time.strftime('%H:%M:%S')}] {len(paths)}個のファイルの変更を検出")
+                try:
+                    process_changes(input_dir, paths, translations, version, caption_worker)
+                except Exception as e:
+                    print(f"✗ 変更の処理中にエラーが発生しました: {e}")
+    except KeyboardInterrupt:
+        print("\n監視を終了します")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(
+        description='タグディレクトリを監視し、派生ファイルとインデックスを自動更新',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # タグを手で編集したら _jp.txt を自動で更新
+  python scripts/watch_tagged.py --input projects/nasumiso_v1/3_tagged
+
+  # 追加した画像も自動でタグ付け
+  python scripts/watch_tagged.py --input projects/nasumiso_v1/3_tagged \\
+    --tag-new-images --threshold 0.35
+        """
+    )
+
+    parser.add_argument(
+        '--input',
+        type=str,
+        required=True,
+        help='監視するディレクトリのパス（3_tagged）'
+    )
+
+    parser.add_argument(
+        '--dict',
+        type=str,
+        default=str(DEFAULT_DICT_PATH),
+        help='翻訳辞書CSVのパス（デフォルト: config/tag_translations.csv）'
+    )
+
+    parser.add_argument(
+        '--tag-new-images',
+        action='store_true',
+        help='.txt のない新しい画像を WD14 Tagger でタグ付けする'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.35,
+        help='タグの信頼度しきい値（デフォルト: 0.35）'
+    )
+
+    parser.add_argument(
+        '--use-coreml',
+        action='store_true',
+        help='CoreML高速化を有効にする（Mac Apple Silicon用、デフォルト: 無効）'
+    )
+
+    parser.add_argument(
+        '--polling',
+        action='store_true',
+        help='watchdog を使わず、ポーリングで監視する'
+    )
+
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=2.0,
+        help='ポーリング間隔（秒、デフォルト: 2.0）'
+    )
+
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=1.0,
+        help='最後の変更から処理を始めるまでの待ち時間（秒、デフォルト: 1.0）'
+    )
+
+    args = parser.parse_args()
+
+    # パスをPathオブジェクトに変換
+    input_dir = Path(args.input)
+    dict_path = Path(args.dict)
+
+    # ディレクトリの存在確認
+    if not input_dir.exists():
+        print(f"エラー: ディレクトリが存在しません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not input_dir.is_dir():
+        print(f"エラー: パスがディレクトリではありません: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if not dict_path.is_file():
+        print(f"エラー: 翻訳辞書が見つかりません: {dict_path}", file=sys.stderr)
+        sys.exit(1)
+
+    caption_worker = None
+    if args.tag_new_images:
+        caption_worker = CaptionWorker(args.threshold, args.use_coreml)
+
+    watch(
+        input_dir,
+        dict_path,
+        caption_worker,
+        use_polling=args.polling,
+        interval=args.interval,
+        debounce=args.debounce
+    )
+
+
+if __name__ == '__main__':
+    main()